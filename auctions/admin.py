@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import User, Listing, Bid, Comment, UsersWatchlist
+from .models import User, Listing, Bid, Category, CategoryStats, Comment, Notification, Task, UserDashboard, UsersWatchlist
 
 # Register your models here.
 
@@ -9,4 +9,9 @@ admin.site.register(User)
 admin.site.register(Listing)
 admin.site.register(Bid)
 admin.site.register(Comment)
-admin.site.register(UsersWatchlist)
\ No newline at end of file
+admin.site.register(UsersWatchlist)
+admin.site.register(Category)
+admin.site.register(Task)
+admin.site.register(Notification)
+admin.site.register(UserDashboard)
+admin.site.register(CategoryStats)
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+    Price analytics per category (CategoryStats).
+
+    refresh_category_stats() computes the stats of closed auctions with one
+    GROUP BY query: number of closed and sold auctions, average final price,
+    bids per auction and the average time from publication to the first bid.
+
+    A refresh only recomputes the categories that have a listing updated since
+    the previous refresh started (Listing.updated_at follows every bid,
+    closing and reopening, and is indexed per category), or every category
+    with full=True, which also catches deleted listings. The stats are cached
+    until the next refresh. Like close_expired_auctions, the
+    refresh_category_stats command is meant to run every few minutes.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Bid, CategoryStats, Listing
+
+
+STATS_KEY = "auctions:category_stats"
+STATS_TIMEOUT = 60 * 60
+
+
+def aggregate(categories=None):
+    """{category key: stats} of the closed auctions, of all categories or of `categories`"""
+    # publication to first bid of each listing
+    first_bid_delay = (
+        Bid.objects.filter(listing=OuterRef("pk")).order_by("bid_date")
+        .annotate(delay=ExpressionWrapper(F("bid_date") - OuterRef("publication_date"), DurationField()))
+        .values("delay")[:1]
+    )
+    listings = Listing.objects.filter(closed=True)
+    if categories is not None:
+        listings = listings.filter(listing_category__in=categories)
+    rows = (
+        listings
+        .annotate(first_bid_delay=Subquery(first_bid_delay, output_field=DurationField()))
+        .order_by()
+        .values("listing_category")
+        .annotate(
+            closed_auctions=Count("pk"),
+            sold_auctions=Count("pk", filter=Q(winner__isnull=False)),
+            average_final_price=Avg("highest_bid", filter=Q(winner__isnull=False)),
+            bids_per_auction=Avg("bid_count"),
+            time_to_first_bid=Avg("first_bid_delay"),
+        )
+    )
+    return {row.pop("listing_category"): row for row in rows}
+
+
+def changed_categories(since):
+    return set(
+        Listing.objects.filter(updated_at__gte=since)
+        .order_by().values_list("listing_category", flat=True).distinct()
+    )
+
+
+def refresh_category_stats(full=False):
+    """Recomputes the stats of the categories that changed (all with `full`), returns how many"""
+    started = timezone.now()
+    since = None if full else CategoryStats.objects.aggregate(since=Max("refreshed_at"))["since"]
+    categories = None if since is None else changed_categories(since)
+    if categories == set():
+        return 0
+
+    stats = aggregate(categories)
+    with transaction.atomic():
+        # categories without closed auctions left have no stats
+        stale = CategoryStats.objects.exclude(category__in=stats)
+        if categories is not None:
+            stale = stale.filter(category__in=categories)
+        stale.delete()
+        for category, values in stats.items():
+            CategoryStats.objects.update_or_create(category=category, defaults={**values, "refreshed_at": started})
+        transaction.on_commit(lambda: cache.delete(STATS_KEY))
+    return len(categories) if categories is not None else len(stats)
+
+
+def category_stats():
+    """{category key: CategoryStats}, cached until the next refresh"""
+    stats = cache.get(STATS_KEY)
+    if stats is None:
+        stats = {row.category: row for row in CategoryStats.objects.all()}
+        cache.set(STATS_KEY, stats, STATS_TIMEOUT)
+    return stats
@@ -0,0 +1,350 @@
+"""
+    JSON API, version 1 (/api/v1/...).
+
+    GET  listings/                   feed of open listings (?closed=1 for closed, ?category=<slug>)
+    GET  listings/<id>/              one listing with its bid summary
+    GET  listings/<id>/bids/         bid history, newest first
+    POST listings/<id>/bids/         {"amount": "12.50"}
+    GET  listings/<id>/comments/     newest first
+    POST listings/<id>/comments/     {"comment": "..."}
+    GET  watchlist/                  the user's watched listings
+    PUT  watchlist/<id>/             watch a listing
+    DELETE watchlist/<id>/           stop watching it
+    GET  categories/stats/           price analytics of each category's closed auctions
+
+    Listing responses only contain the fields asked for with ?fields=a,b,c
+    and only those columns are read from the database. Feeds are cursor
+    paginated like the HTML pages, "next" is the URL of the next page.
+    GET responses carry an ETag computed like the HTML pages' (auctions.caching)
+    from updated_at columns and version counters, before anything is read or
+    serialized, and answer a matching If-None-Match with a 304 right away.
+
+    Users are authenticated with the session of the HTML site, so writes need
+    the CSRF token (X-CSRFToken header) like the site's forms.
+"""
+import json
+from functools import wraps
+
+from django.core.exceptions import SuspiciousOperation
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import analytics
+from .bidding import AuctionNotFound, BidRejected, place_bid
+from .caching import category_stats_etag, feed_etag, listing_etag, watchlist_etag
+from .categories import registry
+from .models import Bid, Comment, Listing, UsersWatchlist
+from .pagination import paginate_feed
+from .views import CommentForm
+
+
+# API field name: lookup that reads it
+LISTING_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "current_price": "current_price",
+    "category": "listing_category",
+    "image_url": "image_url",
+    "publication_date": "publication_date",
+    "end_time": "end_time",
+    "closed": "closed",
+    "seller": "seller__username",
+    "winner": "winner__username",
+    "bid_count": "bid_count",
+    "highest_bid": "highest_bid",
+    "highest_bidder": "highest_bidder__username",
+}
+
+FEED_FIELDS = [
+    "id", "title", "current_price", "category", "publication_date",
+    "end_time", "closed", "seller", "bid_count",
+]
+
+BID_FIELDS = {
+    "id": "id",
+    "amount": "bid_price",
+    "bid_date": "bid_date",
+    "bidder": "bidder__username",
+}
+
+COMMENT_FIELDS = {
+    "id": "id",
+    "comment": "comment",
+    "comment_date": "comment_date",
+    "commenter": "commenter__username",
+}
+
+
+class ApiError(Exception):
+    """Turned into a JSON error response with `status`"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def error_response(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def json_response(request, data, status=200):
+    response = JsonResponse(data, status=status)
+    if request.user.is_authenticated:
+        patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+def read_etag(etag_func):
+    """etag_func for condition() on views that also write, writes get no ETag"""
+    @wraps(etag_func)
+    def etag(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return None
+        return etag_func(request, *args, **kwargs)
+    return etag
+
+
+def api_view(*methods, login_required=False):
+    """Method check, authentication and JSON errors for an API view"""
+    allowed = set(methods) | ({"HEAD"} if "GET" in methods else set())
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in allowed:
+                response = error_response(f"Method {request.method} not allowed", 405)
+                response["Allow"] = ", ".join(sorted(allowed))
+                return response
+            if login_required and not request.user.is_authenticated:
+                return error_response("Authentication required", 401)
+            try:
+                return view(request, *args, **kwargs)
+            except Http404:
+                return error_response("Not found", 404)
+            except SuspiciousOperation as error:
+                return error_response(str(error), 400)
+            except ApiError as error:
+                return error_response(str(error), error.status)
+        return wrapper
+    return decorator
+
+
+def request_data(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        raise ApiError("Request body is not valid JSON")
+    if not isinstance(data, dict):
+        raise ApiError("Request body has to be a JSON object")
+    return data
+
+
+def selected_fields(request, default):
+    """Fields from ?fields=..., ApiError for unknown ones"""
+    if "fields" not in request.GET:
+        return default
+    fields = [field for field in request.GET["fields"].split(",") if field]
+    unknown = set(fields) - set(LISTING_FIELDS)
+    if unknown or not fields:
+        raise ApiError(f"Unknown fields {', '.join(sorted(unknown))}, choose from {', '.join(LISTING_FIELDS)}")
+    return fields
+
+
+def listing_rows(queryset, fields):
+    """queryset.values() of `fields`, plus what keyset pagination needs"""
+    return queryset.values(*{"id", "publication_date"} | {LISTING_FIELDS[field] for field in fields})
+
+
+def serialize_listing(row, fields):
+    data = {field: row[LISTING_FIELDS[field]] for field in fields}
+    if "category" in data:
+        category = registry.get_by_key(data["category"])
+        data["category"] = category.slug if category else data["category"]
+    return data
+
+
+def listing_feed(request, queryset):
+    fields = selected_fields(request, FEED_FIELDS)
+    page = paginate_feed(request, listing_rows(queryset, fields))
+    return json_response(request, {
+        "results": [serialize_listing(row, fields) for row in page],
+        "next": request.build_absolute_uri(page.next_url) if page.next_url else None,
+    })
+
+
+########################################################
+###########   LISTINGS   ###############################
+########################################################
+
+
+def listings_queryset(request):
+    queryset = Listing.objects.filter(closed=request.GET.get("closed") == "1")
+    if request.GET.get("category"):
+        category = registry.get_by_slug(request.GET["category"])
+        if category is None:
+            raise ApiError("Unknown category")
+        queryset = queryset.filter(listing_category=category.key)
+    return queryset
+
+
+@api_view("GET")
+@condition(etag_func=feed_etag(listings_queryset))
+def listings(request):
+    return listing_feed(request, listings_queryset(request))
+
+
+@api_view("GET")
+@condition(etag_func=listing_etag)
+def listing(request, listing_id):
+    fields = selected_fields(request, list(LISTING_FIELDS))
+    summary = ["bid_count", "highest_bid", "highest_bidder"]
+    rows = listing_rows(Listing.objects.filter(pk=listing_id), set(fields) | set(summary))
+    row = get_object_or_404(rows)
+
+    data = {
+        "listing": serialize_listing(row, fields),
+        "bids": {field: row[LISTING_FIELDS[field]] for field in summary},
+    }
+    if request.user.is_authenticated:
+        data["on_watchlist"] = UsersWatchlist.objects.filter(
+            watchlist_user=request.user, listing_in_watchlist_id=listing_id).exists()
+    return json_response(request, data)
+
+
+@api_view("GET", "POST")
+@condition(etag_func=read_etag(listing_etag))
+def bids(request, listing_id):
+    if request.method == "POST":
+        return add_bid(request, listing_id)
+
+    if not Listing.objects.filter(pk=listing_id).exists():
+        raise Http404
+    rows = Bid.objects.filter(listing_id=listing_id).values(*BID_FIELDS.values())
+    page = paginate_feed(request, rows, date_field="bid_date")
+    return json_response(request, {
+        "results": [{name: row[path] for name, path in BID_FIELDS.items()} for row in page],
+        "next": request.build_absolute_uri(page.next_url) if page.next_url else None,
+    })
+
+
+def add_bid(request, listing_id):
+    if not request.user.is_authenticated:
+        raise ApiError("Authentication required", 401)
+    data = request_data(request)
+    if "amount" not in data:
+        raise ApiError("amount is required")
+    try:
+        bid = place_bid(listing_id, request.user, data["amount"])
+    except AuctionNotFound:
+        raise Http404
+    except BidRejected as rejection:
+        raise ApiError(str(rejection))
+    return json_response(request, {
+        "bid": {"id": bid.id, "amount": bid.bid_price, "bidder": request.user.username},
+    }, status=201)
+
+
+@api_view("GET", "POST")
+@condition(etag_func=read_etag(listing_etag))
+def comments(request, listing_id):
+    if request.method == "POST":
+        return add_comment(request, listing_id)
+
+    if not Listing.objects.filter(pk=listing_id).exists():
+        raise Http404
+    rows = (
+        Comment.objects
+        .filter(comments_listing_id=listing_id)
+        .values(*COMMENT_FIELDS.values())
+    )
+    page = paginate_feed(request, rows, date_field="comment_date")
+    return json_response(request, {
+        "results": [{name: row[path] for name, path in COMMENT_FIELDS.items()} for row in page],
+        "next": request.build_absolute_uri(page.next_url) if page.next_url else None,
+    })
+
+
+def add_comment(request, listing_id):
+    if not request.user.is_authenticated:
+        raise ApiError("Authentication required", 401)
+    listing = get_object_or_404(Listing.objects.only("closed"), pk=listing_id)
+    if listing.closed:
+        raise ApiError("This auction has been closed")
+    form = CommentForm(request_data(request))
+    if not form.is_valid():
+        raise ApiError("comment is required")
+    comment = Comment.objects.create(
+        comments_listing=listing,
+        commenter=request.user,
+        comment=form.cleaned_data["comment"],
+    )
+    return json_response(request, {
+        "comment": {
+            "id": comment.id,
+            "comment": comment.comment,
+            "comment_date": comment.comment_date,
+            "commenter": request.user.username,
+        },
+    }, status=201)
+
+
+########################################################
+###########   WATCHLIST   ##############################
+########################################################
+
+
+@api_view("GET", login_required=True)
+@condition(etag_func=watchlist_etag)
+def watchlist(request):
+    return listing_feed(request, Listing.objects.filter(watchlist__watchlist_user=request.user))
+
+
+@api_view("PUT", "DELETE", login_required=True)
+def watchlist_item(request, listing_id):
+    if request.method == "DELETE":
+        UsersWatchlist.objects.filter(
+            watchlist_user=request.user,
+            listing_in_watchlist_id=listing_id,
+        ).delete()
+        return HttpResponse(status=204)
+
+    listing = get_object_or_404(Listing.objects.only("seller_id"), pk=listing_id)
+    if listing.seller_id == request.user.id:
+        raise ApiError("You cannot watch your own auction")
+    # the (user, listing) pair is unique, watching twice is a no-op
+    UsersWatchlist.objects.bulk_create(
+        [UsersWatchlist(watchlist_user=request.user, listing_in_watchlist=listing)],
+        ignore_conflicts=True,
+    )
+    return HttpResponse(status=204)
+
+
+########################################################
+###########   CATEGORIES   #############################
+########################################################
+
+
+@api_view("GET")
+@condition(etag_func=category_stats_etag)
+def category_stats(request):
+    stats = analytics.category_stats()
+    results = []
+    for category in registry.all():
+        row = stats.get(category.key)
+        if row is None:
+            continue
+        delay = row.time_to_first_bid
+        results.append({
+            "category": category.slug,
+            "label": category.label,
+            "closed_auctions": row.closed_auctions,
+            "sold_auctions": row.sold_auctions,
+            "average_final_price": row.average_final_price,
+            "bids_per_auction": row.bids_per_auction,
+            "time_to_first_bid": delay.total_seconds() if delay is not None else None,
+            "refreshed_at": row.refreshed_at,
+        })
+    return json_response(request, {"results": results})
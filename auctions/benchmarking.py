@@ -0,0 +1,260 @@
+"""
+    Load test of every URL in auctions/urls.py (benchmark_urls command).
+
+    Each endpoint is requested through the Django test client as a logged in
+    user, round after round, and reported with its p50/p95 latency, queries
+    per request and peak memory of one request. Writes (bids, comments,
+    watchlist changes) run inside a transaction that is rolled back at the
+    end, so a seeded database can be benchmarked again and again.
+
+    Results can be saved as a JSON baseline and later runs compared to it.
+
+    bid_throughput() (benchmark_bids command) places bids from many threads at
+    once, on listings and users of its own that it deletes again afterwards.
+"""
+import json
+import math
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from itertools import count
+
+from django.conf import settings
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from . import urls
+from .bidding import BidRejected, place_bid
+from .categories import registry
+from .models import Bid, Listing, Task, User
+
+
+class Endpoint:
+    """How to request one URL: `args` and `data` get the fixture and the round's number"""
+
+    def __init__(self, name, method="get", args=None, data=None, json_body=False, login=True):
+        self.name = name
+        self.method = method
+        self.args = args or (lambda fixture, number: [])
+        self.data = data or (lambda fixture, number: {})
+        self.json_body = json_body
+        self.login = login
+
+    def request(self, client, fixture, number):
+        url = reverse(f"auctions:{self.name}", args=self.args(fixture, number))
+        data = self.data(fixture, number)
+        if self.json_body:
+            return getattr(client, self.method)(url, json.dumps(data), content_type="application/json")
+        return getattr(client, self.method)(url, data)
+
+
+def _listing(fixture, number):
+    return [fixture["listing"]]
+
+
+def _own_listing(fixture, number):
+    return [fixture["own_listing"]]
+
+
+def _bid(fixture, number):
+    # always above the seeded prices, every bid is accepted
+    return {"bid_price": 1_000_000 + number}
+
+
+ENDPOINTS = [
+    Endpoint("index"),
+    Endpoint("categories"),
+    Endpoint("listings_in_category", args=lambda fixture, number: [fixture["category"]]),
+    Endpoint("search", data=lambda fixture, number: {"q": "wand"}),
+    Endpoint("login", login=False),
+    Endpoint("logout"),
+    Endpoint("register", login=False),
+    Endpoint("user_listings"),
+    Endpoint("user_panel_section", args=lambda fixture, number: ["bidding"]),
+    Endpoint("add_listing"),
+    Endpoint("import_listings"),
+    Endpoint("export_listings"),
+    Endpoint("export_bids", data=lambda fixture, number: {"format": "jsonl"}),
+    Endpoint("listing_page", args=_listing),
+    Endpoint("bid", "post", args=_listing, data=_bid),
+    Endpoint("comment", "post", args=_listing, data=lambda fixture, number: {"comment": "Benchmark"}),
+    Endpoint("listing_comments", args=_listing),
+    Endpoint("bid_history", args=_listing),
+    Endpoint("watch", "post", args=_listing),
+    Endpoint("unwatch", "post", args=_listing),
+    Endpoint("close", "post", args=_own_listing),
+    Endpoint("reopen", "post", args=_own_listing),
+    Endpoint("watchlist"),
+    Endpoint("notifications"),
+    Endpoint("mark_notifications_read", "post"),
+    Endpoint("api_listings"),
+    Endpoint("api_listing", args=_listing),
+    Endpoint("api_bids", "post", args=_listing, json_body=True,
+             data=lambda fixture, number: {"amount": 2_000_000 + number}),
+    Endpoint("api_comments", args=_listing),
+    Endpoint("api_watchlist"),
+    Endpoint("api_watchlist_item", "put", args=_listing),
+    Endpoint("api_category_stats"),
+]
+
+
+def uncovered_urls():
+    """Names of auctions URLs without an Endpoint, every URL has to be benchmarked"""
+    names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)}
+    return sorted(names - {endpoint.name for endpoint in ENDPOINTS})
+
+
+def _fixture():
+    user = User.objects.filter(listing__closed=False).order_by("pk").first()
+    listing = Listing.objects.filter(closed=False).exclude(seller=user).order_by("-pk").first()
+    if user is None or listing is None:
+        raise LookupError("The database needs users and open listings, run seed_data first")
+    return {
+        "user": user,
+        "listing": listing.pk,
+        "own_listing": Listing.objects.filter(seller=user, closed=False).values_list("pk", flat=True).first(),
+        "category": registry.get_by_key(listing.listing_category).slug,
+    }
+
+
+# latency changes below this are timer and scheduler noise on fast endpoints
+NOISE_MS = 5
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def run(rounds=20):
+    """{endpoint name: {"p50_ms", "p95_ms", "queries", "peak_kib"}}"""
+    # "localhost" is allowed while DEBUG is on and ALLOWED_HOSTS is empty
+    client = Client(SERVER_NAME=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else "localhost")
+    timings = {endpoint.name: [] for endpoint in ENDPOINTS}
+    queries = {endpoint.name: 0 for endpoint in ENDPOINTS}
+    peaks = {}
+
+    with transaction.atomic():
+        fixture = _fixture()
+        for number in range(rounds + 1):
+            for endpoint in ENDPOINTS:
+                if endpoint.login:
+                    client.force_login(fixture["user"])
+                else:
+                    client.logout()
+
+                if number == rounds:
+                    # one more round for memory, tracemalloc would skew the timings
+                    tracemalloc.start()
+                    endpoint.request(client, fixture, number)
+                    peaks[endpoint.name] = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    continue
+
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    response = endpoint.request(client, fixture, number)
+                    timings[endpoint.name].append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{endpoint.name} answered {response.status_code}")
+                queries[endpoint.name] += len(captured)
+        transaction.set_rollback(True)
+
+    return {
+        name: {
+            "p50_ms": round(statistics.median(times) * 1000, 2),
+            "p95_ms": round(percentile(times, 0.95) * 1000, 2),
+            "queries": round(queries[name] / rounds, 1),
+            "peak_kib": round(peaks[name] / 1024, 1),
+        }
+        for name, times in timings.items()
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Regressions against a baseline, as readable lines.
+
+    p95 latency may grow by `tolerance` and at least NOISE_MS (machines are noisy),
+    queries may not grow.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["p95_ms"] > max(before["p95_ms"] * (1 + tolerance), before["p95_ms"] + NOISE_MS):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if result["queries"] > before["queries"]:
+            regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+    return regressions
+
+
+########################################################
+###########   CONCURRENT WRITERS   ######################
+########################################################
+
+
+def bid_throughput(writers=8, bids=50, listings=4):
+    """Bids from `writers` threads at once on a few listings of their own.
+
+    Every writer places `bids` bids on random listings, amounts rise across
+    all writers, so a writer is outbid when a bigger bid commits first.
+    Returns {"seconds", "accepted", "outbid", "errors"}, errors are mostly
+    "database is locked" from writers that gave up waiting.
+    The users and listings are deleted afterwards, with the bids and the
+    notification tasks of the bids.
+    """
+    run = f"{time.time_ns():x}"
+    seller = User.objects.create_user(f"bench-seller-{run}")
+    bidders = [User.objects.create_user(f"bench-bidder-{run}-{i}") for i in range(writers)]
+    listing_ids = [
+        Listing.objects.create(seller=seller, title=f"Benchmark {i}", description="Benchmark", current_price=1).id
+        for i in range(listings)
+    ]
+    # the writers open connections of their own
+    connections.close_all()
+
+    amounts = count(2)
+    amounts_lock = threading.Lock()
+    start_line = threading.Barrier(writers)
+    results = {"accepted": 0, "outbid": 0, "errors": 0}
+    results_lock = threading.Lock()
+
+    def write(bidder):
+        outcome = {"accepted": 0, "outbid": 0, "errors": 0}
+        try:
+            start_line.wait()
+            for _ in range(bids):
+                with amounts_lock:
+                    amount = next(amounts)
+                try:
+                    place_bid(random.choice(listing_ids), bidder, amount)
+                    outcome["accepted"] += 1
+                except BidRejected:
+                    outcome["outbid"] += 1
+                except OperationalError:
+                    outcome["errors"] += 1
+        finally:
+            connections.close_all()
+            with results_lock:
+                for key, value in outcome.items():
+                    results[key] += value
+
+    threads = [threading.Thread(target=write, args=(bidder,)) for bidder in bidders]
+    start = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results["seconds"] = time.perf_counter() - start
+    finally:
+        bid_ids = Bid.objects.filter(listing_id__in=listing_ids).values_list("id", flat=True)
+        Task.objects.filter(key__in=[f"outbid:{bid_id}" for bid_id in bid_ids]).delete()
+        Listing.objects.filter(pk__in=listing_ids).delete()
+        User.objects.filter(pk__in=[seller.pk] + [bidder.pk for bidder in bidders]).delete()
+    return results
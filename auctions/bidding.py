@@ -0,0 +1,316 @@
+"""
+    Bid placement service.
+
+    A bid is accepted with a single conditional UPDATE on the listing row:
+    the price only moves if the listing is still open, the bidder is not the
+    seller and the new amount is higher than the current price. The database
+    serializes competing UPDATEs on the same row, so two bidders can never both
+    win the same price level and no read-then-write race is possible.
+
+    The same UPDATE maintains the denormalized bid status on Listing
+    (highest_bid, highest_bidder, bid_count), which is also what closing an
+    auction uses to pick the winner. Bids, closing and reopening also adjust
+    the users' panel totals (auctions.dashboard) in their transaction.
+
+    Accepted bids, closing and reopening are pushed to the listing's WebSocket
+    watchers (auctions.realtime) once their transaction has committed.
+    Notifying the bidders, watchers and sellers (auctions.notifications) is a
+    background task (auctions.tasks). place_bid(), close_auction() and each
+    batch of close_expired_auctions() enqueue it inside their own transaction,
+    so a write that rolls back notifies nobody.
+
+    Auctions with an end_time stop taking bids at that time and are closed by
+    close_expired_auctions(). A bid in the last settings.AUCTION_SNIPING_WINDOW
+    seconds pushes the end back to that many seconds after the bid, in the
+    same UPDATE that accepts it.
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import bump_card_version
+from .dashboard import bid_placed, listings_closed
+from .categories import invalidate_open_listing_counts
+from .models import Bid, Listing
+from .realtime import publish_listing_event
+from .taskqueue import enqueue, enqueue_many
+from .tasks import notify_auction_closed, notify_outbid
+
+
+# SQLite reports lock contention instead of waiting for the row,
+# so the whole transaction is retried a few times before giving up
+LOCK_RETRIES = 50
+LOCK_RETRY_DELAY = 0.005
+
+PRICE_STEP = Decimal("0.01")
+_price = Bid._meta.get_field("bid_price")
+# the first amount with more digits than the price columns hold
+PRICE_LIMIT = Decimal(10) ** (_price.max_digits - _price.decimal_places)
+
+
+class BidRejected(Exception):
+    """Raised when a bid cannot be placed. The message is shown to the bidder."""
+
+
+class AuctionNotFound(BidRejected):
+    """The listing that was bid on does not exist"""
+
+
+def now():
+    """Current time for auction ends, tests replace it with a fake clock"""
+    return timezone.now()
+
+
+def place_bid(listing_id, bidder, amount):
+    """Places a bid of `amount` by `bidder` on listing `listing_id`.
+
+    Returns the created Bid, raises BidRejected if the bid is not the highest one.
+    """
+    try:
+        amount = Decimal(str(amount)).quantize(PRICE_STEP)
+    except (InvalidOperation, ValueError):
+        raise BidRejected("Bid has to be a number")
+
+    if not amount.is_finite():
+        raise BidRejected("Bid has to be a number")
+    if amount >= PRICE_LIMIT:
+        raise BidRejected(f"Bid has to be less than {PRICE_LIMIT}")
+    if amount <= 0:
+        raise BidRejected("Bid cannot be negative and bid has to be more than current price")
+
+    # retrying only makes sense when we own the transaction
+    retries = 1 if connection.in_atomic_block else LOCK_RETRIES
+    for attempt in range(retries):
+        try:
+            return _place_bid(listing_id, bidder, amount)
+        except OperationalError as error:
+            if "locked" not in str(error) or attempt == retries - 1:
+                raise
+            time.sleep(LOCK_RETRY_DELAY * (attempt + 1))
+
+
+def _place_bid(listing_id, bidder, amount):
+    bid_time = now()
+    sniping_window = timedelta(seconds=settings.AUCTION_SNIPING_WINDOW)
+    with transaction.atomic():
+        updated = (
+            Listing.objects
+            .filter(pk=listing_id, closed=False)
+            .filter(Q(end_time__isnull=True) | Q(end_time__gt=bid_time))
+            .filter(Q(current_price__isnull=True) | Q(current_price__lt=amount))
+            .exclude(seller=bidder)
+            .update(
+                current_price=amount,
+                highest_bid=amount,
+                highest_bidder=bidder,
+                bid_count=F("bid_count") + 1,
+                updated_at=timezone.now(),
+                end_time=Case(
+                    When(end_time__lt=bid_time + sniping_window, then=Value(bid_time + sniping_window)),
+                    default=F("end_time"),
+                ),
+            )
+        )
+        if not updated:
+            raise _rejection(listing_id, bidder, bid_time)
+
+        bid_placed(listing_id, bidder.id)
+        bid = Bid.objects.create(listing_id=listing_id, bidder=bidder, bid_price=amount)
+        enqueue(notify_outbid, key=f"outbid:{bid.id}", bid_id=bid.id)
+        bid_count, end_time = Listing.objects.filter(pk=listing_id).values_list("bid_count", "end_time").get()
+        publish_listing_event(listing_id, {
+            "type": "bid",
+            "highest_bid": str(amount),
+            "highest_bidder": bidder.username,
+            "bid_count": bid_count,
+            "end_time": end_time.isoformat() if end_time else None,
+        })
+    return bid
+
+
+def _rejection(listing_id, bidder, bid_time):
+    """The BidRejected explaining why the bid's UPDATE matched no listing"""
+    listing = Listing.objects.filter(pk=listing_id).values("closed", "seller_id", "end_time").first()
+    if listing is None:
+        return AuctionNotFound("This auction does not exist")
+    if listing["closed"]:
+        return BidRejected("This auction has been closed")
+    if listing["end_time"] is not None and listing["end_time"] <= bid_time:
+        return BidRejected("This auction has ended")
+    if listing["seller_id"] == bidder.id:
+        return BidRejected("You cannot bid on your own auction")
+    return BidRejected("Bid cannot be negative and bid has to be more than current price")
+
+
+def close_auction(listing_id, seller=None):
+    """Closes an open auction, the highest bidder (if any) becomes the winner.
+
+    With `seller` only closes the auction if it is theirs. Returns the number
+    of auctions closed (0 or 1).
+    """
+    listings = Listing.objects.filter(pk=listing_id, closed=False)
+    if seller is not None:
+        listings = listings.filter(seller=seller)
+    closed_at = timezone.now()
+    with transaction.atomic():
+        closed = listings.update(
+            closed=True,
+            winner=F("highest_bidder"),
+            updated_at=closed_at,
+        )
+        if closed:
+            _announce_closed([listing_id], closed_at)
+    return closed
+
+
+def _announce_closed(listing_ids, closed_at):
+    """Announces the auctions among `listing_ids` that an UPDATE stamping `closed_at` has just closed.
+
+    Others may have been closed by somebody else since they were picked, the
+    rows the UPDATE changed stay locked until the transaction commits.
+    """
+    winners = (
+        Listing.objects
+        .filter(pk__in=listing_ids, closed=True, updated_at=closed_at)
+        .values_list("pk", "winner__username")
+    )
+    notifications = []
+    closed_ids = []
+    for listing_id, winner in winners:
+        closed_ids.append(listing_id)
+        publish_listing_event(listing_id, {"type": "closed", "winner": winner})
+        bump_card_version(listing_id)
+        # an auction can be closed again after reopening, once per closing
+        notifications.append((f"closed:{listing_id}:{closed_at.isoformat()}", {"listing_id": listing_id}))
+    enqueue_many(notify_auction_closed, notifications)
+    listings_closed(closed_ids)
+    invalidate_open_listing_counts()
+
+
+def reopen_auction(listing_id, seller=None):
+    """Opens a closed auction again and clears its winner, `seller` as for close_auction()"""
+    listings = Listing.objects.filter(pk=listing_id, closed=True)
+    if seller is not None:
+        listings = listings.filter(seller=seller)
+    with transaction.atomic():
+        reopened = listings.update(
+            closed=False,
+            winner=None,
+            updated_at=timezone.now(),
+        )
+        if not reopened:
+            return 0
+        listings_closed([listing_id], reopened=True)
+        publish_listing_event(listing_id, {"type": "reopened"})
+        bump_card_version(listing_id)
+        invalidate_open_listing_counts()
+    return reopened
+
+
+########################################################
+###########   AUCTION EXPIRY   #########################
+########################################################
+
+
+def close_expired_auctions(batch_size=500):
+    """Closes every open auction whose end_time has passed, returns how many were closed.
+
+    Due auctions are picked from the partial index on end_time of open
+    listings, so the cost grows with the number of due auctions and not with
+    the size of the table. Each batch is one transaction, the winner is set
+    from highest_bidder in the same UPDATE that closes the auction.
+    """
+    closed = 0
+    while True:
+        current_time = now()
+        with transaction.atomic():
+            due = Listing.objects.filter(closed=False, end_time__lte=current_time)
+            batch = list(due.order_by("end_time").values_list("pk", flat=True)[:batch_size])
+            if not batch:
+                return closed
+            # the due conditions are checked again by the UPDATE,
+            # a last second bid may have extended an auction since it was picked
+            # and its seller may have closed it already
+            closed_at = timezone.now()
+            closed += due.filter(pk__in=batch).update(
+                closed=True,
+                winner=F("highest_bidder"),
+                updated_at=closed_at,
+            )
+            _announce_closed(batch, closed_at)
+
+
+def next_expiry():
+    """end_time of the next open auction to expire, None if no auction has one"""
+    return (
+        Listing.objects
+        .filter(closed=False, end_time__isnull=False)
+        .order_by("end_time")
+        .values_list("end_time", flat=True)
+        .first()
+    )
+
+
+########################################################
+###########   BID STATS MAINTENANCE   ##################
+########################################################
+
+
+def _actual_bid_stats():
+    """Bid status of every listing computed from the bids themselves"""
+    listing_bids = Bid.objects.filter(listing=OuterRef("pk"))
+    highest = listing_bids.order_by("-bid_price", "id")
+    bid_count = listing_bids.values("listing").annotate(count=Count("*")).values("count")
+    return {
+        "highest_bid": Subquery(highest.values("bid_price")[:1]),
+        "highest_bidder": Subquery(highest.values("bidder")[:1]),
+        "bid_count": Coalesce(Subquery(bid_count), 0),
+    }
+
+
+def recompute_bid_stats(listings=None, batch_size=1000):
+    """Rewrites highest_bid, highest_bidder and bid_count from the bids table.
+
+    Works through the listings in primary key batches so big tables don't hold
+    one long write lock. Returns the number of listings updated.
+    """
+    if listings is None:
+        listings = Listing.objects.all()
+    ids = listings.order_by("pk").values_list("pk", flat=True)
+
+    updated = 0
+    last_id = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            return updated
+        with transaction.atomic():
+            updated += Listing.objects.filter(pk__in=batch).update(
+                updated_at=timezone.now(), **_actual_bid_stats())
+        last_id = batch[-1]
+
+
+def find_inconsistent_listings(listings=None):
+    """Yields (listing_id, stored, actual) for listings whose bid stats are out of sync"""
+    if listings is None:
+        listings = Listing.objects.all()
+    actual = {f"actual_{name}": value for name, value in _actual_bid_stats().items()}
+    rows = (
+        listings
+        .annotate(**actual)
+        .order_by("pk")
+        .values_list(
+            "pk", "highest_bid", "highest_bidder", "bid_count",
+            "actual_highest_bid", "actual_highest_bidder", "actual_bid_count",
+        )
+    )
+    for pk, *values in rows.iterator():
+        stored, actual = tuple(values[:3]), tuple(values[3:])
+        if stored != actual:
+            yield pk, stored, actual
@@ -0,0 +1,221 @@
+"""
+    Bulk listing import and export.
+
+    Sellers import listings from CSV (a header row with the ListingForm field
+    names) or JSON Lines (one object per line with the same keys). Every row is
+    validated with ListingForm like a listing added by hand, valid rows are
+    inserted with bulk_create in batches of BATCH_SIZE, each batch in its own
+    transaction, so a big file never holds the write lock for long. Invalid
+    rows are reported by row number and skipped.
+
+    Exports stream their rows: the queryset is read in chunks with iterator()
+    and every row is written to the response as soon as it has been read.
+    Exported listings can be imported again, extra columns are ignored.
+"""
+import csv
+import io
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+
+from .categories import invalidate_open_listing_counts
+from .dashboard import listings_created
+from .models import Bid, Listing
+from .views import ListingForm
+
+
+BATCH_SIZE = 500
+# a file full of mistakes reports the first ones only
+MAX_REPORTED_ERRORS = 100
+FORMATS = ["csv", "jsonl"]
+
+# the ListingForm fields come first, the rest is ignored on import
+EXPORTED_LISTING_FIELDS = {
+    field: field for field in [
+        "title", "current_price", "description", "listing_category", "image_url", "end_time",
+        "id", "publication_date", "closed", "bid_count", "highest_bid",
+    ]
+}
+# column: lookup
+EXPORTED_BID_FIELDS = {
+    "listing": "listing_id",
+    "listing_title": "listing__title",
+    "bidder": "bidder__username",
+    "bid_price": "bid_price",
+    "bid_date": "bid_date",
+}
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        # (row number, message)
+        self.errors = []
+
+    def add_error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row, message))
+
+
+def format_of(filename, default="csv"):
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return {"csv": "csv", "jsonl": "jsonl", "ndjson": "jsonl"}.get(extension, default)
+
+
+def read_rows(lines, format):
+    """Yields (row number, dict or error message) from an iterable of text lines"""
+    if format == "csv":
+        # row 1 is the header
+        for number, row in enumerate(csv.DictReader(lines), 2):
+            yield number, row
+        return
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, "Not valid JSON"
+            continue
+        yield number, row if isinstance(row, dict) else "Not a JSON object"
+
+
+def form_errors(form):
+    return "; ".join(
+        f"{field}: {' '.join(errors)}" if field != "__all__" else " ".join(errors)
+        for field, errors in form.errors.items()
+    )
+
+
+def import_listings(lines, seller, format="csv", batch_size=BATCH_SIZE):
+    """Creates `seller`'s listings from the rows in `lines`, returns an ImportReport"""
+    report = ImportReport()
+    batch = []
+    number = 0
+
+    def flush():
+        with transaction.atomic():
+            Listing.objects.bulk_create(batch)
+            listings_created(seller.id, len(batch))
+        report.created += len(batch)
+        batch.clear()
+
+    try:
+        for number, row in read_rows(lines, format):
+            if isinstance(row, str):
+                report.add_error(number, row)
+                continue
+            form = ListingForm({field: "" if value is None else value for field, value in row.items()})
+            if not form.is_valid():
+                report.add_error(number, form_errors(form))
+                continue
+            listing = form.save(commit=False)
+            listing.seller = seller
+            batch.append(listing)
+            if len(batch) >= batch_size:
+                flush()
+    except (UnicodeDecodeError, csv.Error) as error:
+        report.add_error(number + 1, f"Unreadable file: {error}")
+
+    if batch:
+        flush()
+    if report.created:
+        # bulk_create sends no post_save signals
+        invalidate_open_listing_counts()
+    return report
+
+
+def uploaded_lines(upload):
+    # big uploads are temporary files on disk, read them line by line
+    return io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+
+
+@login_required(login_url="auctions:login")
+def import_view(request):
+    report = None
+    message = None
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if upload is None:
+            message = "Choose a file to import"
+        else:
+            format = request.POST.get("format") or format_of(upload.name)
+            if format not in FORMATS:
+                message = "Unknown file format"
+            else:
+                report = import_listings(uploaded_lines(upload), request.user, format)
+
+    return render(request, "auctions/import_listings.html", {
+        "report": report,
+        "message": message,
+        "formats": FORMATS,
+        "fields": list(ListingForm.base_fields),
+    }, status=400 if message else 200)
+
+
+########################################################
+###########   EXPORT   #################################
+########################################################
+
+
+class Echo:
+    """File-like object that hands back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def export_value(value):
+    if hasattr(value, "isoformat"):
+        # the ListingForm input format, so exports can be imported again
+        return timezone.localtime(value).strftime("%Y-%m-%d %H:%M")
+    return value
+
+
+def stream_rows(queryset, fields, format, chunk_size=2000):
+    """CSV or JSON Lines text of the `fields` ({column: lookup}) of every row, one line at a time"""
+    rows = queryset.values_list(*fields.values()).iterator(chunk_size=chunk_size)
+    fields = list(fields)
+    if format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([export_value(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(fields, map(export_value, row))), default=str) + "\n"
+
+
+def export_response(queryset, fields, format, filename):
+    if format not in FORMATS:
+        format = "csv"
+    response = StreamingHttpResponse(
+        stream_rows(queryset, fields, format),
+        content_type="text/csv" if format == "csv" else "application/x-ndjson",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{format}"'
+    return response
+
+
+@require_safe
+@login_required(login_url="auctions:login")
+def export_listings(request):
+    listings = Listing.objects.filter(seller=request.user).order_by("pk")
+    return export_response(listings, EXPORTED_LISTING_FIELDS, request.GET.get("format"), "listings")
+
+
+@require_safe
+@login_required(login_url="auctions:login")
+def export_bids(request):
+    """Bid histories of the user's listings"""
+    bids = Bid.objects.filter(listing__seller=request.user).order_by("listing_id", "pk")
+    return export_response(bids, EXPORTED_BID_FIELDS, request.GET.get("format"), "bids")
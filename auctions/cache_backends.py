@@ -0,0 +1,134 @@
+"""
+    Redis cache backend for Django 3.0, which has none built in.
+
+    Needs the `redis` package. LOCATION is a redis:// URL, and
+    OPTIONS["CLIENT_CLASS"] picks the client class, e.g. "fakeredis.FakeRedis"
+    to run against an in-process stand-in instead of a Redis server.
+
+    Integers are stored as plain numbers so that incr() maps onto Redis INCRBY,
+    everything else is pickled.
+"""
+import pickle
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+
+class RedisCache(BaseCache):
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        self._url = server
+        self._client_class = params.get("OPTIONS", {}).get("CLIENT_CLASS", "redis.Redis")
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = import_string(self._client_class).from_url(self._url)
+        return self._client
+
+    def _serialize(self, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _deserialize(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def _expiry(self, timeout):
+        """Milliseconds for PX, None for no expiry"""
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return None
+        return max(int(timeout * 1000), 0)
+
+    def _set(self, key, value, timeout, **flags):
+        expiry = self._expiry(timeout)
+        if expiry == 0:
+            self.client.delete(key)
+            return False
+        return bool(self.client.set(key, self._serialize(value), px=expiry, **flags))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._set(key, value, timeout, nx=True)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self.client.get(key)
+        return default if value is None else self._deserialize(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._set(key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        expiry = self._expiry(timeout)
+        if expiry is None:
+            return bool(self.client.persist(key)) or bool(self.client.exists(key))
+        return bool(self.client.pexpire(key, expiry))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self.client.delete(key))
+
+    def get_many(self, keys, version=None):
+        made_keys = {self.make_key(key, version=version): key for key in keys}
+        for key in made_keys:
+            self.validate_key(key)
+        values = self.client.mget(list(made_keys)) if made_keys else []
+        return {
+            made_keys[key]: self._deserialize(value)
+            for key, value in zip(made_keys, values)
+            if value is not None
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expiry = self._expiry(timeout)
+        pipeline = self.client.pipeline()
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            if expiry == 0:
+                pipeline.delete(key)
+            else:
+                pipeline.set(key, self._serialize(value), px=expiry)
+        pipeline.execute()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        if keys:
+            self.client.delete(*keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self.client.exists(key))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        if not self.client.exists(key):
+            raise ValueError("Key '%s' not found" % key)
+        return self.client.incrby(key, delta)
+
+    def clear(self):
+        self.client.flushdb()
+
+    def close(self, **kwargs):
+        # connections are pooled by the client, nothing to release per request
+        pass
@@ -0,0 +1,202 @@
+"""
+    Caching helpers.
+
+    Listing cards are cached as template fragments keyed by listing id and a
+    per-listing version counter. Anything that changes what a card shows
+    (edits, bids, closing and reopening) bumps the counter, so the next render
+    misses the old fragment instead of having to find and delete it. The
+    seller and category names are part of the fragment key instead, so renaming
+    a user or a category does not have to bump all of their listings.
+
+    Whole pages are cached only for anonymous visitors, with a timeout per view
+    taken from settings.ANONYMOUS_CACHE_TIMEOUTS. Logged in users bypass the
+    page cache, so nobody is ever served a page rendered for someone else.
+
+    Listing and feed pages answer conditional GETs. Their ETags are computed
+    from Listing.updated_at with one indexed lookup, before anything is
+    rendered, so a client that already has the page gets a 304 without a
+    render. Deleted listings leave no updated_at behind, deleting one bumps a
+    feed version counter kept next to the card versions. Seller and category
+    names are on these pages too, renaming a user or a category bumps a names
+    version that every page ETag includes. Anonymous pages served from the
+    page cache answer If-None-Match with the ETag they were stored with.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, Max, OuterRef
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .analytics import category_stats
+from .models import Listing, UsersWatchlist
+
+
+CARD_VERSION_KEY = "listing-card-version:{}"
+FEED_VERSION_KEY = "listing-feed-version"
+NAMES_VERSION_KEY = "listing-names-version"
+
+
+def _fresh_version():
+    # versions restart from the clock when the counter is evicted,
+    # so they never go back to a number an old fragment was stored under
+    return int(time.time() * 1000)
+
+
+def _bump(key):
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _fresh_version(), None)
+
+    transaction.on_commit(bump)
+
+
+def bump_card_version(listing_id):
+    """Invalidates the cached card of a listing once the current transaction commits"""
+    _bump(CARD_VERSION_KEY.format(listing_id))
+
+
+def bump_feed_version():
+    """Changes the ETag of every feed once the current transaction commits, for deleted listings"""
+    _bump(FEED_VERSION_KEY)
+
+
+def bump_names_version():
+    """Changes the ETag of every page once the current transaction commits, for renamed users and categories"""
+    _bump(NAMES_VERSION_KEY)
+
+
+def _current_versions(*keys):
+    """Values of the version counters `keys`, with one cache round trip once they exist"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _fresh_version()
+            # a concurrent bump wins
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def attach_card_versions(listings):
+    """Sets listing.card_version on every listing with one cache round trip"""
+    keys = {listing.id: CARD_VERSION_KEY.format(listing.id) for listing in listings}
+    versions = cache.get_many(keys.values())
+
+    missing = {key: _fresh_version() for key in keys.values() if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+
+    for listing in listings:
+        listing.card_version = versions[keys[listing.id]]
+    return listings
+
+
+def _anonymous_page_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"anonymous-page:{request.method}:{path}"
+
+
+def cache_anonymous_page(policy):
+    """Caches the view's responses to anonymous GET requests for the timeout of `policy`"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = settings.ANONYMOUS_CACHE_TIMEOUTS.get(policy, 0)
+            anonymous = not request.user.is_authenticated
+
+            if not (timeout and anonymous and request.method in ("GET", "HEAD")):
+                response = view(request, *args, **kwargs)
+                if not anonymous:
+                    # keep shared caches (proxies, CDNs) from storing personal pages
+                    patch_cache_control(response, private=True)
+                patch_vary_headers(response, ["Cookie"])
+                return response
+
+            key = _anonymous_page_key(request)
+            response = cache.get(key)
+            if response is not None:
+                return get_conditional_response(request, etag=response.get("ETag"), response=response)
+
+            response = view(request, *args, **kwargs)
+            patch_vary_headers(response, ["Cookie"])
+            # pages that set cookies (e.g. a CSRF token) belong to one visitor
+            if response.status_code == 200 and not response.cookies \
+                    and not request.META.get("CSRF_COOKIE_USED"):
+                cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
+
+
+########################################################
+###########   CONDITIONAL GET   ########################
+########################################################
+
+
+def _page_etag(request, *versions, feed=False):
+    # messages are shown once, a page with pending messages has to be rendered
+    if len(messages.get_messages(request)):
+        return None
+    # the navigation and forms differ per user, and the forms carry the CSRF
+    # token, which changes when the user logs in again
+    user = request.user.id if request.user.is_authenticated else None
+    csrf = request.META.get("CSRF_COOKIE")
+    counters = _current_versions(NAMES_VERSION_KEY, *([FEED_VERSION_KEY] if feed else []))
+    return hashlib.md5(repr((user, csrf, *counters, *versions)).encode()).hexdigest()
+
+
+def feed_etag(listings):
+    """etag_func for condition() on pages showing feeds of `listings(request, *args, **kwargs)`.
+
+    The last update covers new, edited, bid on and closed listings and is
+    one seek at the end of an updated_at index, the feed version covers
+    deleted ones.
+    """
+    def etag(request, *args, **kwargs):
+        last_update = listings(request, *args, **kwargs).aggregate(Max("updated_at"))["updated_at__max"]
+        return _page_etag(request, last_update, feed=True)
+    return etag
+
+
+def listing_etag(request, listing_id):
+    """etag_func for condition() on the listing page"""
+    listing = Listing.objects.filter(pk=listing_id)
+    if request.user.is_authenticated:
+        # the watchlist button is part of the page
+        listing = listing.annotate(on_watchlist=Exists(UsersWatchlist.objects.filter(
+            watchlist_user=request.user, listing_in_watchlist=OuterRef("pk"))))
+        version = listing.values_list("updated_at", "on_watchlist").first()
+    else:
+        version = listing.values_list("updated_at").first()
+    if version is None:
+        # the view answers with a 404
+        return None
+    return _page_etag(request, listing_id, *version)
+
+
+def watchlist_etag(request):
+    """etag_func for condition() on the user's watchlist.
+
+    Watching and unwatching do not touch the listings, the number of watchlist
+    rows and the newest one cover them. Read from the user's watchlist rows only.
+    """
+    if not request.user.is_authenticated:
+        return None
+    version = UsersWatchlist.objects.filter(watchlist_user=request.user).aggregate(
+        Count("id"), Max("id"), Max("listing_in_watchlist__updated_at"))
+    return _page_etag(request, *version.values())
+
+
+def category_stats_etag(request):
+    """etag_func for condition() on the category stats, from the cached stats"""
+    stats = category_stats()
+    return _page_etag(request, sorted((key, row.refreshed_at) for key, row in stats.items()))
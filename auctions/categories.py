@@ -0,0 +1,121 @@
+"""
+    Category registry.
+
+    The built-in categories (Listing.LISTING_CATEGORY_CHOICES) are slugified
+    once when the app loads. Categories stored in the Category table are merged
+    in lazily and reloaded every REFRESH_INTERVAL seconds, or right away in the
+    process that changed them. Views, the <category:...> URL converter, the
+    listing form and templates all look categories up here instead of
+    slugifying the choices on every request.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Count
+
+from slugify import slugify
+
+from .models import Category, Listing
+
+
+CategoryEntry = namedtuple("CategoryEntry", ["key", "label", "slug"])
+
+OPEN_COUNTS_KEY = "category-open-listing-counts"
+OPEN_COUNTS_TIMEOUT = 300
+
+
+class CategoryRegistry:
+
+    REFRESH_INTERVAL = 60
+
+    def __init__(self, choices):
+        self._builtin = [CategoryEntry(key, label, slugify(label)) for key, label in choices]
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._entries = self._by_key = self._by_slug = None
+
+    def invalidate(self):
+        """Makes the next lookup reload the database categories"""
+        self._loaded_at = None
+
+    def _load(self):
+        entries = {entry.key: entry for entry in self._builtin}
+        try:
+            for key, label, slug in Category.objects.values_list("key", "label", "slug"):
+                entries[key] = CategoryEntry(key, label, slug)
+        except DatabaseError:
+            # e.g. migrations not applied yet, the built-in categories still work
+            pass
+        return list(entries.values())
+
+    def _current(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.REFRESH_INTERVAL:
+            with self._lock:
+                entries = self._load()
+                self._by_key = {entry.key: entry for entry in entries}
+                self._by_slug = {entry.slug: entry for entry in entries}
+                self._entries = entries
+                self._loaded_at = time.monotonic()
+        return self._entries, self._by_key, self._by_slug
+
+    def all(self):
+        return self._current()[0]
+
+    def choices(self):
+        return [(entry.key, entry.label) for entry in self.all()]
+
+    def get_by_slug(self, slug):
+        return self._current()[2].get(slug)
+
+    def get_by_key(self, key):
+        return self._current()[1].get(key)
+
+    def label(self, key):
+        entry = self.get_by_key(key)
+        return entry.label if entry is not None else key
+
+
+registry = CategoryRegistry(Listing.LISTING_CATEGORY_CHOICES)
+
+
+def category_choices():
+    """Form field choices, a plain function so forms can deepcopy their fields"""
+    return registry.choices()
+
+
+class CategoryConverter:
+    """<category:name> URL parameter, unknown slugs don't match and end up as 404"""
+
+    regex = "[-a-zA-Z0-9_]+"
+
+    def to_python(self, value):
+        category = registry.get_by_slug(value)
+        if category is None:
+            raise ValueError(f"Unknown category {value}")
+        return category
+
+    def to_url(self, value):
+        return getattr(value, "slug", value)
+
+
+def open_listing_counts():
+    """{category key: number of open listings}, one GROUP BY query and then cached"""
+    counts = cache.get(OPEN_COUNTS_KEY)
+    if counts is None:
+        counts = dict(
+            Listing.objects
+            .filter(closed=False)
+            .order_by()
+            .values_list("listing_category")
+            .annotate(Count("id"))
+        )
+        cache.set(OPEN_COUNTS_KEY, counts, OPEN_COUNTS_TIMEOUT)
+    return counts
+
+
+def invalidate_open_listing_counts():
+    transaction.on_commit(lambda: cache.delete(OPEN_COUNTS_KEY))
@@ -0,0 +1,158 @@
+"""
+    Per-user totals for the user panel (UserDashboard).
+
+    The totals are not counted on every visit. Each event adjusts them with
+    UPDATEs in the transaction of the write that caused it:
+
+        listing created    seller's active listings
+        bid placed         bidder's count of open listings bid on, if it is their first bid there
+        auctions closed    seller's active and sold listings and earnings,
+                           winner's won auctions and spendings, every bidder's open listings
+        auctions reopened  the same, backwards
+
+    A dashboard row that does not exist yet is computed from scratch by
+    dashboard_for() the first time it is needed, the UPDATEs skip users without
+    one. Deleting a listing forgets the rows of the users it counted for, and
+    the rebuild_dashboards command recomputes rows that have drifted.
+"""
+import operator
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Bid, Listing, UserDashboard
+
+
+FIELDS = ["active_listings", "sold_count", "bidding_count", "won_count", "total_spent", "total_earned"]
+
+
+def compute(user_id):
+    """UserDashboard of `user_id` counted from the listings and bids, not saved"""
+    selling = Listing.objects.filter(seller_id=user_id).aggregate(
+        active_listings=Count("pk", filter=Q(closed=False)),
+        sold_count=Count("pk", filter=Q(closed=True)),
+        total_earned=Sum("highest_bid", filter=Q(closed=True, winner__isnull=False)),
+    )
+    won = Listing.objects.filter(winner_id=user_id, closed=True).aggregate(
+        won_count=Count("pk"),
+        total_spent=Sum("highest_bid"),
+    )
+    bidding_count = Listing.objects.filter(
+        closed=False, pk__in=Bid.objects.filter(bidder_id=user_id).values("listing")
+    ).count()
+    return UserDashboard(
+        user_id=user_id,
+        active_listings=selling["active_listings"],
+        sold_count=selling["sold_count"],
+        total_earned=selling["total_earned"] or Decimal("0"),
+        won_count=won["won_count"],
+        total_spent=won["total_spent"] or Decimal("0"),
+        bidding_count=bidding_count,
+    )
+
+
+def rebuild(user_id):
+    """Recomputes and saves the dashboard of `user_id`"""
+    dashboard = compute(user_id)
+    dashboard.save()
+    return dashboard
+
+
+def dashboard_for(user):
+    """The user's dashboard, one query unless it has to be computed first"""
+    dashboard = UserDashboard.objects.filter(user=user).first()
+    if dashboard is not None:
+        return dashboard
+    dashboard = compute(user.id)
+    try:
+        with transaction.atomic():
+            dashboard.save(force_insert=True)
+    except IntegrityError:
+        # computed by a concurrent request
+        return UserDashboard.objects.get(user=user)
+    return dashboard
+
+
+########################################################
+###########   EVENTS   #################################
+########################################################
+
+
+def listings_created(seller_id, count=1):
+    UserDashboard.objects.filter(user_id=seller_id).update(active_listings=F("active_listings") + count)
+
+
+def bid_placed(listing_id, bidder_id):
+    """Counts the listing for the bidder, call it before their bid is saved"""
+    earlier_bids = Bid.objects.filter(listing_id=listing_id, bidder_id=bidder_id)
+    UserDashboard.objects.filter(~Exists(earlier_bids), user_id=bidder_id).update(
+        bidding_count=F("bidding_count") + 1,
+    )
+
+
+def _count(queryset):
+    """Number of rows of a correlated queryset, as a subquery"""
+    return Coalesce(
+        Subquery(queryset.annotate(total=Count("pk")).values("total"), output_field=IntegerField()),
+        Value(0),
+    )
+
+
+def _sum(queryset, field):
+    return Coalesce(
+        Subquery(queryset.annotate(total=Sum(field)).values("total"), output_field=DecimalField()),
+        Value(Decimal("0")),
+        output_field=DecimalField(),
+    )
+
+
+def listings_closed(listing_ids, reopened=False):
+    """Moves the listings among `listing_ids` that have just been closed (or reopened) on the dashboards.
+
+    Three UPDATEs, one for the sellers, the winners and the bidders, however
+    many listings there are.
+    """
+    listings = Listing.objects.filter(pk__in=listing_ids, closed=not reopened)
+    # closing adds to the closed totals and takes from the open ones, reopening the other way around
+    add, take = (operator.sub, operator.add) if reopened else (operator.add, operator.sub)
+
+    # the winner is the highest bidder, reopening has cleared it already
+    sold = listings.filter(seller_id=OuterRef("user_id")).values("seller")
+    UserDashboard.objects.filter(user_id__in=listings.values("seller")).update(
+        active_listings=take(F("active_listings"), _count(sold)),
+        sold_count=add(F("sold_count"), _count(sold)),
+        total_earned=add(F("total_earned"), _sum(sold.filter(highest_bidder__isnull=False), "highest_bid")),
+    )
+
+    won = listings.filter(highest_bidder_id=OuterRef("user_id")).values("highest_bidder")
+    UserDashboard.objects.filter(user_id__in=listings.values("highest_bidder")).update(
+        won_count=add(F("won_count"), _count(won)),
+        total_spent=add(F("total_spent"), _sum(won, "highest_bid")),
+    )
+
+    bids = Bid.objects.filter(listing__in=listings)
+    bid_on = Subquery(
+        bids.filter(bidder_id=OuterRef("user_id")).values("bidder")
+        .annotate(total=Count("listing", distinct=True)).values("total"),
+        output_field=IntegerField(),
+    )
+    UserDashboard.objects.filter(user_id__in=bids.values("bidder")).update(
+        bidding_count=take(F("bidding_count"), bid_on),
+    )
+
+
+def forget(user_ids):
+    """Drops the dashboards of `user_ids`, they are computed again when needed"""
+    UserDashboard.objects.filter(user_id__in=user_ids).delete()
+
+
+def find_stale_dashboards():
+    """Yields (user id, stored totals, actual totals) of the dashboards that have drifted"""
+    for dashboard in UserDashboard.objects.order_by("pk").iterator():
+        actual = compute(dashboard.user_id)
+        stored_totals = {field: getattr(dashboard, field) for field in FIELDS}
+        actual_totals = {field: getattr(actual, field) for field in FIELDS}
+        if stored_totals != actual_totals:
+            yield dashboard.user_id, stored_totals, actual_totals
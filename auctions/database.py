@@ -0,0 +1,54 @@
+"""
+    Database connection setup.
+
+    SQLite connections get the PRAGMAs of the alias's SQLITE_MODE when they are
+    opened. "tuned" switches to write-ahead logging, so readers no longer block
+    the single writer and commits need no fsync of the whole database:
+
+        journal_mode=WAL     readers and one writer work at the same time
+        synchronous=NORMAL   fsync at checkpoints only, safe in WAL mode
+        busy_timeout         writers wait for the write lock instead of failing
+        mmap_size            reads through memory mapping instead of read() calls
+
+    "default" restores SQLite's own settings, WAL has to be switched off
+    explicitly because it is stored in the database file.
+
+    Django 3.0 has no CONN_HEALTH_CHECKS. Aliases that set it get their
+    persistent connection pinged at the start of every request and reopened
+    if the server dropped it, instead of failing the request.
+"""
+from django.db import connections
+
+
+SQLITE_MODES = {
+    "default": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "mmap_size": 0,
+    },
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+    },
+}
+
+
+def configure_connection(connection):
+    """Applies the SQLITE_MODE PRAGMAs to a new SQLite connection"""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = SQLITE_MODES[connection.settings_dict.get("SQLITE_MODE", "default")]
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def check_connection_health():
+    """Closes persistent connections that no longer work, they reopen on first use"""
+    for connection in connections.all():
+        if connection.connection is not None and connection.settings_dict.get("CONN_HEALTH_CHECKS") \
+                and not connection.is_usable():
+            connection.close()
@@ -0,0 +1,261 @@
+"""
+    Per-request SQL and timing instrumentation.
+
+    RequestMetricsMiddleware measures a sample of the requests
+    (settings.REQUEST_METRICS["SAMPLE_RATE"], 0 to 1): total time, view time,
+    SQL queries and their time, duplicate queries (same SQL with the same
+    parameters) and template render time. With a sample rate of 0 the
+    middleware removes itself from the stack and costs nothing.
+
+    A measured request is
+      - described in its Server-Timing header, shown by the browser's dev tools,
+      - logged as one key=value line on the "auctions.metrics" logger,
+        the values are also attached to the log record as `metrics`,
+      - added to in-memory totals per view, served in the Prometheus text format
+        by metrics_view to settings.INTERNAL_IPS. The totals are per process,
+        every worker has to be scraped.
+
+    Template render time needs TimedDjangoTemplates as the template backend.
+"""
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+
+logger = logging.getLogger("auctions.metrics")
+
+# request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """What one request spent its time on, seconds"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view_start = None
+        self.total_time = 0
+        self.view_time = 0
+        self.sql_time = 0
+        self.template_time = 0
+        self.rendering = False
+        # (sql, params): times executed
+        self.statements = Counter()
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.statements.values())
+
+    def duplicated_sql(self):
+        return [sql for (sql, params), count in self.statements.most_common() if count > 1]
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.statements[(sql, repr(params))] += 1
+
+
+class MetricsRegistry:
+    """Totals of the measured requests per (view, method, status), thread safe"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def add(self, labels, metrics):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {
+                    "requests": 0, "seconds": 0, "buckets": [0] * len(BUCKETS),
+                    "view_seconds": 0, "sql_queries": 0, "sql_seconds": 0,
+                    "duplicate_queries": 0, "template_seconds": 0,
+                }
+            series["requests"] += 1
+            series["seconds"] += metrics.total_time
+            for i, bound in enumerate(BUCKETS):
+                if metrics.total_time <= bound:
+                    series["buckets"][i] += 1
+            series["view_seconds"] += metrics.view_time
+            series["sql_queries"] += metrics.queries
+            series["sql_seconds"] += metrics.sql_time
+            series["duplicate_queries"] += metrics.duplicates
+            series["template_seconds"] += metrics.template_time
+
+    def prometheus(self):
+        """The totals in the Prometheus text exposition format"""
+        with self._lock:
+            series = sorted((labels, dict(values, buckets=list(values["buckets"])))
+                            for labels, values in self._series.items())
+
+        def label_text(labels, **extra):
+            names = dict(zip(("view", "method", "status"), labels), **extra)
+            return ",".join(f'{name}="{value}"' for name, value in names.items())
+
+        lines = [
+            "# HELP auctions_request_duration_seconds Time spent on measured requests.",
+            "# TYPE auctions_request_duration_seconds histogram",
+        ]
+        for labels, values in series:
+            for bound, count in zip(BUCKETS, values["buckets"]):
+                lines.append(f"auctions_request_duration_seconds_bucket{{{label_text(labels, le=bound)}}} {count}")
+            lines.append(f'auctions_request_duration_seconds_bucket{{{label_text(labels, le="+Inf")}}} '
+                         f'{values["requests"]}')
+            lines.append(f"auctions_request_duration_seconds_sum{{{label_text(labels)}}} {values['seconds']:.6f}")
+            lines.append(f"auctions_request_duration_seconds_count{{{label_text(labels)}}} {values['requests']}")
+
+        counters = [
+            ("view_seconds", "auctions_view_duration_seconds_total", "Time spent in views."),
+            ("sql_queries", "auctions_sql_queries_total", "SQL queries executed."),
+            ("sql_seconds", "auctions_sql_duration_seconds_total", "Time spent executing SQL."),
+            ("duplicate_queries", "auctions_sql_duplicate_queries_total",
+             "Queries repeating an earlier query of the same request."),
+            ("template_seconds", "auctions_template_duration_seconds_total", "Time spent rendering templates."),
+        ]
+        for key, name, description in counters:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, values in series:
+                value = values[key]
+                lines.append(f"{name}{{{label_text(labels)}}} {value:.6f}" if isinstance(value, float)
+                             else f"{name}{{{label_text(labels)}}} {value}")
+
+        lines.append("# HELP auctions_metrics_sample_rate Share of the requests that are measured.")
+        lines.append("# TYPE auctions_metrics_sample_rate gauge")
+        lines.append(f"auctions_metrics_sample_rate {sample_rate()}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def sample_rate():
+    return settings.REQUEST_METRICS.get("SAMPLE_RATE", 0)
+
+
+class RequestMetricsMiddleware:
+    """Measures a sample of the requests, see the module docstring"""
+
+    def __init__(self, get_response):
+        if not sample_rate():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= sample_rate():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        request.metrics = metrics
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        end = time.perf_counter()
+        metrics.total_time = end - metrics.start
+        if metrics.view_start is not None:
+            metrics.view_time = end - metrics.view_start
+        self.report(request, response, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = getattr(request, "metrics", None)
+        if metrics is not None:
+            metrics.view_start = time.perf_counter()
+
+    def report(self, request, response, metrics):
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        METRICS.add((view, request.method, response.status_code), metrics)
+
+        if settings.REQUEST_METRICS.get("SERVER_TIMING", True):
+            response["Server-Timing"] = ", ".join([
+                f"total;dur={metrics.total_time * 1000:.1f}",
+                f"view;dur={metrics.view_time * 1000:.1f}",
+                f'sql;dur={metrics.sql_time * 1000:.1f};desc="{metrics.queries} queries, '
+                f'{metrics.duplicates} duplicates"',
+                f"tpl;dur={metrics.template_time * 1000:.1f}",
+            ])
+
+        fields = {
+            "method": request.method,
+            "path": request.path,
+            "view": view,
+            "status": response.status_code,
+            "total_ms": round(metrics.total_time * 1000, 2),
+            "view_ms": round(metrics.view_time * 1000, 2),
+            "sql_ms": round(metrics.sql_time * 1000, 2),
+            "queries": metrics.queries,
+            "duplicates": metrics.duplicates,
+            "template_ms": round(metrics.template_time * 1000, 2),
+        }
+        logger.info(" ".join(f"{name}={value}" for name, value in fields.items()), extra={"metrics": fields})
+        for sql in metrics.duplicated_sql():
+            logger.warning("duplicate query view=%s sql=%s", view, sql)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, only for settings.INTERNAL_IPS"""
+    if request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS:
+        raise Http404
+    return HttpResponse(METRICS.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+########################################################
+###########   TEMPLATE TIMING   ########################
+########################################################
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        # templates rendered inside another template are part of its time
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+            metrics.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders of measured requests"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
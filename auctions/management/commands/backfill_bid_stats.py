@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.bidding import find_inconsistent_listings, recompute_bid_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized bid status (highest bid, highest bidder, bid count) of listings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report listings whose bid status is out of sync, exit with an error if any",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            inconsistent = 0
+            for listing_id, stored, actual in find_inconsistent_listings():
+                inconsistent += 1
+                self.stdout.write(f"Listing {listing_id}: stored {stored}, actual {actual}")
+            if inconsistent:
+                raise CommandError(f"{inconsistent} listing(s) have out of sync bid status")
+            self.stdout.write(self.style.SUCCESS("Bid status of all listings is consistent"))
+            return
+
+        updated = recompute_bid_stats(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Recomputed bid status of {updated} listing(s)"))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from auctions.benchmarking import bid_throughput
+from auctions.database import SQLITE_MODES
+
+
+class Command(BaseCommand):
+    help = "Places bids from many threads at once and reports the bid throughput of the database configuration"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8, help="Threads placing bids at the same time")
+        parser.add_argument("--bids", type=int, default=50, help="Bids per writer")
+        parser.add_argument("--listings", type=int, default=4, help="Listings the writers bid on")
+        parser.add_argument(
+            "--sqlite-modes", default=",".join(SQLITE_MODES),
+            help="On SQLite, the SQLITE_MODEs to compare",
+        )
+
+    def handle(self, *args, **options):
+        settings_dict = connections["default"].settings_dict
+        if connections["default"].vendor != "sqlite":
+            self.report(settings_dict["ENGINE"].rsplit(".", 1)[-1], options)
+            return
+
+        modes = options["sqlite_modes"].split(",")
+        unknown = set(modes) - set(SQLITE_MODES)
+        if unknown:
+            raise CommandError(f"Unknown SQLite modes {', '.join(sorted(unknown))}, choose from {', '.join(SQLITE_MODES)}")
+        configured = settings_dict.get("SQLITE_MODE")
+        try:
+            for mode in modes:
+                # new connections, of every thread, pick the mode up from the settings
+                connections.close_all()
+                settings_dict["SQLITE_MODE"] = mode
+                self.report(f"sqlite {mode}", options)
+        finally:
+            connections.close_all()
+            settings_dict["SQLITE_MODE"] = configured
+
+    def report(self, configuration, options):
+        result = bid_throughput(writers=options["writers"], bids=options["bids"], listings=options["listings"])
+        attempts = result["accepted"] + result["outbid"] + result["errors"]
+        self.stdout.write(
+            f"{configuration}: {attempts} bids from {options['writers']} writers in {result['seconds']:.2f}s, "
+            f"{attempts / result['seconds']:.0f} bids/s "
+            f"({result['accepted']} accepted, {result['outbid']} outbid, {result['errors']} failed)"
+        )
@@ -0,0 +1,66 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions import benchmarking
+
+
+# generated from `seed_data --seed 1` on an empty database, kept in the repository
+REFERENCE_BASELINE = os.path.join(settings.BASE_DIR, "benchmarks", "baseline.json")
+# this machine's own run, not tracked
+LOCAL_BASELINE = os.path.join(settings.BASE_DIR, "benchmarks", "baseline.local.json")
+
+
+class Command(BaseCommand):
+    help = "Requests every auctions URL and reports p50/p95 latency, queries and peak memory per endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint")
+        parser.add_argument(
+            "--baseline",
+            help="JSON file of an earlier run on the same dataset (seed_data --seed 1 on an empty database). "
+                 "Checks compare with benchmarks/baseline.local.json if there is one, else with the "
+                 "reference benchmarks/baseline.json, saving writes benchmarks/baseline.local.json",
+        )
+        parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Fail when an endpoint got slower than --tolerance or needs more queries than the baseline",
+        )
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth, 0.2 is 20%%")
+
+    def handle(self, *args, **options):
+        uncovered = benchmarking.uncovered_urls()
+        if uncovered:
+            raise CommandError(f"No benchmark for {', '.join(uncovered)}, add them to benchmarking.ENDPOINTS")
+        try:
+            results = benchmarking.run(rounds=options["requests"])
+        except LookupError as error:
+            raise CommandError(error)
+
+        self.stdout.write(f"{'endpoint':<22}{'p50 ms':>9}{'p95 ms':>9}{'queries':>9}{'peak KiB':>10}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<22}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['queries']:>9}{result['peak_kib']:>10}"
+            )
+
+        if options["save_baseline"]:
+            path = options["baseline"] or LOCAL_BASELINE
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as baseline:
+                json.dump(results, baseline, indent=2, sort_keys=True)
+                baseline.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Saved the baseline to {path}"))
+
+        if options["check"]:
+            path = options["baseline"] or (LOCAL_BASELINE if os.path.exists(LOCAL_BASELINE) else REFERENCE_BASELINE)
+            try:
+                with open(path) as baseline:
+                    regressions = benchmarking.compare(results, json.load(baseline), options["tolerance"])
+            except FileNotFoundError:
+                raise CommandError(f"No baseline at {path}, run with --save-baseline first")
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
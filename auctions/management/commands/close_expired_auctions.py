@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.bidding import close_expired_auctions, next_expiry, now
+
+
+class Command(BaseCommand):
+    help = "Closes open auctions whose end time has passed and announces their winners"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--watch", action="store_true",
+            help="Keep running and close auctions as they expire",
+        )
+        parser.add_argument(
+            "--max-sleep", type=float, default=60,
+            help="With --watch, longest pause between checks in seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            closed = close_expired_auctions(batch_size=options["batch_size"])
+            if closed or not options["watch"]:
+                self.stdout.write(self.style.SUCCESS(f"Closed {closed} expired auction(s)"))
+            if not options["watch"]:
+                return
+
+            # sleep until the next auction is due, new listings are picked up within max-sleep
+            pause = options["max_sleep"]
+            due = next_expiry()
+            if due is not None:
+                pause = min(pause, max((due - now()).total_seconds(), 0))
+            time.sleep(pause)
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.bulk import BATCH_SIZE, FORMATS, format_of, import_listings
+from auctions.models import User
+
+
+class Command(BaseCommand):
+    help = "Imports listings for a seller from a CSV or JSON Lines file, rows are validated like the add listing form"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help='CSV or JSON Lines file, "-" for standard input')
+        parser.add_argument("--seller", required=True, help="Username of the seller")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension, else csv")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(username=options["seller"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['seller']}")
+        format = options["format"] or format_of(options["file"])
+
+        if options["file"] == "-":
+            report = import_listings(sys.stdin, seller, format, options["batch_size"])
+        else:
+            try:
+                with open(options["file"], encoding="utf-8-sig", newline="") as lines:
+                    report = import_listings(lines, seller, format, options["batch_size"])
+            except OSError as error:
+                raise CommandError(error)
+
+        for row, error in report.errors:
+            self.stderr.write(f"Row {row}: {error}")
+        if report.failed > len(report.errors):
+            self.stderr.write(f"... and {report.failed - len(report.errors)} more")
+        self.stdout.write(self.style.SUCCESS(f"Imported {report.created} listing(s), skipped {report.failed} row(s)"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.dashboard import find_stale_dashboards, rebuild
+
+
+class Command(BaseCommand):
+    help = "Recomputes the user panel totals (UserDashboard) that are out of sync with the listings and bids"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report dashboards that are out of sync, exit with an error if any",
+        )
+
+    def handle(self, *args, **options):
+        # computed before any is fixed, the rows are read with a cursor
+        stale = list(find_stale_dashboards())
+        for user_id, stored, actual in stale:
+            self.stdout.write(f"User {user_id}: stored {stored}, actual {actual}")
+        if options["check"]:
+            if stale:
+                raise CommandError(f"{len(stale)} dashboard(s) are out of sync")
+            self.stdout.write(self.style.SUCCESS("All dashboards are consistent"))
+            return
+
+        for user_id, _, _ in stale:
+            rebuild(user_id)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(stale)} dashboard(s)"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from auctions.analytics import refresh_category_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the price analytics of the categories whose listings changed since the last refresh"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Recompute every category, also catches deleted listings",
+        )
+
+    def handle(self, *args, **options):
+        refreshed = refresh_category_stats(full=options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed the stats of {refreshed} category(ies)"))
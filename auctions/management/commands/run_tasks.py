@@ -0,0 +1,60 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from auctions import workers
+from auctions.taskqueue import purge, work
+
+
+# finished tasks are purged at most this often, in seconds
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = "Runs the background tasks (auctions.taskqueue) as they become due"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=2,
+            help="Size of the process pool running the tasks, 0 runs them in this process",
+        )
+        parser.add_argument("--batch-size", type=int, default=50, help="Tasks claimed at a time")
+        parser.add_argument("--once", action="store_true", help="Stop when no task is due")
+        parser.add_argument("--poll-interval", type=float, default=1, help="Seconds between checks for due tasks")
+        parser.add_argument(
+            "--keep-done", type=int, default=86400,
+            help="Seconds that finished tasks are kept, their keys keep them from being enqueued again",
+        )
+
+    def handle(self, *args, **options):
+        if options["processes"]:
+            # spawned, not forked, the pool processes must not share this process's connections
+            executor = ProcessPoolExecutor(
+                options["processes"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=workers.start,
+            )
+        else:
+            executor = nullcontext()
+
+        last_purge = 0
+        with executor:
+            pool = executor if options["processes"] else None
+            while True:
+                if time.monotonic() - last_purge > PURGE_INTERVAL:
+                    purge(options["keep_done"])
+                    last_purge = time.monotonic()
+
+                ran = work(pool, limit=options["batch_size"])
+                if ran:
+                    self.stdout.write(f"Ran {ran} task(s)")
+                    continue
+                if options["once"]:
+                    return
+                # don't hold a connection while idle
+                connections.close_all()
+                time.sleep(options["poll_interval"])
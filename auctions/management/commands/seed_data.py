@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from auctions.seeding import PASSWORD, seed
+
+
+class Command(BaseCommand):
+    help = "Fills the database with generated users, listings, bids, comments and watchlists"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--listings", type=int, default=2000)
+        parser.add_argument("--bids-per-listing", type=int, default=5, help="On average")
+        parser.add_argument("--comments-per-listing", type=int, default=3, help="On average")
+        parser.add_argument("--watchlist-per-user", type=int, default=10)
+        parser.add_argument("--seed", type=int, help="Random seed, for the same dataset on every run")
+
+    def handle(self, *args, **options):
+        created = seed(
+            users=options["users"],
+            listings=options["listings"],
+            bids_per_listing=options["bids_per_listing"],
+            comments_per_listing=options["comments_per_listing"],
+            watchlist_per_user=options["watchlist_per_user"],
+            seed=options["seed"],
+        )
+        for model, count in created.items():
+            self.stdout.write(f"{count} {model}")
+        self.stdout.write(self.style.SUCCESS(f"Seeded, every user's password is \"{PASSWORD}\""))
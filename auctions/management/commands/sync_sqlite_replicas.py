@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def copy_sqlite_database(source, target):
+    """Copies the database file `source` to `target` with SQLite's online backup, safe while it is written to"""
+    with sqlite3.connect(source) as primary, sqlite3.connect(target) as replica:
+        primary.backup(replica)
+    primary.close()
+    replica.close()
+
+
+class Command(BaseCommand):
+    help = "Copies the SQLite primary database to the replica files, a stand-in for replication when developing"
+
+    def handle(self, *args, **options):
+        if connections["default"].vendor != "sqlite":
+            raise CommandError("Only SQLite replicas are copies, other databases replicate themselves")
+        if not settings.REPLICA_DATABASES:
+            raise CommandError("No replicas configured, set DATABASE_REPLICAS")
+
+        source = connections["default"].settings_dict["NAME"]
+        for alias in settings.REPLICA_DATABASES:
+            connections[alias].close()
+            target = connections[alias].settings_dict["NAME"]
+            copy_sqlite_database(source, target)
+            self.stdout.write(f"Copied {source} to {alias} ({target})")
@@ -0,0 +1,48 @@
+# Generated by Django 3.0 on 2026-10-18 10:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_bid_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    ListingBids = Listing.bids.through
+
+    listing_bids = ListingBids.objects.filter(listing=OuterRef('pk'))
+    highest = listing_bids.order_by('-bid__bid_price', 'bid_id')
+    bid_count = listing_bids.values('listing').annotate(count=Count('*')).values('count')
+
+    Listing.objects.update(
+        highest_bid=Subquery(highest.values('bid__bid_price')[:1]),
+        highest_bidder=Subquery(highest.values('bid__bidder')[:1]),
+        bid_count=Coalesce(Subquery(bid_count), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0006_auto_20220728_0652'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='highest_bid',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='highest_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='highest_bids', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_bid_stats, migrations.RunPython.noop),
+    ]
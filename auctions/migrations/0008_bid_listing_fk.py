@@ -0,0 +1,75 @@
+# Generated by Django 3.0 on 2026-10-18 10:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+BATCH_SIZE = 1000
+
+
+def copy_listing_bids_to_fk(apps, schema_editor):
+    """Points every bid at its listing, taken from the old listing.bids join table"""
+    Bid = apps.get_model('auctions', 'Bid')
+    Listing = apps.get_model('auctions', 'Listing')
+    ListingBids = Listing.bids.through
+
+    bid_ids = Bid.objects.order_by('pk').values_list('pk', flat=True)
+    listing_of_bid = ListingBids.objects.filter(bid=OuterRef('pk')).order_by('pk').values('listing')[:1]
+
+    last_id = 0
+    while True:
+        batch = list(bid_ids.filter(pk__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            return
+        Bid.objects.filter(pk__in=batch).update(listing=Subquery(listing_of_bid))
+        last_id = batch[-1]
+
+
+def copy_fk_to_listing_bids(apps, schema_editor):
+    Bid = apps.get_model('auctions', 'Bid')
+    Listing = apps.get_model('auctions', 'Listing')
+    ListingBids = Listing.bids.through
+
+    rows = Bid.objects.filter(listing__isnull=False).values_list('pk', 'listing_id')
+    batch = []
+    for bid_id, listing_id in rows.iterator():
+        batch.append(ListingBids(bid_id=bid_id, listing_id=listing_id))
+        if len(batch) == BATCH_SIZE:
+            ListingBids.objects.bulk_create(batch)
+            batch = []
+    ListingBids.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_listing_bid_stats'),
+    ]
+
+    operations = [
+        # added without a reverse accessor first, listing.bids is still the old join table
+        migrations.AddField(
+            model_name='bid',
+            name='listing',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='auctions.Listing'),
+        ),
+        migrations.RunPython(copy_listing_bids_to_fk, copy_fk_to_listing_bids),
+        migrations.RemoveField(
+            model_name='listing',
+            name='bids',
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='listing',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bids', to='auctions.Listing'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-bid_price'], name='bid_listing_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder', 'listing'], name='bid_bidder_listing_idx'),
+        ),
+    ]
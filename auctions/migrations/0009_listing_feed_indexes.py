@@ -0,0 +1,51 @@
+# Generated by Django 3.0 on 2026-10-18 10:11
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_watchlist_items(apps, schema_editor):
+    """Keeps the oldest row of every (user, listing) pair so the unique index can be built"""
+    UsersWatchlist = apps.get_model('auctions', 'UsersWatchlist')
+    keep = (
+        UsersWatchlist.objects
+        .values('watchlist_user', 'listing_in_watchlist')
+        .annotate(keep_id=Min('id'))
+        .values('keep_id')
+    )
+    UsersWatchlist.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0008_bid_listing_fk'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_watchlist_items, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='userswatchlist',
+            unique_together={('watchlist_user', 'listing_in_watchlist')},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['comments_listing', '-comment_date'], name='comment_listing_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['closed', '-publication_date'], name='listing_closed_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['listing_category', '-publication_date'], name='listing_category_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', 'closed', '-publication_date'], name='listing_seller_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['winner', 'closed', '-publication_date'], name='listing_winner_closed_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.0 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_listing_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_closed_pub_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_category_pub_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_seller_closed_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='listing_winner_closed_idx',
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['closed', '-publication_date', '-id'], name='listing_closed_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['listing_category', '-publication_date', '-id'], name='listing_category_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['seller', 'closed', '-publication_date', '-id'], name='listing_seller_closed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['winner', 'closed', '-publication_date', '-id'], name='listing_winner_closed_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.0 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0010_keyset_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=36, unique=True)),
+                ('label', models.CharField(max_length=64)),
+                ('slug', models.SlugField(blank=True, max_length=64, unique=True)),
+            ],
+            options={
+                'verbose_name': 'category',
+                'verbose_name_plural': 'categories',
+            },
+        ),
+        migrations.AlterField(
+            model_name='listing',
+            name='listing_category',
+            field=models.CharField(default='BROOMS', max_length=36),
+        ),
+    ]
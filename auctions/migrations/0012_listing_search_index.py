@@ -0,0 +1,79 @@
+# Generated by Django 3.0 on 2026-10-18 10:40
+
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    # external content table, the text itself stays in auctions_listing
+    """
+    CREATE VIRTUAL TABLE auctions_listing_fts USING fts5(
+        title, description, content='auctions_listing', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER auctions_listing_fts_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    # bids and closing update the listing row too, only text changes touch the index
+    """
+    CREATE TRIGGER auctions_listing_fts_update AFTER UPDATE OF title, description ON auctions_listing BEGIN
+        INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO auctions_listing_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO auctions_listing_fts(auctions_listing_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS auctions_listing_fts_update",
+    "DROP TRIGGER IF EXISTS auctions_listing_fts_delete",
+    "DROP TRIGGER IF EXISTS auctions_listing_fts_insert",
+    "DROP TABLE IF EXISTS auctions_listing_fts",
+]
+
+# needs PostgreSQL 12+ for generated columns
+POSTGRESQL_FORWARD = [
+    """
+    ALTER TABLE auctions_listing ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX auctions_listing_search_idx ON auctions_listing USING GIN (search_vector)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS auctions_listing_search_idx",
+    "ALTER TABLE auctions_listing DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRESQL_FORWARD}),
+            run_for_vendor({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRESQL_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.0 on 2026-10-18 10:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_count(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Comment = apps.get_model('auctions', 'Comment')
+
+    comment_count = (
+        Comment.objects
+        .filter(comments_listing=OuterRef('pk'))
+        .values('comments_listing')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    Listing.objects.update(comment_count=Coalesce(Subquery(comment_count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0014_listing_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_listing_date_idx',
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['comments_listing', '-comment_date', '-id'], name='comment_listing_date_idx'),
+        ),
+        migrations.RunPython(backfill_comment_count, migrations.RunPython.noop),
+    ]
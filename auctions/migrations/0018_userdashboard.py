@@ -0,0 +1,27 @@
+# Generated by Django 3.0 on 2026-10-18 11:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0017_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDashboard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='dashboard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('active_listings', models.IntegerField(default=0)),
+                ('sold_count', models.IntegerField(default=0)),
+                ('bidding_count', models.IntegerField(default=0)),
+                ('won_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_earned', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+    ]
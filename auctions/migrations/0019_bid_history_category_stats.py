@@ -0,0 +1,34 @@
+# Generated by Django 3.0 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0018_userdashboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=36, unique=True)),
+                ('closed_auctions', models.PositiveIntegerField(default=0)),
+                ('sold_auctions', models.PositiveIntegerField(default=0)),
+                ('average_final_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('bids_per_auction', models.FloatField(blank=True, null=True)),
+                ('time_to_first_bid', models.DurationField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'category stats',
+                'verbose_name_plural': 'category stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', '-bid_date', '-id'], name='bid_listing_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.0 on 2026-10-18 12:23
+
+import auctions.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0019_bid_history_category_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='listing',
+            name='listing_category',
+            field=models.CharField(default='BROOMS', max_length=36, validators=[auctions.models.validate_category]),
+        ),
+    ]
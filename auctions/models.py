@@ -1,5 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
+
+from slugify import slugify
 
 
 
@@ -23,20 +27,57 @@ class Bid(models.Model):
     # auto: bid_id
     bidder = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bidder", null=True)
     bid_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
-    #bids_listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="bids_listing")
+    listing = models.ForeignKey("Listing", on_delete=models.CASCADE, related_name="bids", null=True)
     bid_date = models.DateTimeField(auto_now_add=True, null=True)
 
     class Meta:
         verbose_name = "bid"
         verbose_name_plural = "bids"
+        indexes = [
+            # highest bid of a listing is an index seek
+            models.Index(fields=["listing", "-bid_price"], name="bid_listing_price_idx"),
+            # listings a user is bidding on
+            models.Index(fields=["bidder", "listing"], name="bid_bidder_listing_idx"),
+            # ends with (bid_date, id) for keyset pagination of a listing's bid history
+            models.Index(fields=["listing", "-bid_date", "-id"], name="bid_listing_date_idx"),
+        ]
     
     def __str__(self):
         return f"{self.bidder} bid {self.bid_price}€ on {self.bid_date}"
 
 
+class Category(models.Model):
+    """Listing category added on top of the built-in Listing.LISTING_CATEGORY_CHOICES,
+    a row with the key of a built-in category renames it"""
+    key = models.CharField(max_length=36, unique=True)
+    label = models.CharField(max_length=64)
+    slug = models.SlugField(max_length=64, unique=True, blank=True)
+
+    class Meta:
+        verbose_name = "category"
+        verbose_name_plural = "categories"
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = slugify(self.label)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Category {self.key}: {self.label}"
+
+
+def validate_category(value):
+    """Model validation of Listing.listing_category, which has no fixed choices"""
+    # auctions.categories imports the models
+    from .categories import registry
+    if registry.get_by_key(value) is None:
+        raise ValidationError("Value %(value)r is not a valid choice.", code="invalid_choice", params={"value": value})
+
+
 class Listing(models.Model):
     """
         Listing model contains all info related to one listing excluding data about bids (who bid how much etc.)
+        Bids point to their listing and are available as listing.bids
     """
     # Categoriy choices
     A = 'WIZARDING CLOTHING'
@@ -62,27 +103,62 @@ class Listing(models.Model):
     description = models.TextField()
     current_price = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     image_url = models.URLField(max_length=300, blank=True)
+    # one of auctions.categories.registry, which also knows categories stored in the database
     listing_category = models.CharField(
         max_length=36,
-        choices=LISTING_CATEGORY_CHOICES,
         default=B,
+        validators=[validate_category],
     )
     publication_date = models.DateTimeField(auto_now_add=True, null=True)
     closed = models.BooleanField(default=False)
     #comments = models.ManyToManyField(Comment, blank=True, related_name="comments")
-    bids = models.ManyToManyField(Bid, blank=True, related_name="bids")
     winner = models.ForeignKey(
         User, 
         on_delete=models.CASCADE, 
         blank=True, null=True,
         related_name="winner")
-    
-    # TODO add coundown timer for auction end date
+
+    # Bid status kept in sync by auctions.bidding, so pages don't need to query bids
+    highest_bid = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    highest_bidder = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        blank=True, null=True,
+        related_name="highest_bids")
+    bid_count = models.PositiveIntegerField(default=0)
+    # kept in sync by the Comment signals in auctions.signals
+    comment_count = models.PositiveIntegerField(default=0)
+
+    # auctions without an end time run until the seller closes them,
+    # the others are closed by the close_expired_auctions command
+    end_time = models.DateTimeField(blank=True, null=True)
+
+    # anything shown on the listing page or its card changed, queryset.update()
+    # skips auto_now so every update in auctions.bidding sets it explicitly
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "auction"
         verbose_name_plural = "auctions"
+        # one index per listing feed used by the views,
+        # ending with (publication_date, id) for keyset pagination
+        indexes = [
+            models.Index(fields=["closed", "-publication_date", "-id"], name="listing_closed_pub_idx"),
+            models.Index(fields=["listing_category", "-publication_date", "-id"], name="listing_category_pub_idx"),
+            models.Index(fields=["seller", "closed", "-publication_date", "-id"], name="listing_seller_closed_idx"),
+            models.Index(fields=["winner", "closed", "-publication_date", "-id"], name="listing_winner_closed_idx"),
+            # due auctions for the expiry scheduler, closed ones are left out of the index
+            models.Index(fields=["end_time"], name="listing_open_end_idx", condition=models.Q(closed=False)),
+            # feed versions for conditional GET (auctions.caching)
+            models.Index(fields=["updated_at"], name="listing_updated_idx"),
+            models.Index(fields=["listing_category", "updated_at"], name="listing_category_updated_idx"),
+        ]
     
+    @property
+    def category_label(self):
+        from .categories import registry
+        return registry.label(self.listing_category)
+
     def __str__(self):
         return f"Listing {self.id}> title: {self.title}, seller: {self.seller}, current price: {self.current_price}€"
 
@@ -98,6 +174,10 @@ class Comment(models.Model):
     class Meta:
         verbose_name = "comment"
         verbose_name_plural = "comments"
+        indexes = [
+            # ends with (comment_date, id) for keyset pagination of a listing's comments
+            models.Index(fields=["comments_listing", "-comment_date", "-id"], name="comment_listing_date_idx"),
+        ]
     
     def __str__(self):
         return f"Comment {self.id} on listing {self.comments_listing} made by {self.commenter}"
@@ -107,8 +187,161 @@ class UsersWatchlist(models.Model):
     watchlist_user = models.ForeignKey(User, on_delete=models.CASCADE, null=True,  related_name="watchlist")
     listing_in_watchlist = models.ForeignKey(Listing, on_delete=models.CASCADE, null=True, related_name="watchlist")
 
-    # Forces to not have listing duplicates for one user
-    unique_together = ["listing_in_watchlist", "watchlist_user"]
+    class Meta:
+        # Forces to not have listing duplicates for one user,
+        # the unique index also serves the "is it on my watchlist" lookup
+        unique_together = ["watchlist_user", "listing_in_watchlist"]
+
+    def __str__(self):
+        return f"{self.listing_in_watchlist} in user {self.watchlist_user} watchlist"
+
+
+class Task(models.Model):
+    """A unit of background work, see auctions.taskqueue"""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    # dotted path of the task function
+    name = models.CharField(max_length=200)
+    # keyword arguments of the function, JSON
+    payload = models.TextField(default="{}")
+    # a task is only enqueued once per key
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the worker's "what is due" lookup only covers pending tasks
+            models.Index(fields=["run_after"], name="task_pending_due_idx", condition=models.Q(status="pending")),
+            models.Index(fields=["status", "claimed_at"], name="task_status_claimed_idx"),
+        ]
+
+    def __str__(self):
+        return f"Task {self.id} {self.name} ({self.status})"
+
+
+class Notification(models.Model):
+    """Something that happened to a listing a user bid on, watches or sells, see auctions.notifications.
+
+    Repeats of an unread notification raise its count instead of adding rows.
+    """
+    OUTBID = "outbid"
+    BID = "bid"
+    WON = "won"
+    CLOSED = "closed"
+    KIND_CHOICES = [
+        (OUTBID, "Outbid"),
+        (BID, "New bid on a watched listing"),
+        (WON, "Auction won"),
+        (CLOSED, "Auction closed"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="notifications")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # how many times it happened since the user last read their notifications
+    count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(default=timezone.now)
+    # last time it happened, queryset.update() in auctions.notifications sets it
+    updated_at = models.DateTimeField(default=timezone.now)
+    read_at = models.DateTimeField(null=True, blank=True)
+    emailed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # one unread notification per user, listing and kind, new ones are coalesced into it
+            models.UniqueConstraint(
+                fields=["user", "listing", "kind"], name="notification_unread_unique",
+                condition=models.Q(read_at=None),
+            ),
+        ]
+        indexes = [
+            # ends with (updated_at, id) for keyset pagination of the inbox
+            models.Index(fields=["user", "-updated_at", "-id"], name="notification_user_updated_idx"),
+            # notifications waiting for the next e-mail batch
+            models.Index(fields=["user"], name="notification_unsent_idx", condition=models.Q(emailed_at=None)),
+        ]
+
+    @property
+    def message(self):
+        listing = self.listing
+        times = f" ({self.count} times)" if self.count > 1 else ""
+        if self.kind == self.OUTBID:
+            return f"You have been outbid on {listing.title}{times}, the highest bid is {listing.highest_bid}€"
+        if self.kind == self.BID:
+            bids = f"{self.count} new bids" if self.count > 1 else "A new bid"
+            return f"{bids} on {listing.title}, the highest bid is {listing.highest_bid}€"
+        if self.kind == self.WON:
+            return f"You won {listing.title} with {listing.highest_bid}€"
+        if listing.winner_id is not None:
+            return f"{listing.title} has closed, {listing.winner.username} won it with {listing.highest_bid}€"
+        return f"{listing.title} has closed without bids"
+
+    def __str__(self):
+        return f"Notification {self.id} for {self.user}: {self.kind} on listing {self.listing_id}"
+
+
+class UserDashboard(models.Model):
+    """The totals on top of a user's panel, kept up to date by auctions.dashboard"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="dashboard")
+    # open listings of the user as seller
+    active_listings = models.IntegerField(default=0)
+    sold_count = models.IntegerField(default=0)
+    # open listings the user has bid on
+    bidding_count = models.IntegerField(default=0)
+    won_count = models.IntegerField(default=0)
+    # winning bids of the auctions the user won and of the ones they sold
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_earned = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Dashboard of {self.user}"
+
+
+class CategoryStats(models.Model):
+    """Price analytics of the closed auctions of a category, computed by auctions.analytics"""
+    category = models.CharField(max_length=36, unique=True)
+    closed_auctions = models.PositiveIntegerField(default=0)
+    # closed with a winner
+    sold_auctions = models.PositiveIntegerField(default=0)
+    average_final_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    bids_per_auction = models.FloatField(null=True, blank=True)
+    # from publication to the first bid, of the auctions that got one
+    time_to_first_bid = models.DurationField(null=True, blank=True)
+    # start of the refresh that computed the row
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "category stats"
+        verbose_name_plural = "category stats"
+
+    @property
+    def time_to_first_bid_display(self):
+        """time_to_first_bid rounded to minutes, e.g. "1 d 2 h 3 min" """
+        if self.time_to_first_bid is None:
+            return None
+        minutes = round(self.time_to_first_bid.total_seconds() / 60)
+        if minutes < 1:
+            return "less than a minute"
+        days, minutes = divmod(minutes, 24 * 60)
+        hours, minutes = divmod(minutes, 60)
+        parts = [(days, "d"), (hours, "h"), (minutes, "min")]
+        return " ".join(f"{value} {unit}" for value, unit in parts if value)
 
     def __str__(self):
-        return f"{self.listing_in_watchlist} in user {self.watchlist_user} watchlist"
\ No newline at end of file
+        return f"Stats of category {self.category}"
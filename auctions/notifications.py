@@ -0,0 +1,141 @@
+"""
+    In-app notifications and their e-mail digests.
+
+    notify(listing_id, kind, recipients) notifies every user of a queryset of
+    user ids with two statements, however many recipients there are: an UPDATE
+    that raises the count of the recipients' unread notification of the same
+    kind about the listing, and an INSERT ... SELECT of a new notification for
+    everybody else. The partial unique index on unread notifications makes the
+    INSERT skip the users the UPDATE already covered, also when two fan-outs
+    about the same listing run at the same time.
+
+    deliver() e-mails the notifications nobody has been e-mailed about yet, one
+    message per user listing all of them, in batches of users that share one
+    mail connection. Being outbid is not worth an e-mail any more once the user
+    has bid again and leads the auction. The background tasks in auctions.tasks fan out bids and
+    closings and schedule deliver() once per NOTIFICATIONS["BATCH_WINDOW"]
+    seconds, so a burst of bids becomes one e-mail per user.
+"""
+from django.contrib.auth.decorators import login_required
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router
+from django.db.models import F
+from django.http import HttpResponseRedirect
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+
+from .models import Notification
+from .pagination import paginate_feed
+
+
+# users e-mailed per mail connection
+DELIVERY_BATCH_SIZE = 500
+
+
+def notify(listing_id, kind, recipients):
+    """Notifies the users in `recipients` (a queryset of user ids) about `kind` on listing `listing_id`.
+
+    Returns the number of users notified.
+    """
+    current_time = timezone.now()
+    recipients = recipients.order_by()
+    coalesced = (
+        Notification.objects
+        .filter(listing_id=listing_id, kind=kind, read_at=None, user_id__in=recipients)
+        .update(count=F("count") + 1, updated_at=current_time, emailed_at=None)
+    )
+
+    using = router.db_for_write(Notification)
+    connection = connections[using]
+    select, params = recipients.query.get_compiler(using).as_sql()
+    now = Notification._meta.get_field("created_at").get_db_prep_value(current_time, connection)
+    columns = ", ".join(
+        connection.ops.quote_name(column)
+        for column in ["user_id", "listing_id", "kind", "count", "created_at", "updated_at"]
+    )
+    sql = (
+        f"{connection.ops.insert_statement(ignore_conflicts=True)} "
+        f"{connection.ops.quote_name(Notification._meta.db_table)} ({columns}) "
+        f"SELECT recipients.*, %s, %s, 1, %s, %s FROM ({select}) recipients "
+        f"{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (listing_id, kind, now, now, *params))
+        return coalesced + cursor.rowcount
+
+
+def unread_count(user):
+    return Notification.objects.filter(user=user, read_at=None).count()
+
+
+def digest(notifications):
+    """Subject and body of the e-mail about a user's `notifications`"""
+    messages = [notification.message for notification in notifications]
+    if len(messages) == 1:
+        return messages[0], messages[0]
+    return f"{len(messages)} updates on your auctions", "\n".join(messages)
+
+
+def deliver(batch_size=DELIVERY_BATCH_SIZE):
+    """E-mails every user about their notifications that were not e-mailed yet, returns the number of e-mails"""
+    started = timezone.now()
+    # repeats after `started` change updated_at and go with the next delivery
+    unsent = Notification.objects.filter(emailed_at=None, updated_at__lte=started)
+    sent = 0
+    last_user = 0
+    while True:
+        users = list(
+            unsent.filter(user_id__gt=last_user)
+            .order_by("user_id").values_list("user_id", flat=True).distinct()[:batch_size]
+        )
+        if not users:
+            return sent
+        last_user = users[-1]
+        notifications = (
+            unsent.filter(user_id__in=users)
+            .select_related("user", "listing__winner")
+            .order_by("user_id", "-updated_at")
+        )
+        by_user = {}
+        for notification in notifications:
+            if notification.kind == Notification.OUTBID and notification.listing.highest_bidder_id == notification.user_id:
+                # bid again since, nothing to tell
+                continue
+            by_user.setdefault(notification.user, []).append(notification)
+
+        emails = []
+        for user, user_notifications in by_user.items():
+            if user.email:
+                subject, body = digest(user_notifications)
+                emails.append(EmailMessage(subject, body, None, [user.email]))
+        if emails:
+            sent += get_connection().send_messages(emails) or 0
+        unsent.filter(user_id__in=users).update(emailed_at=started)
+
+
+########################################################
+###########   INBOX   ##################################
+########################################################
+
+
+@login_required(login_url="auctions:login")
+def inbox(request):
+    notifications = paginate_feed(
+        request,
+        Notification.objects.filter(user=request.user).select_related("listing__winner"),
+        date_field="updated_at",
+    )
+    return render(request, "auctions/notifications.html", {
+        "notifications": notifications,
+        "unread_count": unread_count(request.user),
+    })
+
+
+@require_POST
+@login_required(login_url="auctions:login")
+def mark_read(request):
+    """Marks all of the user's notifications read, the next events start new ones"""
+    Notification.objects.filter(user=request.user, read_at=None).update(read_at=timezone.now())
+    return HttpResponseRedirect(reverse("auctions:notifications"))
@@ -0,0 +1,120 @@
+"""
+    Keyset (cursor) pagination for newest-first feeds.
+
+    Pages are ordered by (date, id) descending and the cursor holds the
+    (date, id) of the last row on the page. The next page continues with
+    `WHERE date <= cursor_date AND (date < cursor_date OR id < cursor_id)`,
+    which is an index range seek, so page 1000 costs the same as page 1
+    (no OFFSET).
+"""
+import base64
+import binascii
+
+from django.core.exceptions import SuspiciousOperation
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+PER_PAGE = 24
+
+# ranked results have no stable keyset and are paged by number,
+# deep pages of a search are not worth their OFFSET
+MAX_RANKED_PAGES = 50
+
+
+class KeysetPage:
+    """One page of a feed, iterating over it gives the rows of the page"""
+
+    def __init__(self, items, next_cursor=None, next_url=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.next_url = next_url
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(date, pk):
+    value = f"{date.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns (date, pk) of a cursor, raises SuspiciousOperation (400) for a broken one"""
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date, pk = value.split("|")
+        date, pk = parse_datetime(date), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        date = None
+    if date is None:
+        raise SuspiciousOperation("Invalid page cursor")
+    return date, pk
+
+
+def keyset_page(queryset, cursor=None, per_page=PER_PAGE, date_field="publication_date"):
+    """Returns the page of `queryset` that follows `cursor` (first page if None)"""
+    queryset = queryset.order_by(f"-{date_field}", "-pk")
+    if cursor:
+        date, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f"{date_field}__lt": date}) | Q(pk__lt=pk),
+            **{f"{date_field}__lte": date},
+        )
+
+    # one extra row tells if there is a next page
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        if isinstance(last, dict):
+            # rows of queryset.values(), which have to include the date and id
+            next_cursor = encode_cursor(last[date_field], last["id"])
+        else:
+            next_cursor = encode_cursor(getattr(last, date_field), last.pk)
+    return KeysetPage(items, next_cursor)
+
+
+def paginate_feed(request, queryset, cursor_param="cursor", **kwargs):
+    """Pages `queryset` with the cursor from request.GET[cursor_param].
+
+    The page's next_url keeps the other query parameters, so several feeds
+    on one page can be paged independently.
+    """
+    page = keyset_page(queryset, request.GET.get(cursor_param), **kwargs)
+    if page.has_next:
+        query = request.GET.copy()
+        query[cursor_param] = page.next_cursor
+        page.next_url = f"?{query.urlencode()}"
+    return page
+
+
+def paginate_ranked(request, queryset, page_param="page", per_page=PER_PAGE):
+    """Pages ranked results (e.g. search) by page number from request.GET[page_param]"""
+    try:
+        number = max(int(request.GET.get(page_param, 1)), 1)
+    except ValueError:
+        raise SuspiciousOperation("Invalid page number")
+    if number > MAX_RANKED_PAGES:
+        return KeysetPage([])
+
+    offset = (number - 1) * per_page
+    items = list(queryset[offset:offset + per_page + 1])
+    page = KeysetPage(items[:per_page])
+    if len(items) > per_page and number < MAX_RANKED_PAGES:
+        page.next_cursor = str(number + 1)
+        query = request.GET.copy()
+        query[page_param] = page.next_cursor
+        page.next_url = f"?{query.urlencode()}"
+    return page
@@ -0,0 +1,193 @@
+"""
+    Real-time listing updates pushed over WebSockets.
+
+    Bid placement and closing/reopening publish an event on the listing's
+    channel once their transaction commits. The broker fans events out to the
+    WebSocket connections of every watcher in this worker:
+
+        ws://<host>/ws/listings/<listing_id>/
+
+    InProcessBroker only reaches connections of its own process, RedisBroker
+    relays events between worker processes through Redis pub/sub (or fakeredis
+    for a local stand-in). settings.REALTIME_BROKER picks the broker.
+
+    An idle subscriber is one coroutine and one small queue, so a worker holds
+    thousands of them.
+"""
+import asyncio
+import json
+import re
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+SUBSCRIBER_QUEUE_SIZE = 16
+
+LISTING_PATH = re.compile(r"^/ws/listings/(?P<listing_id>[0-9]+)/$")
+
+
+def listing_channel(listing_id):
+    return f"listing:{listing_id}"
+
+
+class Subscription:
+    """Events of one channel for one connection, read with `await subscription.get()`"""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, message):
+        # runs in the subscriber's event loop, a slow reader loses its oldest events
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fans events out to the subscribers of this process, publish() is thread safe"""
+
+    def __init__(self, **options):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """Must be called from inside the event loop that reads the subscription"""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._channels.pop(subscription.channel, None)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+    def publish(self, channel, message):
+        self.fan_out(channel, message)
+
+    def fan_out(self, channel, message):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+
+
+class RedisBroker(InProcessBroker):
+    """Publishes through Redis so that the subscribers of every worker get the event.
+
+    Options: URL (redis:// URL) and CLIENT_CLASS (default "redis.Redis",
+    "fakeredis.FakeRedis" for a local stand-in).
+    """
+
+    PATTERN = "listing:*"
+
+    def __init__(self, URL="redis://localhost:6379/0", CLIENT_CLASS="redis.Redis", **options):
+        super().__init__(**options)
+        self._client = import_string(CLIENT_CLASS).from_url(URL)
+        self._listener = None
+
+    def subscribe(self, channel):
+        self._start_listener()
+        return super().subscribe(channel)
+
+    def publish(self, channel, message):
+        self._client.publish(channel, json.dumps(message))
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is not None:
+                return
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(self.PATTERN)
+            self._listener = threading.Thread(target=self._listen, args=(pubsub,), daemon=True)
+            self._listener.start()
+
+    def _listen(self, pubsub):
+        while True:
+            event = pubsub.get_message(timeout=1.0)
+            if event is None or event["type"] != "pmessage":
+                continue
+            channel = event["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            self.fan_out(channel, json.loads(event["data"]))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                config = dict(settings.REALTIME_BROKER)
+                _broker = import_string(config.pop("BACKEND"))(**config)
+    return _broker
+
+
+def publish_listing_event(listing_id, message):
+    """Publishes `message` to the watchers of a listing after the transaction commits"""
+    message = dict(message, listing=listing_id)
+    transaction.on_commit(lambda: get_broker().publish(listing_channel(listing_id), message))
+
+
+########################################################
+###########   ASGI WEBSOCKET APPLICATION   #############
+########################################################
+
+
+async def websocket_application(scope, receive, send):
+    """Streams the events of one listing to a WebSocket client"""
+    match = LISTING_PATH.match(scope["path"])
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+    if match is None:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+
+    subscription = get_broker().subscribe(listing_channel(int(match.group("listing_id"))))
+    await send({"type": "websocket.accept"})
+    receiving = asyncio.ensure_future(receive())
+    publishing = None
+    try:
+        while True:
+            publishing = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {receiving, publishing}, return_when=asyncio.FIRST_COMPLETED)
+
+            if publishing in done:
+                await send({"type": "websocket.send", "text": json.dumps(publishing.result())})
+            else:
+                publishing.cancel()
+
+            if receiving in done:
+                # clients have nothing to say, anything but a disconnect is ignored
+                if receiving.result()["type"] == "websocket.disconnect":
+                    return
+                receiving = asyncio.ensure_future(receive())
+    finally:
+        subscription.close()
+        for task in (receiving, publishing):
+            if task is not None and not task.done():
+                task.cancel()
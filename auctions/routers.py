@@ -0,0 +1,97 @@
+"""
+    Read replica routing.
+
+    Views decorated with @replica_reads read listings, bids, comments,
+    categories and watchlists from one of settings.REPLICA_DATABASES; every
+    other read and all writes go to the primary ("default"). Users and
+    sessions are always read from the primary, a replica that lags behind
+    must not log anybody out.
+
+    Replicas lag behind the primary, so a client that just wrote something
+    would not see it there. A request that writes pins the rest of itself to
+    the primary, and PrimaryPinningMiddleware gives the client a cookie that
+    pins its requests for settings.REPLICA_PIN_SECONDS, so bidders see their
+    bids and watchlist changes right away.
+"""
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+
+PIN_COOKIE = "primary_until"
+
+REPLICA_MODELS = {"listing", "bid", "comment", "category", "categorystats", "userswatchlist"}
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_primary_pinned = ContextVar("primary_pinned", default=False)
+_wrote = ContextVar("wrote", default=False)
+
+
+def replica_reads(anonymous_only=False):
+    """Lets the view read from replicas, with `anonymous_only` only for anonymous visitors"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if anonymous_only and request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            token = _replica_reads.set(True)
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return wrapper
+    return decorator
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if not (settings.REPLICA_DATABASES and _replica_reads.get()) or _primary_pinned.get() or _wrote.get():
+            return None
+        if model._meta.app_label != "auctions" or model._meta.model_name not in REPLICA_MODELS:
+            return None
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        # read your own writes for the rest of the request
+        _wrote.set(True)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        databases = {"default", *settings.REPLICA_DATABASES}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class PrimaryPinningMiddleware:
+    """Pins clients that wrote something to the primary for REPLICA_PIN_SECONDS"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        pinned_token = _primary_pinned.set(pinned)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _primary_pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+
+        if wrote:
+            pin = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, f"{time.time() + pin:.0f}", max_age=pin, httponly=True, samesite="Lax")
+        return response
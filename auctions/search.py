@@ -0,0 +1,109 @@
+"""
+    Full-text search over listing titles and descriptions.
+
+    SQLite uses the FTS5 table auctions_listing_fts and PostgreSQL the
+    search_vector column with its GIN index, both created by migration 0012
+    and kept in sync by the database itself. Results are ranked with bm25 /
+    ts_rank, title matches weigh more than description matches. Other
+    databases fall back to an unranked icontains scan.
+
+    SQLite alters a table by rebuilding it, which drops the FTS triggers on
+    auctions_listing. restore_sqlite_triggers() puts them back after every
+    migrate.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from .models import Listing
+
+
+MAX_TERMS = 10
+
+# same triggers as created by migration 0012
+SQLITE_TRIGGERS = {
+    "auctions_listing_fts_insert": """
+        CREATE TRIGGER auctions_listing_fts_insert AFTER INSERT ON auctions_listing BEGIN
+            INSERT INTO auctions_listing_fts(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+    """,
+    "auctions_listing_fts_delete": """
+        CREATE TRIGGER auctions_listing_fts_delete AFTER DELETE ON auctions_listing BEGIN
+            INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+    """,
+    "auctions_listing_fts_update": """
+        CREATE TRIGGER auctions_listing_fts_update AFTER UPDATE OF title, description ON auctions_listing BEGIN
+            INSERT INTO auctions_listing_fts(auctions_listing_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO auctions_listing_fts(rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+    """,
+}
+
+
+def search_terms(query):
+    """Words of a user query, anything FTS5 could read as syntax is dropped"""
+    return re.findall(r"\w+", query or "")[:MAX_TERMS]
+
+
+def search_listings(query, queryset=None):
+    """Listings matching every word of `query` (as a prefix), best match first"""
+    if queryset is None:
+        queryset = Listing.objects.all()
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            tables=["auctions_listing_fts"],
+            where=[
+                "auctions_listing_fts.rowid = auctions_listing.id",
+                "auctions_listing_fts MATCH %s",
+            ],
+            params=[match],
+            # bm25 is lower for better matches
+            select={"rank": "bm25(auctions_listing_fts, 10.0, 1.0)"},
+        ).order_by("rank", "-publication_date")
+
+    if connection.vendor == "postgresql":
+        tsquery = "to_tsquery('english', %s)"
+        match = " & ".join(f"{term}:*" for term in terms)
+        return queryset.extra(
+            where=[f"auctions_listing.search_vector @@ {tsquery}"],
+            params=[match],
+            select={"rank": f"ts_rank(auctions_listing.search_vector, {tsquery})"},
+            select_params=[match],
+        ).order_by("-rank", "-publication_date")
+
+    for term in terms:
+        queryset = queryset.filter(Q(title__icontains=term) | Q(description__icontains=term))
+    return queryset.order_by("-publication_date")
+
+
+def restore_sqlite_triggers(using="default"):
+    """Recreates the FTS triggers a table rebuild has dropped, returns True if any were missing"""
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return False
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s)" % ", ".join(["%s"] * (len(SQLITE_TRIGGERS) + 1)),
+            ["auctions_listing_fts", *SQLITE_TRIGGERS],
+        )
+        existing = {name for name, in cursor.fetchall()}
+        missing = [sql for name, sql in SQLITE_TRIGGERS.items() if name not in existing]
+        # no FTS table means migration 0012 is not applied
+        if "auctions_listing_fts" not in existing or not missing:
+            return False
+        for sql in missing:
+            cursor.execute(sql)
+        # rows written while the triggers were gone are not indexed
+        cursor.execute("INSERT INTO auctions_listing_fts(auctions_listing_fts) VALUES ('rebuild')")
+    return True
@@ -0,0 +1,138 @@
+"""
+    Generated datasets for development and benchmarks (seed_data command).
+
+    Everything is written with bulk_create. The bid history of every listing is
+    generated before the listing itself, so the denormalized bid status
+    (current_price, highest_bid, highest_bidder, bid_count) and comment_count
+    are stored right away instead of being recomputed afterwards.
+"""
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .categories import registry
+from .models import Bid, Comment, Listing, User, UsersWatchlist
+
+
+BATCH_SIZE = 500
+PASSWORD = "password"
+
+ADJECTIVES = ["Ancient", "Enchanted", "Cursed", "Golden", "Invisible", "Silver", "Dusty", "Singing", "Tiny"]
+ITEMS = {
+    Listing.A: ["cloak", "robe", "hat", "scarf", "gloves"],
+    Listing.B: ["broom", "Nimbus", "Firebolt", "Comet", "Cleansweep"],
+    Listing.C: ["wand", "wand core", "wand holster", "wand polish"],
+    Listing.D: ["spellbook", "potion guide", "herbology book", "star chart"],
+    Listing.E: ["cauldron", "Remembrall", "Sneakoscope", "Deluminator", "time turner"],
+    Listing.F: ["phoenix feather", "dragon scale", "unicorn hair", "griffin claw"],
+}
+COMMENTS = ["Is it still available?", "Great price!", "Does it come with a case?", "Works as described.",
+            "Can you ship abroad?", "Lovely item", "Is it haunted?"]
+
+
+def _listing_title(rng, category):
+    return f"{rng.choice(ADJECTIVES)} {rng.choice(ITEMS.get(category, ['item']))}"
+
+
+def seed(users=50, listings=2000, bids_per_listing=5, comments_per_listing=3, watchlist_per_user=10,
+         closed_share=0.25, seed=None):
+    """Creates a dataset of the given scale, returns the number of rows created per model.
+
+    Bids and comments per listing vary randomly around the given averages.
+    """
+    rng = random.Random(seed)
+    created = {}
+    categories = [entry.key for entry in registry.all()]
+
+    with transaction.atomic():
+        last_user = User.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(username=f"user{last_user + i}", email=f"user{last_user + i}@example.com", password=password)
+                for i in range(1, users + 1)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(User.objects.filter(pk__gt=last_user).order_by("pk").values_list("pk", flat=True))
+        created["users"] = len(user_ids)
+
+        # bid histories first, the listings store their outcome
+        plans = []
+        for _ in range(listings):
+            seller = rng.choice(user_ids)
+            bidders = [user for user in user_ids if user != seller]
+            price = Decimal(rng.randint(1, 500))
+            bids = []
+            for _ in range(rng.randint(0, 2 * bids_per_listing) if bidders else 0):
+                price += Decimal(rng.randint(1, 2000)) / 100
+                bids.append((rng.choice(bidders), price))
+            plans.append({
+                "seller": seller,
+                "category": rng.choice(categories),
+                "bids": bids,
+                "comments": rng.randint(0, 2 * comments_per_listing),
+                "closed": rng.random() < closed_share,
+            })
+
+        last_listing = Listing.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        Listing.objects.bulk_create(
+            (
+                Listing(
+                    seller_id=plan["seller"],
+                    title=_listing_title(rng, plan["category"]),
+                    description=f"{rng.choice(ADJECTIVES)} and {rng.choice(ADJECTIVES).lower()}, "
+                                f"in {rng.choice(['mint', 'good', 'fair', 'questionable'])} condition.",
+                    current_price=plan["bids"][-1][1] if plan["bids"] else Decimal(rng.randint(1, 500)),
+                    listing_category=plan["category"],
+                    closed=plan["closed"],
+                    highest_bid=plan["bids"][-1][1] if plan["bids"] else None,
+                    highest_bidder_id=plan["bids"][-1][0] if plan["bids"] else None,
+                    winner_id=plan["bids"][-1][0] if plan["bids"] and plan["closed"] else None,
+                    bid_count=len(plan["bids"]),
+                    comment_count=plan["comments"],
+                )
+                for plan in plans
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        listing_ids = list(Listing.objects.filter(pk__gt=last_listing).order_by("pk").values_list("pk", flat=True))
+        created["listings"] = len(listing_ids)
+
+        Bid.objects.bulk_create(
+            (
+                Bid(listing_id=listing_id, bidder_id=bidder, bid_price=price)
+                for listing_id, plan in zip(listing_ids, plans)
+                for bidder, price in plan["bids"]
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        created["bids"] = sum(len(plan["bids"]) for plan in plans)
+
+        Comment.objects.bulk_create(
+            (
+                Comment(comments_listing_id=listing_id, commenter_id=rng.choice(user_ids),
+                        comment=rng.choice(COMMENTS))
+                for listing_id, plan in zip(listing_ids, plans)
+                for _ in range(plan["comments"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        created["comments"] = sum(plan["comments"] for plan in plans)
+
+        sellers = {listing_id: plan["seller"] for listing_id, plan in zip(listing_ids, plans)}
+        watched = {
+            (user, listing_id)
+            for user in user_ids
+            for listing_id in rng.sample(listing_ids, min(watchlist_per_user, len(listing_ids)))
+            if sellers[listing_id] != user
+        }
+        UsersWatchlist.objects.bulk_create(
+            (UsersWatchlist(watchlist_user_id=user, listing_in_watchlist_id=listing_id) for user, listing_id in watched),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        created["watchlist entries"] = len(watched)
+    return created
@@ -0,0 +1,93 @@
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import bump_card_version, bump_feed_version, bump_names_version
+from .categories import invalidate_open_listing_counts, registry
+from .dashboard import forget, listings_created
+from .database import check_connection_health, configure_connection
+from .models import Bid, Category, Comment, Listing, User
+from .search import restore_sqlite_triggers
+from .taskqueue import enqueue
+from .tasks import notify_comment
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, created, **kwargs):
+    if created:
+        listings_created(instance.seller_id)
+    else:
+        bump_card_version(instance.id)
+    invalidate_open_listing_counts()
+
+
+@receiver(pre_delete, sender=Listing)
+def listing_deleting(sender, instance, **kwargs):
+    # the bids go before the listing
+    instance.dashboard_users = {instance.seller_id, instance.winner_id}.union(
+        Bid.objects.filter(listing=instance).values_list("bidder_id", flat=True)
+    ) - {None}
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance, **kwargs):
+    forget(getattr(instance, "dashboard_users", [instance.seller_id]))
+    invalidate_open_listing_counts()
+    bump_feed_version()
+
+
+@receiver(post_save, sender=Bid)
+def bid_saved(sender, instance, **kwargs):
+    if instance.listing_id is not None:
+        bump_card_version(instance.listing_id)
+
+
+# comments are part of the listing page, whose ETag follows updated_at
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    changes = {"updated_at": timezone.now()}
+    if created:
+        changes["comment_count"] = F("comment_count") + 1
+    Listing.objects.filter(pk=instance.comments_listing_id).update(**changes)
+    if created:
+        enqueue(notify_comment, key=f"comment:{instance.id}", comment_id=instance.id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    Listing.objects.filter(pk=instance.comments_listing_id).update(
+        comment_count=F("comment_count") - 1,
+        updated_at=timezone.now(),
+    )
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, **kwargs):
+    registry.invalidate()
+    bump_names_version()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    # a new user has no listings yet, logging in only saves last_login
+    if not created and (update_fields is None or "username" in update_fields):
+        bump_names_version()
+
+
+@receiver(post_migrate)
+def migrated(sender, using, **kwargs):
+    if sender.name == "auctions":
+        restore_sqlite_triggers(using)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    configure_connection(connection)
+
+
+@receiver(request_started)
+def request_starting(sender, **kwargs):
+    check_connection_health()
@@ -0,0 +1,146 @@
+"""
+    Database backed background task queue.
+
+    enqueue(function, key=..., **kwargs) stores a Task row in the caller's
+    transaction, so a task exists exactly when the write that caused it was
+    committed, and costs the request one INSERT however long the task runs.
+    A task with the key of an already enqueued task is not enqueued again.
+
+    The run_tasks command is the worker: it claims due tasks with one
+    conditional UPDATE (several workers never run the same task), runs them in
+    a process pool and records the outcome. A failed task is retried after
+    TASK_QUEUE["RETRY_DELAY"] seconds, doubled after every attempt, until it
+    has failed TASK_QUEUE["MAX_ATTEMPTS"] times. Tasks claimed by a worker that
+    died are picked up again after TASK_QUEUE["STALE_AFTER"] seconds, so a task
+    may run more than once and has to tolerate that.
+
+    With TASK_QUEUE["EAGER"] tasks run right away, inside the enqueuing
+    transaction, for tests and for development without a worker.
+
+    Task functions take JSON serializable keyword arguments and are found by
+    their dotted path, see auctions.tasks.
+"""
+import json
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import workers
+from .models import Task
+
+
+def task_name(function):
+    return f"{function.__module__}.{function.__qualname__}"
+
+
+def enqueue(function, key=None, delay=0, max_attempts=None, **kwargs):
+    """Stores a task running function(**kwargs), unless a task with `key` was enqueued before"""
+    enqueue_many(function, [(key, kwargs)], delay, max_attempts)
+
+
+def enqueue_many(function, calls, delay=0, max_attempts=None):
+    """enqueue() for a list of (key, kwargs) calls of `function`, with one INSERT"""
+    run_after = timezone.now() + timedelta(seconds=delay)
+    tasks = [
+        Task(
+            name=task_name(function),
+            payload=json.dumps(kwargs, cls=DjangoJSONEncoder),
+            key=key,
+            max_attempts=max_attempts or settings.TASK_QUEUE["MAX_ATTEMPTS"],
+            run_after=run_after,
+        )
+        for key, kwargs in calls
+    ]
+    if settings.TASK_QUEUE["EAGER"]:
+        for task in tasks:
+            _run_now(task)
+    elif tasks:
+        # a duplicate key is skipped by the database
+        Task.objects.bulk_create(tasks, ignore_conflicts=True)
+
+
+def _run_now(task):
+    task.status = Task.RUNNING
+    task.attempts = 1
+    task.claimed_at = timezone.now()
+    try:
+        with transaction.atomic():
+            task.save()
+    except IntegrityError:
+        # enqueued before
+        return
+    finish(task, run(task.name, task.payload))
+
+
+def run(name, payload):
+    """Runs a task, returns None or the traceback of its failure"""
+    try:
+        import_string(name)(**json.loads(payload))
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def finish(task, error):
+    """Records the outcome of an attempt of a claimed task"""
+    if error is None:
+        Task.objects.filter(pk=task.pk).update(status=Task.DONE, last_error="")
+    elif task.attempts >= task.max_attempts:
+        Task.objects.filter(pk=task.pk).update(status=Task.FAILED, last_error=error)
+    else:
+        retry_in = settings.TASK_QUEUE["RETRY_DELAY"] * 2 ** (task.attempts - 1)
+        Task.objects.filter(pk=task.pk).update(
+            status=Task.PENDING,
+            run_after=timezone.now() + timedelta(seconds=retry_in),
+            claimed_by="",
+            last_error=error,
+        )
+
+
+def claim(limit):
+    """Marks up to `limit` due tasks as running for this worker and returns them"""
+    current_time = timezone.now()
+    stale = current_time - timedelta(seconds=settings.TASK_QUEUE["STALE_AFTER"])
+    due = Task.objects.filter(
+        Q(status=Task.PENDING, run_after__lte=current_time)
+        | Q(status=Task.RUNNING, claimed_at__lt=stale)
+    )
+    worker = uuid.uuid4().hex
+    with transaction.atomic():
+        ids = list(due.order_by("run_after").values_list("pk", flat=True)[:limit])
+        if not ids:
+            return []
+        # a task claimed by another worker in the meantime no longer matches `due`
+        due.filter(pk__in=ids).update(
+            status=Task.RUNNING,
+            attempts=F("attempts") + 1,
+            claimed_by=worker,
+            claimed_at=current_time,
+        )
+    return list(Task.objects.filter(claimed_by=worker, status=Task.RUNNING))
+
+
+def work(executor=None, limit=50):
+    """Claims and runs one batch of due tasks, in `executor` if given. Returns how many ran."""
+    tasks = claim(limit)
+    if executor is None:
+        outcomes = [run(task.name, task.payload) for task in tasks]
+    else:
+        futures = [executor.submit(workers.run, task.name, task.payload) for task in tasks]
+        outcomes = [future.result() for future in futures]
+    for task, error in zip(tasks, outcomes):
+        finish(task, error)
+    return len(tasks)
+
+
+def purge(older_than):
+    """Deletes tasks finished before `older_than` seconds ago, their keys can be enqueued again"""
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    return Task.objects.filter(status=Task.DONE, created_at__lt=cutoff).delete()[0]
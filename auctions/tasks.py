@@ -0,0 +1,91 @@
+"""
+    Background tasks, enqueued with auctions.taskqueue.enqueue().
+
+    They run after the write that enqueued them has committed, maybe more than
+    once, and quietly skip rows that have been deleted in the meantime.
+"""
+import time
+
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .models import Bid, Comment, Listing, Notification, User, UsersWatchlist
+from .notifications import deliver, notify
+from .taskqueue import enqueue
+
+
+def notify_outbid(bid_id):
+    """Notifies the highest bidder that bid `bid_id` displaced, and the watchers of the listing"""
+    bid = Bid.objects.filter(pk=bid_id).values("listing_id", "bidder_id", "bid_price").first()
+    if bid is None:
+        return
+    listing_id = bid["listing_id"]
+    # the leader before this bid, nobody was outbid if the leader raised their own bid
+    previous_bidder = (
+        Bid.objects
+        .filter(listing_id=listing_id, bid_price__lt=bid["bid_price"])
+        .order_by("-bid_price", "id")
+        .values_list("bidder_id", flat=True)
+        .first()
+    )
+    if previous_bidder == bid["bidder_id"]:
+        previous_bidder = None
+    if previous_bidder is not None:
+        notify(listing_id, Notification.OUTBID, User.objects.filter(pk=previous_bidder).values_list("pk"))
+    watchers = (
+        UsersWatchlist.objects
+        .filter(listing_in_watchlist_id=listing_id)
+        .exclude(watchlist_user_id__in={bid["bidder_id"], previous_bidder} - {None})
+        .values_list("watchlist_user_id")
+    )
+    notify(listing_id, Notification.BID, watchers)
+    schedule_delivery()
+
+
+def notify_auction_closed(listing_id):
+    """Notifies the winner, the seller and the watchers of a closed auction"""
+    listing = Listing.objects.filter(pk=listing_id, closed=True).values("seller_id", "winner_id").first()
+    if listing is None:
+        # deleted or opened again
+        return
+    if listing["winner_id"] is not None:
+        notify(listing_id, Notification.WON, User.objects.filter(pk=listing["winner_id"]).values_list("pk"))
+    notify(listing_id, Notification.CLOSED, User.objects.filter(pk=listing["seller_id"]).values_list("pk"))
+    watchers = (
+        UsersWatchlist.objects
+        .filter(listing_in_watchlist_id=listing_id)
+        .exclude(watchlist_user_id__in={listing["seller_id"], listing["winner_id"]} - {None})
+        .values_list("watchlist_user_id")
+    )
+    notify(listing_id, Notification.CLOSED, watchers)
+    schedule_delivery()
+
+
+def schedule_delivery():
+    """Enqueues deliver_notifications() at the end of the current batch window, once per window"""
+    window = settings.NOTIFICATIONS["BATCH_WINDOW"]
+    if not window:
+        enqueue(deliver_notifications)
+        return
+    current_time = time.time()
+    end = (int(current_time // window) + 1) * window
+    enqueue(deliver_notifications, key=f"deliver_notifications:{end}", delay=end - current_time)
+
+
+def deliver_notifications():
+    deliver()
+
+
+def notify_comment(comment_id):
+    """Tells the seller about a comment on their listing"""
+    comment = Comment.objects.select_related("comments_listing__seller", "commenter").filter(pk=comment_id).first()
+    if comment is None or comment.commenter_id == comment.comments_listing.seller_id:
+        return
+    seller = comment.comments_listing.seller
+    if seller.email:
+        send_mail(
+            f"New comment on {comment.comments_listing.title}",
+            f"{comment.commenter.username} wrote: {comment.comment}",
+            None,
+            [seller.email],
+        )
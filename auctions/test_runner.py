@@ -0,0 +1,36 @@
+"""
+    Test runner of the project (settings.TEST_RUNNER).
+
+    Tests tagged "benchmark" seed 100k rows and more and take most of the
+    suite's time. `manage.py test` leaves them out unless they are asked for
+    with `--tag benchmark`. Figures the benchmarks report() are listed after
+    the run, instead of being printed in the middle of the test output.
+"""
+import sys
+
+from django.test.runner import DiscoverRunner
+
+
+BENCHMARK_TAG = "benchmark"
+
+# (benchmark, figure) of this run
+results = []
+
+
+def report(name, figure):
+    results.append((name, figure))
+
+
+class TestRunner(DiscoverRunner):
+
+    def __init__(self, tags=None, exclude_tags=None, **kwargs):
+        if BENCHMARK_TAG not in (tags or []):
+            exclude_tags = {*(exclude_tags or []), BENCHMARK_TAG}
+        super().__init__(tags=tags, exclude_tags=exclude_tags, **kwargs)
+
+    def suite_result(self, suite, result, **kwargs):
+        if results and self.verbosity > 0:
+            sys.stderr.write("\nBenchmark results:\n")
+            for name, figure in results:
+                sys.stderr.write(f"  {name}: {figure}\n")
+        return super().suite_result(suite, result, **kwargs)
@@ -1,3 +1,2845 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.models import F, Q
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import benchmarking, dashboard, tasks, test_runner, urls
+from .analytics import refresh_category_stats
+from .bidding import (
+    AuctionNotFound, BidRejected, close_auction, close_expired_auctions, find_inconsistent_listings, next_expiry,
+    place_bid, reopen_auction,
+)
+from .models import User, Listing, Bid, Category, CategoryStats, Comment, Notification, Task, UserDashboard, UsersWatchlist
+from .bulk import import_listings
+from .cache_backends import RedisCache
+from .caching import attach_card_versions
+from .categories import open_listing_counts, registry
+from .dashboard import compute, dashboard_for
+from .database import check_connection_health
+from .instrumentation import METRICS, RequestMetricsMiddleware
+from .notifications import deliver
+from .pagination import encode_cursor, keyset_page
+from .realtime import InProcessBroker, RedisBroker, listing_channel, websocket_application
+from .routers import PIN_COOKIE, ReplicaRouter, replica_reads
+from .management.commands.sync_sqlite_replicas import copy_sqlite_database
+from .search import restore_sqlite_triggers, search_listings
+from .views import PANEL_SECTIONS
+from .taskqueue import claim, enqueue, work
+from .test_runner import TestRunner
+from .seeding import PASSWORD, seed
+
+
+def create_listing(seller, **fields):
+    fields.setdefault("title", "Firebolt")
+    fields.setdefault("description", "Fastest broom there is")
+    fields.setdefault("current_price", Decimal("10.00"))
+    return Listing.objects.create(seller=seller, **fields)
+
+
+def query_plan(sql, params=()):
+    """SQLite's EXPLAIN QUERY PLAN steps for a query"""
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def without_savepoints(queries):
+    """SQL of captured queries, without the savepoints that atomic() adds inside a TestCase"""
+    return [
+        query["sql"] for query in queries
+        if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+    ]
+
+
+def run_commit_hooks():
+    """Runs the on_commit() callbacks that the transaction of a TestCase holds back"""
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, callback in callbacks:
+        callback()
+
+
+class FakeClock:
+    """Stand-in for auctions.bidding.now that only moves when told to"""
+
+    def __init__(self):
+        self.time = datetime(2030, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def __call__(self):
+        return self.time
+
+    def advance(self, **kwargs):
+        self.time += timedelta(**kwargs)
+
+
+class QueryPlanAssertions:
+
+    def assertNoFullTableScan(self, sql, params=(), allowed_scans=()):
+        """Every table is SEARCHed, a SCAN (also of a covering index) reads all of it.
+
+        `allowed_scans` names the tables whose scans are expected, e.g. the
+        other side of a join that is read whole anyway.
+        """
+        for step in query_plan(sql, params):
+            if step.startswith("SCAN") and not any(step.split()[1] == table for table in allowed_scans):
+                self.fail(f"Full scan ({step}) in: {sql}")
+
+    def assertSortedByIndex(self, sql, params=()):
+        for step in query_plan(sql, params):
+            if "TEMP B-TREE" in step:
+                self.fail(f"Sort without index ({step}) in: {sql}")
+
+
+########################################################
+###########   BIDDING   ################################
+########################################################
+
+
+class PlaceBidTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = create_listing(self.seller)
+
+    def test_highest_bid_updates_price(self):
+        bid = place_bid(self.listing.id, self.bidder, "12.50")
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, Decimal("12.50"))
+        self.assertEqual(bid.bid_price, Decimal("12.50"))
+        self.assertEqual(list(self.listing.bids.all()), [bid])
+
+    def test_bid_not_above_current_price_is_rejected(self):
+        for amount in ["10.00", "9.99", "-1", "0"]:
+            with self.assertRaises(BidRejected):
+                place_bid(self.listing.id, self.bidder, amount)
+        self.assertEqual(Bid.objects.count(), 0)
+
+    def test_amounts_the_price_columns_cannot_hold_are_rejected(self):
+        for amount in ["NaN", "Infinity", "abc", "99999999999", 1e12, "99999999.999"]:
+            with self.subTest(amount=amount), self.assertRaises(BidRejected):
+                place_bid(self.listing.id, self.bidder, amount)
+        place_bid(self.listing.id, self.bidder, "99999999.99")
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_missing_auction_has_its_own_rejection(self):
+        with self.assertRaises(AuctionNotFound):
+            place_bid(0, self.bidder, "20")
+
+    def test_seller_cannot_bid(self):
+        with self.assertRaisesMessage(BidRejected, "own auction"):
+            place_bid(self.listing.id, self.seller, "20")
+
+    def test_closed_auction_rejects_bids(self):
+        Listing.objects.filter(pk=self.listing.id).update(closed=True)
+        with self.assertRaisesMessage(BidRejected, "closed"):
+            place_bid(self.listing.id, self.bidder, "20")
+
+    def test_bid_form_on_listing_page(self):
+        self.client.force_login(self.bidder)
+        url = reverse("auctions:bid", args=[self.listing.id])
+
+        response = self.client.post(url, {"bid_price": "11"}, follow=True)
+        self.assertRedirects(response, reverse("auctions:listing_page", args=[self.listing.id]))
+        self.assertContains(response, "successfully made the highest bid")
+
+        response = self.client.post(url, {"bid_price": "11"}, follow=True)
+        self.assertContains(response, "has to be more than current price")
+        self.assertEqual(Bid.objects.count(), 1)
+
+
+class ListingActionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.user = User.objects.create_user("user", "user@example.com", "password")
+        cls.listing = create_listing(cls.seller)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, url_name, data=None, listing=None):
+        listing_id = (listing or self.listing).id
+        return self.client.post(reverse(f"auctions:{url_name}", args=[listing_id]), data or {}, follow=True)
+
+    def test_only_posts_change_anything(self):
+        self.assertEqual(self.client.get(reverse("auctions:watch", args=[self.listing.id])).status_code, 405)
+        self.assertEqual(
+            self.client.post(reverse("auctions:listing_page", args=[self.listing.id])).status_code, 405)
+
+        self.client.logout()
+        response = self.client.post(reverse("auctions:watch", args=[self.listing.id]))
+        self.assertTrue(response.url.startswith(reverse("auctions:login")))
+        self.assertFalse(UsersWatchlist.objects.exists())
+
+    def test_watch_and_unwatch(self):
+        self.post("watch")
+        response = self.post("watch")
+        self.assertContains(response, "Remove from Watchlist")
+        self.assertEqual(UsersWatchlist.objects.count(), 1)
+
+        response = self.post("unwatch")
+        self.assertContains(response, "Add to Watchlist")
+        self.assertFalse(UsersWatchlist.objects.exists())
+
+        self.client.force_login(self.seller)
+        self.assertContains(self.post("watch"), "cannot watch your own auction")
+
+    def test_comment(self):
+        response = self.post("comment", {"comment": "Is it fast?"})
+        self.assertContains(response, "Is it fast?")
+
+        Listing.objects.filter(pk=self.listing.id).update(closed=True)
+        self.assertContains(self.post("comment", {"comment": "Too late"}), "has been closed")
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_only_the_seller_can_close_and_reopen(self):
+        self.assertContains(self.post("close"), "Only the seller can close")
+        self.assertFalse(Listing.objects.get(pk=self.listing.id).closed)
+
+        self.client.force_login(self.seller)
+        self.assertContains(self.post("close"), "has been closed")
+        self.assertTrue(Listing.objects.get(pk=self.listing.id).closed)
+        self.assertContains(self.post("reopen"), "opened again")
+        self.assertFalse(Listing.objects.get(pk=self.listing.id).closed)
+
+    def test_missing_listing(self):
+        missing = Listing(id=self.listing.id + 1)
+        self.assertEqual(self.post("comment", {"comment": "Hi"}, listing=missing).status_code, 404)
+        self.assertEqual(self.post("watch", listing=missing).status_code, 404)
+
+
+class CommentThreadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.user = User.objects.create_user("user", "user@example.com", "password")
+        cls.listing = create_listing(cls.seller)
+        for i in range(45):
+            Comment.objects.create(comments_listing=cls.listing, commenter=cls.user, comment=f"Comment {i}")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def comments(self, response):
+        return [comment.comment for comment in response.context["comments"]]
+
+    def test_newest_page_first_and_older_pages_on_demand(self):
+        response = self.client.get(reverse("auctions:listing_page", args=[self.listing.id]))
+        self.assertContains(response, "45 comment(s)")
+        self.assertEqual(self.comments(response), [f"Comment {i}" for i in range(44, 24, -1)])
+
+        next_url = response.context["comments"].next_url
+        self.assertTrue(next_url.startswith(reverse("auctions:listing_comments", args=[self.listing.id])))
+        response = self.client.get(next_url)
+        self.assertEqual(self.comments(response), [f"Comment {i}" for i in range(24, 4, -1)])
+
+        response = self.client.get(response.context["comments"].next_url)
+        self.assertEqual(self.comments(response), [f"Comment {i}" for i in range(4, -1, -1)])
+        self.assertNotContains(response, "Older comments")
+
+    def test_count_follows_comments(self):
+        Comment.objects.filter(comment="Comment 0").get().delete()
+        Comment.objects.create(comments_listing=self.listing, commenter=self.seller, comment="New")
+        Comment.objects.create(comments_listing=self.listing, commenter=self.seller, comment="Newer")
+        self.assertEqual(Listing.objects.get(pk=self.listing.id).comment_count, 46)
+
+    def test_render_cost_does_not_grow_with_comments(self):
+        url = reverse("auctions:listing_page", args=[self.listing.id])
+        quiet = create_listing(self.seller)
+        Comment.objects.create(comments_listing=quiet, commenter=self.user, comment="Only one")
+
+        with CaptureQueriesContext(connection) as busy_queries:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as quiet_queries:
+            self.client.get(reverse("auctions:listing_page", args=[quiet.id]))
+        self.assertEqual(len(busy_queries), len(quiet_queries))
+
+
+class BidStatsTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        self.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        self.listing = create_listing(self.seller)
+
+    def test_bids_maintain_stats(self):
+        place_bid(self.listing.id, self.alice, "11")
+        place_bid(self.listing.id, self.bob, "12")
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.highest_bid, Decimal("12"))
+        self.assertEqual(self.listing.highest_bidder, self.bob)
+        self.assertEqual(self.listing.bid_count, 2)
+        self.assertEqual(list(find_inconsistent_listings()), [])
+
+    def test_close_picks_highest_bidder_and_reopen_clears_winner(self):
+        place_bid(self.listing.id, self.alice, "11")
+        close_auction(self.listing.id)
+        self.listing.refresh_from_db()
+        self.assertTrue(self.listing.closed)
+        self.assertEqual(self.listing.winner, self.alice)
+
+        reopen_auction(self.listing.id)
+        self.listing.refresh_from_db()
+        self.assertFalse(self.listing.closed)
+        self.assertIsNone(self.listing.winner)
+
+    def test_backfill_command_repairs_drift(self):
+        place_bid(self.listing.id, self.alice, "11")
+        Listing.objects.update(highest_bid=None, highest_bidder=None, bid_count=0)
+
+        with self.assertRaises(CommandError):
+            call_command("backfill_bid_stats", "--check", stdout=StringIO())
+        call_command("backfill_bid_stats", stdout=StringIO())
+        call_command("backfill_bid_stats", "--check", stdout=StringIO())
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.highest_bidder, self.alice)
+        self.assertEqual(self.listing.bid_count, 1)
+
+    def test_listing_page_does_not_query_bids(self):
+        place_bid(self.listing.id, self.alice, "11")
+        self.client.force_login(self.bob)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("auctions:listing_page", args=[self.listing.id]))
+
+        self.assertContains(response, "Highest bid made by alice")
+        self.assertContains(response, "1 bid(s) so far")
+        for query in queries:
+            self.assertNotIn("auctions_bid", query["sql"])
+
+
+class BidListingTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = create_listing(self.seller)
+        create_listing(self.seller, title="Nimbus 2000")
+
+    def test_bids_belong_to_their_listing(self):
+        place_bid(self.listing.id, self.bidder, "11")
+        place_bid(self.listing.id, self.bidder, "12")
+
+        self.assertEqual(self.listing.bids.count(), 2)
+        self.assertEqual(self.listing.bids.order_by("-bid_price").first().bid_price, Decimal("12"))
+
+    def test_user_panel_lists_bidding_listing_once(self):
+        place_bid(self.listing.id, self.bidder, "11")
+        place_bid(self.listing.id, self.bidder, "12")
+        self.client.force_login(self.bidder)
+
+        response = self.client.get(reverse("auctions:user_panel_section", args=["bidding"]))
+        self.assertEqual(list(response.context["listings"]), [self.listing])
+
+
+class ConcurrentBiddingTests(TransactionTestCase):
+    """Many threads bid the same amount at the same time, only one may win each level"""
+
+    threads = 8
+    price_levels = 10
+    min_bids_per_second = 50
+
+    def setUp(self):
+        seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidders = [
+            User.objects.create_user(f"bidder{i}", f"bidder{i}@example.com", "password")
+            for i in range(self.threads)
+        ]
+        self.listing = create_listing(seller, current_price=Decimal("1.00"))
+
+    def run_bidders(self):
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def bid(bidder):
+            try:
+                for level in range(2, self.price_levels + 2):
+                    barrier.wait()
+                    try:
+                        place_bid(self.listing.id, bidder, level)
+                    except BidRejected:
+                        pass
+            except Exception as error:
+                errors.append(error)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=bid, args=(bidder,)) for bidder in self.bidders]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        return time.perf_counter() - start
+
+    def test_exactly_one_winner_per_price_level(self):
+        self.run_bidders()
+
+        prices = list(Bid.objects.order_by("id").values_list("bid_price", flat=True))
+        self.assertEqual(prices, [Decimal(level) for level in range(2, self.price_levels + 2)])
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_price, Decimal(self.price_levels + 1))
+        self.assertEqual(self.listing.bids.count(), self.price_levels)
+
+    @tag("benchmark")
+    def test_bid_throughput(self):
+        elapsed = self.run_bidders()
+        self.assertEqual(self.listing.bids.count(), self.price_levels)
+        bids_per_second = self.threads * self.price_levels / elapsed
+        test_runner.report("concurrent bid attempts", f"{bids_per_second:.0f}/s")
+        # about 150/s with the tuned SQLite settings on a development machine
+        self.assertGreater(bids_per_second, self.min_bids_per_second)
+
+
+########################################################
+###########   DATABASE CONFIGURATION   #################
+########################################################
+
+
+class DatabaseConfigurationTests(TestCase):
+
+    def sqlite_connection(self, directory, mode):
+        settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, "db.sqlite3"), SQLITE_MODE=mode)
+        return SQLiteDatabaseWrapper(settings_dict)
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite PRAGMAs")
+    def test_sqlite_modes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tuned = self.sqlite_connection(directory, "tuned")
+            self.assertEqual(self.pragma(tuned, "journal_mode"), "wal")
+            self.assertEqual(self.pragma(tuned, "synchronous"), 1)
+            self.assertEqual(self.pragma(tuned, "busy_timeout"), 5000)
+            self.assertEqual(self.pragma(tuned, "mmap_size"), 256 * 1024 * 1024)
+            tuned.close()
+
+            # WAL is stored in the file, the default mode has to turn it off again
+            default = self.sqlite_connection(directory, "default")
+            self.assertEqual(self.pragma(default, "journal_mode"), "delete")
+            self.assertEqual(self.pragma(default, "synchronous"), 2)
+            default.close()
+
+    def test_health_check_replaces_broken_connections(self):
+        connection.ensure_connection()
+        with mock.patch.dict(connection.settings_dict, CONN_HEALTH_CHECKS=True), \
+                mock.patch.object(connection, "is_usable", return_value=False), \
+                mock.patch.object(connection, "close") as close:
+            check_connection_health()
+        close.assert_called_once_with()
+
+    def test_health_check_is_opt_in(self):
+        connection.ensure_connection()
+        with mock.patch.object(connection, "is_usable") as is_usable:
+            check_connection_health()
+        is_usable.assert_not_called()
+
+
+@override_settings(REPLICA_DATABASES=["replica1"], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.buyer = User.objects.create_user("buyer", "buyer@example.com", "password")
+        cls.listing = create_listing(cls.seller)
+        UsersWatchlist.objects.create(watchlist_user=cls.buyer, listing_in_watchlist=cls.listing)
+
+    def setUp(self):
+        cache.clear()
+
+    def replica_reads(self, method, url, **kwargs):
+        """Requests `url`, returns the response and the models the router sent to a replica"""
+        routed = set()
+        route = ReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            if route(router, model, **hints) == "replica1":
+                routed.add(model._meta.model_name)
+            # there is no replica1 database in the tests, read from the primary
+            return None
+
+        with mock.patch.object(ReplicaRouter, "db_for_read", spy):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, routed
+
+    def test_browse_pages_read_from_replicas(self):
+        for url in [reverse("auctions:index"), reverse("auctions:categories"),
+                    reverse("auctions:listings_in_category", args=[registry.get_by_key(Listing.B).slug]),
+                    reverse("auctions:listing_page", args=[self.listing.id])]:
+            response, routed = self.replica_reads("get", url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("listing", routed, url)
+
+        self.client.force_login(self.buyer)
+        response, routed = self.replica_reads("get", reverse("auctions:watchlist"))
+        self.assertContains(response, self.listing.title)
+        self.assertEqual(routed, {"listing"})
+
+    def test_users_and_sessions_stay_on_primary(self):
+        self.client.force_login(self.buyer)
+        response, routed = self.replica_reads("get", reverse("auctions:index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("user", routed)
+        self.assertNotIn("session", routed)
+
+        # logged in users see their own bids and watchlist on listing pages
+        response, routed = self.replica_reads("get", reverse("auctions:listing_page", args=[self.listing.id]))
+        self.assertEqual(routed, set())
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.force_login(self.buyer)
+        response, routed = self.replica_reads("post", reverse("auctions:bid", args=[self.listing.id]),
+                                              data={"bid_price": "20"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 5)
+
+        response, routed = self.replica_reads("get", reverse("auctions:watchlist"))
+        self.assertEqual(routed, set())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        self.client.cookies[PIN_COOKIE] = str(time.time() - 1)
+        response, routed = self.replica_reads("get", reverse("auctions:watchlist"))
+        self.assertEqual(routed, {"listing"})
+
+    def test_reads_after_a_write_in_the_same_request_use_the_primary(self):
+        router = ReplicaRouter()
+        view = replica_reads()(lambda request: [
+            router.db_for_read(Listing), router.db_for_read(User), router.db_for_write(Bid), router.db_for_read(Listing),
+        ])
+        # a fresh context, like a request's, the test's own setup wrote already
+        self.assertEqual(contextvars.Context().run(view, None), ["replica1", None, "default", None])
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.client.force_login(self.buyer)
+        response, routed = self.replica_reads("post", reverse("auctions:bid", args=[self.listing.id]),
+                                              data={"bid_price": "20"})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        response, routed = self.replica_reads("get", reverse("auctions:watchlist"))
+        self.assertEqual(routed, set())
+
+    def test_copy_sqlite_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = os.path.join(directory, "primary.sqlite3"), os.path.join(directory, "replica.sqlite3")
+            with sqlite3.connect(primary) as database:
+                database.execute("CREATE TABLE bids (amount)")
+                database.execute("INSERT INTO bids VALUES (12)")
+            database.close()
+
+            copy_sqlite_database(primary, replica)
+            with sqlite3.connect(replica) as database:
+                self.assertEqual(database.execute("SELECT amount FROM bids").fetchall(), [(12,)])
+            database.close()
+
+
+class ConcurrentWritersBenchmarkTests(TransactionTestCase):
+
+    def test_command_reports_each_sqlite_mode_and_cleans_up(self):
+        out = StringIO()
+        call_command("benchmark_bids", "--writers", "2", "--bids", "5", "--listings", "1", stdout=out)
+
+        lines = out.getvalue().splitlines()
+        if connection.vendor == "sqlite":
+            self.assertEqual([line.split(":")[0] for line in lines], ["sqlite default", "sqlite tuned"])
+        self.assertIn("10 bids from 2 writers", lines[0])
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Listing.objects.exists())
+        self.assertFalse(Task.objects.exists())
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite modes")
+    def test_unknown_sqlite_mode(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_bids", "--sqlite-modes", "fast", stdout=StringIO())
+
+
+########################################################
+###########   AUCTION EXPIRY   #########################
+########################################################
+
+
+@override_settings(AUCTION_SNIPING_WINDOW=300)
+class AuctionExpiryTests(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("auctions.bidding.now", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+
+    def ending_in(self, **kwargs):
+        return create_listing(self.seller, end_time=self.clock() + timedelta(**kwargs))
+
+    def test_ended_auction_rejects_bids(self):
+        listing = self.ending_in(minutes=30)
+        place_bid(listing.id, self.bidder, "11")
+
+        self.clock.advance(minutes=30)
+        with self.assertRaisesMessage(BidRejected, "This auction has ended"):
+            place_bid(listing.id, self.bidder, "12")
+
+    def test_last_minute_bid_extends_the_auction(self):
+        listing = self.ending_in(minutes=30)
+        place_bid(listing.id, self.bidder, "11")
+        listing.refresh_from_db()
+        self.assertEqual(listing.end_time, self.clock() + timedelta(minutes=30))
+
+        self.clock.advance(minutes=28)
+        place_bid(listing.id, self.bidder, "12")
+        listing.refresh_from_db()
+        self.assertEqual(listing.end_time, self.clock() + timedelta(minutes=5))
+
+    @override_settings(AUCTION_SNIPING_WINDOW=0)
+    def test_extension_can_be_turned_off(self):
+        listing = self.ending_in(minutes=1)
+        place_bid(listing.id, self.bidder, "11")
+        listing.refresh_from_db()
+        self.assertEqual(listing.end_time, self.clock() + timedelta(minutes=1))
+
+    def test_expired_auctions_are_closed_with_their_winner(self):
+        with_bids = self.ending_in(minutes=10)
+        without_bids = self.ending_in(minutes=20)
+        running = self.ending_in(hours=1)
+        no_end = create_listing(self.seller)
+        place_bid(with_bids.id, self.bidder, "11")
+        self.assertEqual(next_expiry(), self.clock() + timedelta(minutes=10))
+
+        self.clock.advance(minutes=30)
+        self.assertEqual(close_expired_auctions(batch_size=1), 2)
+        self.assertEqual(close_expired_auctions(), 0)
+
+        closed = dict(Listing.objects.filter(closed=True).values_list("pk", "winner"))
+        self.assertEqual(closed, {with_bids.id: self.bidder.id, without_bids.id: None})
+        self.assertEqual(next_expiry(), running.end_time)
+        self.assertFalse(Listing.objects.get(pk=no_end.id).closed)
+
+    def test_auctions_closed_meanwhile_are_not_announced_again(self):
+        dashboard_for(self.seller)
+        listing = self.ending_in(minutes=1)
+        self.ending_in(minutes=2)
+        self.clock.advance(minutes=5)
+        real_now = timezone.now
+        seller_closed = []
+
+        def now():
+            # the seller closes one of the picked auctions before the expiry UPDATE runs
+            if not seller_closed:
+                seller_closed.append(None)
+                seller_closed[0] = close_auction(listing.id)
+            return real_now()
+
+        with mock.patch("auctions.bidding.timezone.now", side_effect=now), \
+                mock.patch("auctions.bidding.publish_listing_event") as publish:
+            self.assertEqual(close_expired_auctions(), 1)
+        self.assertEqual(seller_closed, [1])
+        self.assertEqual(publish.call_count, 2)
+        self.assertEqual(UserDashboard.objects.get(user=self.seller).sold_count, compute(self.seller.id).sold_count)
+
+    def test_batches_do_not_query_per_listing(self):
+        for minutes in range(1, 31):
+            self.ending_in(minutes=minutes)
+        self.clock.advance(hours=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(close_expired_auctions(batch_size=10), 30)
+        # per batch: pick the due ids, close them, read the winners, enqueue the e-mails,
+        # update the sellers', winners' and bidders' dashboards; one more to find none left
+        self.assertEqual(len(without_savepoints(queries)), 3 * 7 + 1)
+
+    def test_command(self):
+        self.ending_in(minutes=1)
+        self.clock.advance(minutes=2)
+        out = StringIO()
+        call_command("close_expired_auctions", stdout=out)
+        self.assertIn("Closed 1 expired auction(s)", out.getvalue())
+
+    def test_listing_form_rejects_past_end_time(self):
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse("auctions:add_listing"), {
+            "title": "Nimbus", "current_price": "5", "description": "Broom",
+            "listing_category": Listing.B, "end_time": "2000-01-01T12:00",
+        })
+        self.assertContains(response, "has to end in the future")
+        self.assertFalse(Listing.objects.filter(title="Nimbus").exists())
+
+
+@tag("benchmark")
+class AuctionExpiryBenchmark(QueryPlanAssertions, TestCase):
+
+    listings = 100_000
+    expiring = 5000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.clock = FakeClock()
+        seller = User.objects.create_user("seller", "seller@example.com", "password")
+        # most auctions end later or never, `expiring` of them end at the same moment
+        Listing.objects.bulk_create(
+            Listing(
+                seller=seller, title=f"Listing {i}", description="", current_price=1,
+                end_time=cls.clock() + timedelta(days=1 + i % 30) if i % 2 else None,
+            )
+            for i in range(cls.listings)
+        )
+        Listing.objects.filter(pk__in=Listing.objects.filter(end_time__isnull=True).values("pk")[:cls.expiring]) \
+            .update(end_time=cls.clock.time)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    @tag("benchmark")
+    def test_simultaneous_expiries(self):
+        self.clock.advance(seconds=1)
+        with mock.patch("auctions.bidding.now", self.clock):
+            with CaptureQueriesContext(connection) as queries:
+                closed = close_expired_auctions()
+
+        statements = without_savepoints(queries)
+        self.assertEqual(closed, self.expiring)
+        # 12 statements per batch of 500 however many listings there are,
+        # and the due query that finds no more
+        self.assertEqual(len(statements), self.expiring // 500 * 12 + 1)
+        due_query = statements[0]
+        self.assertIn("listing_open_end_idx", " ".join(query_plan(due_query)))
+        self.assertSortedByIndex(due_query)
+
+
+########################################################
+###########   PAGINATION   #############################
+########################################################
+
+
+class KeysetPaginationTests(QueryPlanAssertions, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        Listing.objects.bulk_create(
+            Listing(seller=cls.seller, title=f"Listing {i}", description="", current_price=1)
+            for i in range(50)
+        )
+        # a block of listings published at the very same moment
+        Listing.objects.filter(pk__lte=20).update(publication_date=Listing.objects.get(pk=1).publication_date)
+
+    def setUp(self):
+        # anonymous pages are cached
+        cache.clear()
+
+    def test_walking_pages_returns_every_listing_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_page(Listing.objects.all(), cursor, per_page=7)
+            seen.extend(listing.id for listing in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        expected = Listing.objects.order_by("-publication_date", "-id").values_list("id", flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_index_links_to_next_page(self):
+        response = self.client.get(reverse("auctions:index"))
+        page = response.context["listings"]
+        self.assertEqual(len(page), 24)
+        self.assertContains(response, f"?cursor={page.next_cursor}")
+
+        response = self.client.get(reverse("auctions:index"), {"cursor": page.next_cursor})
+        self.assertEqual(len(response.context["listings"]), 24)
+        self.assertNotIn(page.items[0], response.context["listings"].items)
+
+    def test_broken_cursor_is_bad_request(self):
+        response = self.client.get(reverse("auctions:index"), {"cursor": "broken"})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+    def test_next_page_is_index_seek(self):
+        listing = Listing.objects.get(pk=30)
+        cursor = encode_cursor(listing.publication_date, listing.pk)
+        queryset = Listing.objects.filter(closed=False)
+        with CaptureQueriesContext(connection) as queries:
+            keyset_page(queryset, cursor)
+
+        sql = queries[0]["sql"]
+        self.assertNotIn("OFFSET", sql)
+        self.assertNoFullTableScan(sql)
+        self.assertSortedByIndex(sql)
+
+
+@tag("benchmark")
+class KeysetPaginationBenchmark(TestCase):
+
+    pages = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("seller", "seller@example.com", "password")
+        Listing.objects.bulk_create(
+            Listing(seller=seller, title=f"Listing {i}", description="", current_price=1)
+            for i in range((cls.pages + 1) * 24)
+        )
+
+    def time_page(self, cursor, repeat=20):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            keyset_page(Listing.objects.filter(closed=False), cursor)
+        return (time.perf_counter() - start) / repeat
+
+    @tag("benchmark")
+    def test_deep_page_costs_the_same_as_first_page(self):
+        deep = Listing.objects.order_by("-publication_date", "-id")[(self.pages - 1) * 24 - 1]
+        first_page = self.time_page(None)
+        deep_page = self.time_page(encode_cursor(deep.publication_date, deep.pk))
+
+        self.assertLess(deep_page, first_page * 3)
+
+
+########################################################
+###########   CARD CACHE   #############################
+########################################################
+
+
+class ListingCardCacheTests(TransactionTestCase):
+    """Card fragments stay cached until the listing's version is bumped"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = create_listing(self.seller, title="Firebolt")
+        # logged in, so whole pages are not cached
+        self.client.force_login(self.bidder)
+
+    def render_index(self):
+        return self.client.get(reverse("auctions:index")).content.decode()
+
+    def test_card_is_served_from_cache(self):
+        self.render_index()
+        # a write that bypasses every mutation path is not picked up
+        Listing.objects.filter(pk=self.listing.id).update(title="Nimbus")
+        self.assertIn("Firebolt", self.render_index())
+
+    def test_edit_invalidates_card(self):
+        self.render_index()
+        self.listing.title = "Nimbus"
+        self.listing.save()
+        self.assertIn("Nimbus", self.render_index())
+
+    def test_renames_invalidate_card(self):
+        self.render_index()
+        self.addCleanup(registry.invalidate)
+        Category.objects.create(key=self.listing.listing_category, label="Racing Brooms")
+        self.seller.username = "ollivander"
+        self.seller.save()
+        page = self.render_index()
+        self.assertIn("Racing Brooms", page)
+        self.assertIn("ollivander", page)
+
+    def test_bid_and_close_invalidate_card(self):
+        self.render_index()
+        place_bid(self.listing.id, self.bidder, "15")
+        self.assertIn("15.00", self.render_index())
+
+        close_auction(self.listing.id)
+        reopen_auction(self.listing.id)
+        place_bid(self.listing.id, self.bidder, "16")
+        self.assertIn("16.00", self.render_index())
+
+    @tag("benchmark")
+    def test_cold_and_warm_render_of_500_cards(self):
+        Listing.objects.bulk_create(
+            Listing(seller=self.seller, title=f"Listing {i}", description="A" * 200, current_price=i)
+            for i in range(500)
+        )
+        listings = attach_card_versions(list(Listing.objects.select_related("seller")))
+
+        def render():
+            start = time.perf_counter()
+            render_to_string("auctions/partials/listings_group.html", {"listings": listings})
+            return time.perf_counter() - start
+
+        cold = render()
+        warm = min(render() for _ in range(5))
+        self.assertLess(warm, cold)
+
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class RedisCacheBackendTests(TestCase):
+
+    def setUp(self):
+        self.cache = RedisCache("redis://localhost:6379/0", {
+            "OPTIONS": {"CLIENT_CLASS": "fakeredis.FakeRedis"},
+        })
+        self.cache.clear()
+
+    def test_values_round_trip(self):
+        self.cache.set("listing", {"title": "Firebolt"})
+        self.cache.set_many({"a": 1, "b": [2]})
+
+        self.assertEqual(self.cache.get("listing"), {"title": "Firebolt"})
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]), {"a": 1, "b": [2]})
+        self.assertIsNone(self.cache.get("missing"))
+
+    def test_add_delete_and_expiry(self):
+        self.assertTrue(self.cache.add("key", "first"))
+        self.assertFalse(self.cache.add("key", "second"))
+        self.assertEqual(self.cache.get("key"), "first")
+
+        self.cache.delete("key")
+        self.assertFalse(self.cache.has_key("key"))
+
+        self.cache.set("gone", "value", 0)
+        self.assertIsNone(self.cache.get("gone"))
+
+    def test_incr(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr("counter")
+        self.cache.set("counter", 1, None)
+        self.assertEqual(self.cache.incr("counter"), 2)
+        self.assertEqual(self.cache.get("counter"), 2)
+
+
+class ConditionalGetTests(QueryPlanAssertions, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.user = User.objects.create_user("user", "user@example.com", "password")
+        cls.listing = create_listing(cls.seller, listing_category=Listing.C)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def etag(self, url):
+        # the first page sets the CSRF cookie, which is part of the ETag
+        if settings.CSRF_COOKIE_NAME not in self.client.cookies:
+            self.client.get(url)
+        return self.client.get(url)["ETag"]
+
+    def assertNotModified(self, url, etag):
+        with mock.patch("auctions.views.render") as render:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        render.assert_not_called()
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_unchanged_pages_are_not_rendered(self):
+        for url in [
+            reverse("auctions:index"),
+            reverse("auctions:listings_in_category", args=["wands"]),
+            reverse("auctions:listing_page", args=[self.listing.id]),
+        ]:
+            with self.subTest(url=url):
+                self.assertNotModified(url, self.etag(url))
+
+    def test_listing_page_changes(self):
+        url = reverse("auctions:listing_page", args=[self.listing.id])
+        etag = self.etag(url)
+
+        place_bid(self.listing.id, self.user, "20")
+        etag = self.assertModified(url, etag)
+        Comment.objects.create(comments_listing=self.listing, commenter=self.user, comment="Hi")
+        etag = self.assertModified(url, etag)
+        UsersWatchlist.objects.create(watchlist_user=self.user, listing_in_watchlist=self.listing)
+        etag = self.assertModified(url, etag)
+        close_auction(self.listing.id)
+        etag = self.assertModified(url, etag)
+
+        self.client.force_login(self.seller)
+        self.assertModified(url, etag)
+
+    def test_feed_changes(self):
+        url = reverse("auctions:index")
+        etag = self.etag(url)
+
+        other = create_listing(self.seller)
+        etag = self.assertModified(url, etag)
+        close_auction(other.id)
+        etag = self.assertModified(url, etag)
+        other.delete()
+        run_commit_hooks()
+        etag = self.assertModified(url, etag)
+        self.assertNotModified(url, etag)
+
+    def test_renames_change_etags(self):
+        urls = [reverse("auctions:index"), reverse("auctions:listing_page", args=[self.listing.id])]
+        etags = [self.etag(url) for url in urls]
+        # the registry keeps the label after the test's transaction is rolled back
+        self.addCleanup(registry.invalidate)
+        Category.objects.create(key=Listing.C, label="Elder Wands")
+        run_commit_hooks()
+        etags = [self.assertModified(url, etag) for url, etag in zip(urls, etags)]
+
+        self.seller.username = "ollivander"
+        self.seller.save()
+        run_commit_hooks()
+        etags = [self.assertModified(url, etag) for url, etag in zip(urls, etags)]
+
+        # logging in only saves last_login
+        self.client.login(username="user", password="password")
+        run_commit_hooks()
+        for url, etag in zip(urls, etags):
+            self.assertNotModified(url, etag)
+
+    def test_new_csrf_token_changes_etag(self):
+        url = reverse("auctions:listing_page", args=[self.listing.id])
+        etag = self.etag(url)
+        # logging in again rotates the token the page's forms carry
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "a" * 64
+        etag = self.assertModified(url, etag)
+        self.assertNotModified(url, etag)
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+    def test_feed_etag_is_one_index_seek(self):
+        url = reverse("auctions:listings_in_category", args=["wands"])
+        etag = self.etag(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        sql, = [sql for sql in without_savepoints(queries) if "MAX" in sql]
+        self.assertNotIn("COUNT", sql)
+        self.assertNoFullTableScan(sql)
+
+    def test_pending_messages_are_rendered(self):
+        url = reverse("auctions:listing_page", args=[self.listing.id])
+        etag = self.etag(url)
+        # a rejected bid changes nothing but leaves a message
+        self.client.post(reverse("auctions:bid", args=[self.listing.id]), {"bid_price": "1"})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "has to be more than current price")
+
+    def test_cached_anonymous_pages(self):
+        self.client.logout()
+        url = reverse("auctions:listing_page", args=[self.listing.id])
+        etag = self.etag(url)
+        # served from the page cache, the middleware compares the stored ETag
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class AnonymousPageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("user", "user@example.com", "password")
+        cls.listing = create_listing(cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_served_from_cache(self):
+        for url in [
+            reverse("auctions:index"),
+            reverse("auctions:categories"),
+            reverse("auctions:listings_in_category", args=["brooms"]),
+            reverse("auctions:listing_page", args=[self.listing.id]),
+        ]:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.content, second.content)
+            self.assertNotIn("csrfmiddlewaretoken", second.content.decode())
+            self.assertIn("Cookie", second["Vary"])
+
+    def test_logged_in_users_never_get_cached_pages(self):
+        self.client.get(reverse("auctions:index"))
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("auctions:index"))
+        self.assertContains(response, "Signed in as <strong>user</strong>")
+        self.assertIn("private", response["Cache-Control"])
+
+    @override_settings(ANONYMOUS_CACHE_TIMEOUTS={})
+    def test_policy_can_turn_caching_off(self):
+        self.client.get(reverse("auctions:index"))
+        # the ETag and both feeds
+        with self.assertNumQueries(3):
+            self.client.get(reverse("auctions:index"))
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_pages_are_shared_through_redis(self):
+        redis = {
+            "BACKEND": "auctions.cache_backends.RedisCache",
+            "LOCATION": "redis://localhost:6379/1",
+            "OPTIONS": {"CLIENT_CLASS": "fakeredis.FakeRedis"},
+        }
+        with override_settings(CACHES={"default": redis}):
+            cache.clear()
+            self.client.get(reverse("auctions:index"))
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse("auctions:index"))
+        self.assertContains(response, "Firebolt")
+
+
+########################################################
+###########   CATEGORIES   #############################
+########################################################
+
+
+class CategoryRegistryTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        registry.invalidate()
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def test_builtin_slugs(self):
+        self.assertEqual(registry.get_by_slug("magical-books").key, Listing.D)
+        self.assertEqual(registry.label(Listing.D), "Magical Books")
+
+    def test_unknown_slug_is_not_found(self):
+        response = self.client.get("/categories/quidditch/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_database_category(self):
+        Category.objects.create(key="POTIONS", label="Potions")
+        self.client.force_login(self.seller)
+
+        response = self.client.post(reverse("auctions:add_listing"), {
+            "title": "Felix Felicis", "current_price": "100", "description": "Liquid luck",
+            "listing_category": "POTIONS", "image_url": "",
+        })
+        self.assertRedirects(response, reverse("auctions:user_listings"))
+
+        response = self.client.get(reverse("auctions:listings_in_category", args=["potions"]))
+        self.assertEqual(response.context["category"], "Potions")
+        self.assertContains(response, "Felix Felicis")
+
+    def test_model_validation(self):
+        listing = Listing(seller=self.seller, title="Felix Felicis", description="Liquid luck",
+                          current_price=100, listing_category="POTIONS")
+        with self.assertRaises(ValidationError) as raised:
+            listing.full_clean()
+        self.assertEqual(list(raised.exception.message_dict), ["listing_category"])
+
+        Category.objects.create(key="POTIONS", label="Potions")
+        listing.full_clean()
+
+    def test_open_listing_counts_follow_listings(self):
+        create_listing(self.seller, listing_category=Listing.C)
+        listing = create_listing(self.seller, listing_category=Listing.C)
+        self.assertEqual(open_listing_counts()[Listing.C], 2)
+
+        close_auction(listing.id)
+        self.assertEqual(open_listing_counts()[Listing.C], 1)
+
+        response = self.client.get(reverse("auctions:categories"))
+        self.assertContains(response, "1 open listing(s)")
+
+
+########################################################
+###########   SEARCH   #################################
+########################################################
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.firebolt = create_listing(cls.seller, title="Firebolt broom", description="International standard")
+        cls.nimbus = create_listing(
+            cls.seller, title="Nimbus 2000", description="Older than a firebolt, still a fine broom",
+            current_price=Decimal("50"), listing_category=Listing.B)
+        cls.wand = create_listing(
+            cls.seller, title="Elder wand", description="Unbeatable", closed=True, listing_category=Listing.C)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        return list(search_listings(query))
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search("firebolt"), [self.firebolt, self.nimbus])
+
+    def test_prefix_and_all_words(self):
+        self.assertEqual(self.search("nimb fine"), [self.nimbus])
+        self.assertEqual(self.search("nimbus unbeatable"), [])
+
+    @skipUnless(connection.vendor == "sqlite", "only SQLite rebuilds tables to alter them")
+    def test_triggers_dropped_by_table_rebuild_are_restored(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER auctions_listing_fts_insert")
+        remembrall = create_listing(self.seller, title="Remembrall")
+
+        self.assertTrue(restore_sqlite_triggers())
+        self.assertFalse(restore_sqlite_triggers())
+        self.assertEqual(self.search("remembrall"), [remembrall])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.search('"wand*)'), [self.wand])
+        self.assertEqual(self.search("!!"), [])
+
+    def test_index_follows_edits_and_deletes(self):
+        wand = Listing.objects.get(pk=self.wand.pk)
+        wand.title = "Invisibility cloak"
+        wand.save()
+        self.assertEqual(self.search("cloak"), [wand])
+        self.assertEqual(self.search("elder"), [])
+
+        wand.delete()
+        self.assertEqual(self.search("cloak"), [])
+
+    def test_search_view_filters(self):
+        url = reverse("auctions:search")
+        response = self.client.get(url, {"q": "broom", "min_price": "20"})
+        self.assertEqual(list(response.context["results"]), [self.nimbus])
+
+        response = self.client.get(url, {"q": "elder", "open_only": "on"})
+        self.assertEqual(list(response.context["results"]), [])
+
+        response = self.client.get(url, {"q": "broom", "category": Listing.C})
+        self.assertContains(response, "No auctions match your search.")
+
+    def test_search_view_pages(self):
+        Listing.objects.bulk_create(
+            Listing(seller=self.seller, title=f"Cauldron {i}", description="", current_price=1)
+            for i in range(30)
+        )
+        response = self.client.get(reverse("auctions:search"), {"q": "cauldron"})
+        results = response.context["results"]
+        self.assertEqual(len(results), 24)
+        self.assertEqual(results.next_url, "?q=cauldron&page=2")
+
+        response = self.client.get(reverse("auctions:search"), {"q": "cauldron", "page": 2})
+        self.assertEqual(len(response.context["results"]), 6)
+
+
+@tag("benchmark")
+@skipUnless(connection.vendor == "sqlite", "compares FTS5 with a LIKE scan")
+class SearchBenchmark(TestCase):
+
+    listings = 200_000
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("seller", "seller@example.com", "password")
+        words = ["broom", "wand", "cloak", "potion", "cauldron", "owl", "quill", "scarf"]
+        Listing.objects.bulk_create(
+            Listing(
+                seller=seller,
+                title=f"{words[i % 8]} {words[i * 7 % 8]} number {i}",
+                description=f"A {words[i * 3 % 8]} in good condition, item {i}",
+                current_price=1,
+            )
+            for i in range(cls.listings)
+        )
+        Listing.objects.create(seller=seller, title="Remembrall", description="Glows red", current_price=1)
+
+    @tag("benchmark")
+    def test_fts_against_icontains(self):
+        def timed(queryset):
+            start = time.perf_counter()
+            results = list(queryset[:24])
+            return time.perf_counter() - start, results
+
+        fts, found = timed(search_listings("remembrall"))
+        scan, scanned = timed(Listing.objects.filter(
+            Q(title__icontains="remembrall") | Q(description__icontains="remembrall")))
+
+        self.assertEqual(found, scanned)
+        self.assertLess(fts, scan)
+
+
+########################################################
+###########   REAL-TIME UPDATES   ######################
+########################################################
+
+
+class WebSocketClient:
+    """Drives websocket_application like an ASGI server would, inside a running loop"""
+
+    def __init__(self, path):
+        self.incoming = asyncio.Queue()
+        self.outgoing = asyncio.Queue()
+        self.incoming.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.ensure_future(websocket_application(
+            {"type": "websocket", "path": path}, self.incoming.get, self.outgoing.put))
+
+    async def connect(self):
+        return (await asyncio.wait_for(self.outgoing.get(), 5))["type"]
+
+    async def receive_json(self):
+        return json.loads((await asyncio.wait_for(self.outgoing.get(), 5))["text"])
+
+    async def disconnect(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect"})
+        await asyncio.wait_for(self.task, 5)
+
+
+class RealtimeTests(TestCase):
+
+    def setUp(self):
+        self.broker = InProcessBroker()
+        patcher = mock.patch("auctions.realtime._broker", self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_watchers_get_events_of_their_listing(self):
+        channel = listing_channel(1)
+
+        async def scenario():
+            watcher, other = WebSocketClient("/ws/listings/1/"), WebSocketClient("/ws/listings/2/")
+            self.assertEqual(await watcher.connect(), "websocket.accept")
+            self.assertEqual(await other.connect(), "websocket.accept")
+            self.assertEqual(self.broker.subscriber_count(channel), 1)
+
+            # bids are published from request threads, not from the loop
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.broker.publish, channel, {"type": "bid"})
+            self.assertEqual(await watcher.receive_json(), {"type": "bid"})
+            self.assertTrue(other.outgoing.empty())
+
+            await watcher.disconnect()
+            await other.disconnect()
+            self.assertEqual(self.broker.subscriber_count(channel), 0)
+
+        asyncio.run(scenario())
+
+    def test_unknown_path_is_refused(self):
+        async def scenario():
+            client = WebSocketClient("/ws/listings/abc/")
+            self.assertEqual(await client.connect(), "websocket.close")
+            await asyncio.wait_for(client.task, 5)
+
+        asyncio.run(scenario())
+
+    def test_slow_watcher_keeps_the_latest_events(self):
+        async def scenario():
+            subscription = self.broker.subscribe("listing:1")
+            for i in range(100):
+                self.broker.publish("listing:1", {"bid_count": i})
+            await asyncio.sleep(0)
+            self.assertEqual((await subscription.get())["bid_count"], 100 - subscription.queue.maxsize)
+            subscription.close()
+
+        asyncio.run(scenario())
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    def test_redis_broker_relays_between_workers(self):
+        options = {"URL": "redis://localhost:6379/15", "CLIENT_CLASS": "fakeredis.FakeRedis"}
+        publisher, subscriber = RedisBroker(**options), RedisBroker(**options)
+
+        async def scenario():
+            subscription = subscriber.subscribe("listing:1")
+            # the listener thread needs a moment to subscribe before anything is published
+            for _ in range(50):
+                if publisher._client.pubsub_numpat():
+                    break
+                await asyncio.sleep(0.02)
+            publisher.publish("listing:1", {"type": "closed", "winner": None})
+            message = await asyncio.wait_for(subscription.get(), 5)
+            self.assertEqual(message, {"type": "closed", "winner": None})
+            subscription.close()
+
+        asyncio.run(scenario())
+
+
+class RealtimePublishTests(TransactionTestCase):
+    """Events leave only once the transaction has committed"""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = create_listing(self.seller)
+        self.channel = listing_channel(self.listing.id)
+        patcher = mock.patch("auctions.realtime.get_broker")
+        self.publish = patcher.start().return_value.publish
+        self.addCleanup(patcher.stop)
+
+    def test_accepted_bid_is_published(self):
+        place_bid(self.listing.id, self.bidder, "15")
+        self.publish.assert_called_once_with(self.channel, {
+            "type": "bid",
+            "listing": self.listing.id,
+            "highest_bid": "15.00",
+            "highest_bidder": "bidder",
+            "bid_count": 1,
+            "end_time": None,
+        })
+
+    def test_rejected_and_rolled_back_bids_are_not_published(self):
+        with self.assertRaises(BidRejected):
+            place_bid(self.listing.id, self.bidder, "5")
+        try:
+            with transaction.atomic():
+                place_bid(self.listing.id, self.bidder, "15")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.publish.assert_not_called()
+
+    def test_close_and_reopen_are_published(self):
+        place_bid(self.listing.id, self.bidder, "15")
+        close_auction(self.listing.id)
+        reopen_auction(self.listing.id)
+        # closing a second time is a no-op and not published
+        reopen_auction(self.listing.id)
+
+        events = [call.args[1] for call in self.publish.call_args_list[1:]]
+        self.assertEqual(events, [
+            {"type": "closed", "listing": self.listing.id, "winner": "bidder"},
+            {"type": "reopened", "listing": self.listing.id},
+        ])
+
+
+@tag("benchmark")
+class RealtimeLoadTests(TestCase):
+
+    subscribers = 5000
+
+    @tag("benchmark")
+    def test_idle_subscribers_per_worker(self):
+        broker = InProcessBroker()
+
+        async def scenario():
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            clients = [WebSocketClient("/ws/listings/1/") for _ in range(self.subscribers)]
+            for client in clients:
+                await client.connect()
+            per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / self.subscribers
+            tracemalloc.stop()
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, broker.publish, "listing:1", {"type": "bid"})
+            for client in clients:
+                self.assertEqual(await client.receive_json(), {"type": "bid"})
+
+            for client in clients:
+                await client.disconnect()
+
+            # includes the queues and task of the stand-in ASGI server (WebSocketClient)
+            self.assertLess(per_subscriber, 16 * 1024)
+            self.assertEqual(broker.subscriber_count("listing:1"), 0)
+
+        with mock.patch("auctions.realtime._broker", broker):
+            asyncio.run(scenario())
+
+
+########################################################
+###########   JSON API   ###############################
+########################################################
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.user = User.objects.create_user("user", "user@example.com", "password")
+        cls.listings = [
+            create_listing(cls.seller, title=f"Broom {i}", listing_category=Listing.B) for i in range(30)
+        ]
+        cls.listing = cls.listings[-1]
+        create_listing(cls.seller, title="Old wand", closed=True, listing_category=Listing.C)
+
+    def get(self, url_name, *args, **params):
+        return self.client.get(reverse(f"auctions:{url_name}", args=args), params)
+
+    def send(self, method, url_name, *args, data=None):
+        return getattr(self.client, method)(
+            reverse(f"auctions:{url_name}", args=args), json.dumps(data or {}), content_type="application/json")
+
+    def test_feed_pages_with_cursor(self):
+        # ETag and page
+        with self.assertNumQueries(2):
+            first = self.get("api_listings").json()
+        self.assertEqual(len(first["results"]), 24)
+        self.assertEqual(first["results"][0]["title"], "Broom 29")
+        self.assertEqual(first["results"][0]["category"], "brooms")
+
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([row["title"] for row in second["results"]], [f"Broom {i}" for i in range(5, -1, -1)])
+        self.assertIsNone(second["next"])
+
+        closed = self.get("api_listings", closed="1", category="wands").json()
+        self.assertEqual([row["title"] for row in closed["results"]], ["Old wand"])
+
+    def test_only_selected_fields_are_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get("api_listings", fields="id,title")
+        self.assertEqual(set(response.json()["results"][0]), {"id", "title"})
+        self.assertNotIn("description", queries[0]["sql"])
+        self.assertNotIn("auctions_user", queries[0]["sql"])
+
+        self.assertEqual(self.get("api_listings", fields="title,password").status_code, 400)
+
+    def test_etag(self):
+        response = self.get("api_listing", self.listing.id)
+        etag = response["ETag"]
+        response = self.client.get(reverse("auctions:api_listing", args=[self.listing.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        place_bid(self.listing.id, self.user, "20")
+        response = self.client.get(reverse("auctions:api_listing", args=[self.listing.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["bids"], {"bid_count": 1, "highest_bid": "20.00", "highest_bidder": "user"})
+
+    def assertNotModified(self, url_name, *args, **params):
+        """Asserts a 304 for the ETag of the last response, from the ETag query alone"""
+        url = reverse(f"auctions:{url_name}", args=args)
+        etag = self.client.get(url, params)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # session, user and at most the ETag's own query
+        self.assertLessEqual(len(queries), 3, queries.captured_queries)
+        return etag
+
+    def assertModified(self, url_name, etag, *args, **params):
+        response = self.client.get(reverse(f"auctions:{url_name}", args=args), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etags_come_before_the_response(self):
+        self.client.force_login(self.user)
+        etags = {
+            "api_listings": self.assertNotModified("api_listings", category="brooms"),
+            "api_bids": self.assertNotModified("api_bids", self.listing.id),
+            "api_comments": self.assertNotModified("api_comments", self.listing.id),
+            "api_watchlist": self.assertNotModified("api_watchlist"),
+            "api_category_stats": self.assertNotModified("api_category_stats"),
+        }
+
+        self.assertEqual(self.send("put", "api_watchlist_item", self.listing.id).status_code, 204)
+        self.assertModified("api_watchlist", etags["api_watchlist"])
+
+        place_bid(self.listing.id, self.user, "20")
+        self.assertModified("api_listings", etags["api_listings"], category="brooms")
+        self.assertModified("api_bids", etags["api_bids"], self.listing.id)
+        self.assertModified("api_comments", etags["api_comments"], self.listing.id)
+
+        self.listing.closed = True
+        self.listing.save()
+        refresh_category_stats()
+        run_commit_hooks()
+        self.assertModified("api_category_stats", etags["api_category_stats"])
+
+    def test_writes_get_no_etag(self):
+        self.client.force_login(self.user)
+        response = self.send("post", "api_comments", self.listing.id, data={"comment": "Hi"})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("ETag", response)
+
+    def test_bids(self):
+        self.assertEqual(self.send("post", "api_bids", self.listing.id, data={"amount": "20"}).status_code, 401)
+
+        self.client.force_login(self.user)
+        response = self.send("post", "api_bids", self.listing.id, data={"amount": "20"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["bid"]["amount"], "20.00")
+
+        response = self.send("post", "api_bids", self.listing.id, data={"amount": "20"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("more than current price", response.json()["error"])
+        self.assertEqual(self.send("post", "api_bids", 0, data={"amount": "20"}).status_code, 404)
+        self.assertEqual(self.send("delete", "api_bids", self.listing.id).status_code, 405)
+        for amount in ["NaN", "99999999999", 1e12]:
+            response = self.send("post", "api_bids", self.listing.id, data={"amount": amount})
+            self.assertEqual(response.status_code, 400, amount)
+
+    def test_comments(self):
+        self.client.force_login(self.user)
+        for text in ["First", "Second"]:
+            response = self.send("post", "api_comments", self.listing.id, data={"comment": text})
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.send("post", "api_comments", self.listing.id, data={}).status_code, 400)
+
+        results = self.get("api_comments", self.listing.id).json()["results"]
+        self.assertEqual([(row["comment"], row["commenter"]) for row in results],
+                         [("Second", "user"), ("First", "user")])
+
+    def test_watchlist(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.send("put", "api_watchlist_item", self.listing.id).status_code, 204)
+        self.assertEqual(self.send("put", "api_watchlist_item", self.listing.id).status_code, 204)
+        self.assertEqual([row["id"] for row in self.get("api_watchlist").json()["results"]], [self.listing.id])
+        self.assertTrue(self.get("api_listing", self.listing.id).json()["on_watchlist"])
+
+        self.assertEqual(self.send("delete", "api_watchlist_item", self.listing.id).status_code, 204)
+        self.assertEqual(self.get("api_watchlist").json()["results"], [])
+
+        self.client.force_login(self.seller)
+        self.assertEqual(self.send("put", "api_watchlist_item", self.listing.id).status_code, 400)
+
+
+@tag("benchmark")
+class ApiBenchmark(TestCase):
+
+    requests = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("seller", "seller@example.com", "password")
+        Listing.objects.bulk_create(
+            Listing(seller=seller, title=f"Listing {i}", description="A" * 200, current_price=i)
+            for i in range(1000)
+        )
+
+    def throughput(self, url):
+        start = time.perf_counter()
+        for _ in range(self.requests):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return self.requests / (time.perf_counter() - start)
+
+    @tag("benchmark")
+    def test_feed_against_html_index(self):
+        # page caches would make both a dictionary lookup
+        with override_settings(ANONYMOUS_CACHE_TIMEOUTS={"index": 0}):
+            html = self.throughput(reverse("auctions:index"))
+        api = self.throughput(reverse("auctions:api_listings"))
+
+        self.assertGreater(api, html)
+
+
+########################################################
+###########   BACKGROUND TASKS   #######################
+########################################################
+
+
+def failing_task(message):
+    raise ValueError(message)
+
+
+def recording_task(value):
+    Category.objects.create(key=f"TASK {value}", label=f"Task {value}")
+
+
+class TaskQueueTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        cls.listing = create_listing(cls.seller)
+
+    def test_key_enqueues_once(self):
+        enqueue(recording_task, key="record:1", value=1)
+        enqueue(recording_task, key="record:1", value=1)
+        enqueue(recording_task, value=2)
+        enqueue(recording_task, value=2)
+
+        self.assertEqual(Task.objects.count(), 3)
+        task = Task.objects.get(key="record:1")
+        self.assertEqual((task.name, json.loads(task.payload)), ("auctions.tests.recording_task", {"value": 1}))
+
+    def test_writes_only_enqueue(self):
+        place_bid(self.listing.id, self.alice, "11")
+        Comment.objects.create(comments_listing=self.listing, commenter=self.alice, comment="Hi")
+        close_auction(self.listing.id)
+
+        self.assertEqual(
+            sorted(Task.objects.values_list("name", flat=True)),
+            ["auctions.tasks.notify_auction_closed", "auctions.tasks.notify_comment", "auctions.tasks.notify_outbid"],
+        )
+        self.assertEqual(mail.outbox, [])
+
+    def test_tasks_roll_back_with_their_write(self):
+        with mock.patch("auctions.bidding.listings_closed", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                close_auction(self.listing.id)
+        self.assertFalse(Task.objects.exists())
+
+    @override_settings(NOTIFICATIONS={"BATCH_WINDOW": 0})
+    def test_worker_sends_the_emails(self):
+        UsersWatchlist.objects.create(watchlist_user=self.alice, listing_in_watchlist=self.listing)
+        place_bid(self.listing.id, self.alice, "11")
+        place_bid(self.listing.id, self.bob, "12")
+        Comment.objects.create(comments_listing=self.listing, commenter=self.bob, comment="Is it fast?")
+        close_auction(self.listing.id)
+
+        # two bid fan-outs, the comment and the closing
+        self.assertEqual(work(), 4)
+        self.assertEqual([message.subject for message in mail.outbox], ["New comment on Firebolt"])
+        # the fan-outs' deliveries, the first one sends everything
+        self.assertEqual(work(), 3)
+        self.assertEqual(work(), 0)
+        self.assertFalse(Task.objects.exclude(status=Task.DONE).exists())
+        self.assertEqual(sorted((message.to[0], message.subject) for message in mail.outbox), [
+            ("alice@example.com", "2 updates on your auctions"),
+            ("bob@example.com", "You won Firebolt with 12.00€"),
+            ("seller@example.com", "Firebolt has closed, bob won it with 12.00€"),
+            ("seller@example.com", "New comment on Firebolt"),
+        ])
+
+    @override_settings(TASK_QUEUE=dict(settings.TASK_QUEUE, RETRY_DELAY=10))
+    def test_failed_tasks_are_retried_then_given_up(self):
+        enqueue(failing_task, max_attempts=2, message="Owl lost")
+
+        self.assertEqual(work(), 1)
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+        self.assertIn("ValueError: Owl lost", task.last_error)
+        self.assertGreater(task.run_after, timezone.now() + timedelta(seconds=9))
+        # not due before the retry delay
+        self.assertEqual(work(), 0)
+
+        Task.objects.update(run_after=timezone.now())
+        self.assertEqual(work(), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+        Task.objects.update(run_after=timezone.now())
+        self.assertEqual(work(), 0)
+
+    def test_claims_are_exclusive_until_stale(self):
+        enqueue(recording_task, value=1)
+        self.assertEqual(len(claim(10)), 1)
+        self.assertEqual(claim(10), [])
+
+        # the worker that claimed it died
+        Task.objects.update(claimed_at=timezone.now() - timedelta(seconds=settings.TASK_QUEUE["STALE_AFTER"] + 1))
+        task, = claim(10)
+        self.assertEqual(task.attempts, 2)
+
+    def test_request_does_not_wait_for_tasks(self):
+        self.client.force_login(self.alice)
+        with mock.patch("auctions.tasks.notify_outbid") as notify:
+            response = self.client.post(reverse("auctions:bid", args=[self.listing.id]), {"bid_price": "11"})
+        self.assertEqual(response.status_code, 302)
+        notify.assert_not_called()
+        self.assertTrue(Task.objects.filter(status=Task.PENDING).exists())
+
+    @override_settings(TASK_QUEUE=dict(settings.TASK_QUEUE, EAGER=True), NOTIFICATIONS={"BATCH_WINDOW": 0})
+    def test_eager_mode_runs_tasks_right_away(self):
+        place_bid(self.listing.id, self.alice, "11")
+        place_bid(self.listing.id, self.bob, "12")
+
+        self.assertEqual(
+            [message.subject for message in mail.outbox],
+            ["You have been outbid on Firebolt, the highest bid is 12.00€"],
+        )
+        # a fan-out and a delivery per bid
+        self.assertEqual(list(Task.objects.values_list("status", flat=True)), [Task.DONE] * 4)
+
+        enqueue(recording_task, key="record:1", value=1)
+        enqueue(recording_task, key="record:1", value=1)
+        self.assertEqual(Category.objects.filter(key="TASK 1").count(), 1)
+
+        enqueue(failing_task, message="Owl lost")
+        self.assertEqual(Task.objects.get(name="auctions.tests.failing_task").status, Task.PENDING)
+
+    def test_command(self):
+        enqueue(recording_task, value=1)
+        enqueue(recording_task, value=2)
+        out = StringIO()
+        call_command("run_tasks", "--once", "--processes", "0", stdout=out)
+        self.assertIn("Ran 2 task(s)", out.getvalue())
+        self.assertEqual(Category.objects.filter(key__startswith="TASK").count(), 2)
+
+
+class TaskPoolTests(TransactionTestCase):
+
+    def test_executor_runs_the_tasks(self):
+        for value in range(4):
+            enqueue(recording_task, value=value)
+        # the worker's process pool needs a database file, threads work with the in-memory test database
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(work(executor), 4)
+        self.assertEqual(Category.objects.filter(key__startswith="TASK").count(), 4)
+        self.assertEqual(Task.objects.filter(status=Task.DONE).count(), 4)
+
+
+########################################################
+###########   BID HISTORY AND ANALYTICS   ##############
+########################################################
+
+
+class BidHistoryTests(QueryPlanAssertions, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        cls.listing = create_listing(cls.seller)
+        for number in range(1, 8):
+            place_bid(cls.listing.id, cls.alice if number % 2 else cls.bob, str(10 + number))
+
+    def test_page_lists_bids_newest_first(self):
+        with mock.patch("auctions.views.BIDS_PER_PAGE", 5):
+            # listing ETag, listing, bids with their bidders
+            url = reverse("auctions:bid_history", args=[self.listing.id])
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(
+                [(bid.bidder.username, bid.bid_price) for bid in response.context["bids"]],
+                [("alice", Decimal("17")), ("bob", Decimal("16")), ("alice", Decimal("15")),
+                 ("bob", Decimal("14")), ("alice", Decimal("13"))],
+            )
+            response = self.client.get(url + response.context["bids"].next_url)
+        self.assertEqual([bid.bid_price for bid in response.context["bids"]], [Decimal("12"), Decimal("11")])
+        self.assertEqual(self.client.get(reverse("auctions:bid_history", args=[0])).status_code, 404)
+        self.assertContains(
+            self.client.get(reverse("auctions:listing_page", args=[self.listing.id])),
+            reverse("auctions:bid_history", args=[self.listing.id]),
+        )
+
+    def test_json(self):
+        response = self.client.get(reverse("auctions:api_bids", args=[self.listing.id]))
+        results = response.json()["results"]
+        self.assertEqual(len(results), 7)
+        self.assertEqual(
+            {key: results[0][key] for key in ["amount", "bidder"]},
+            {"amount": "17.00", "bidder": "alice"},
+        )
+        self.assertIsNone(response.json()["next"])
+        self.assertEqual(self.client.get(reverse("auctions:api_bids", args=[0])).status_code, 404)
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+    def test_next_page_is_index_seek(self):
+        bid = Bid.objects.filter(listing=self.listing).order_by("bid_date", "pk").last()
+        cursor = encode_cursor(bid.bid_date, bid.pk)
+        with CaptureQueriesContext(connection) as queries:
+            keyset_page(Bid.objects.filter(listing=self.listing), cursor, date_field="bid_date")
+
+        sql = queries[0]["sql"]
+        self.assertNoFullTableScan(sql)
+        self.assertSortedByIndex(sql)
+
+
+class CategoryStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "password")
+
+    def setUp(self):
+        cache.clear()
+
+    def auction(self, category, bids=(), closed=True, first_bid_after=None):
+        listing = create_listing(self.seller, listing_category=category)
+        for amount in bids:
+            place_bid(listing.id, self.alice, amount)
+        if first_bid_after is not None:
+            Bid.objects.filter(listing=listing).update(bid_date=listing.publication_date + first_bid_after)
+        if closed:
+            close_auction(listing.id)
+        return listing
+
+    def test_stats_of_closed_auctions(self):
+        self.auction(Listing.B, ["20"], first_bid_after=timedelta(hours=1))
+        self.auction(Listing.B, ["30", "40", "50"], first_bid_after=timedelta(hours=3))
+        self.auction(Listing.B)
+        self.auction(Listing.B, ["500"], closed=False)
+        self.auction(Listing.C, ["15"], first_bid_after=timedelta(minutes=30))
+
+        self.assertEqual(refresh_category_stats(), 2)
+        brooms = CategoryStats.objects.get(category=Listing.B)
+        self.assertEqual(
+            (brooms.closed_auctions, brooms.sold_auctions, brooms.average_final_price,
+             brooms.bids_per_auction, brooms.time_to_first_bid),
+            (3, 2, Decimal("35.00"), 4 / 3, timedelta(hours=2)),
+        )
+        self.assertEqual(CategoryStats.objects.get(category=Listing.C).time_to_first_bid, timedelta(minutes=30))
+
+    def test_refresh_only_recomputes_changed_categories(self):
+        self.auction(Listing.B, ["20"])
+        self.auction(Listing.C, ["15"])
+        refresh_category_stats()
+        self.assertEqual(refresh_category_stats(), 0)
+
+        self.auction(Listing.C, ["25"])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(refresh_category_stats(), 1)
+        aggregate_sql, = [query["sql"] for query in queries if "GROUP BY" in query["sql"]]
+        self.assertIn("'WANDS'", aggregate_sql)
+        self.assertNotIn("'BROOMS'", aggregate_sql)
+        self.assertEqual(CategoryStats.objects.get(category=Listing.C).average_final_price, Decimal("20.00"))
+
+        # reopened, WANDS is down to the other auction
+        reopen_auction(Listing.objects.get(listing_category=Listing.C, highest_bid=Decimal("25")).id)
+        refresh_category_stats()
+        self.assertEqual(CategoryStats.objects.get(category=Listing.C).closed_auctions, 1)
+
+    def test_full_refresh_drops_categories_without_closed_auctions(self):
+        listing = self.auction(Listing.B, ["20"])
+        refresh_category_stats()
+        listing.delete()
+        # deletions leave no updated listing behind
+        self.assertEqual(refresh_category_stats(), 0)
+        self.assertEqual(refresh_category_stats(full=True), 0)
+        self.assertFalse(CategoryStats.objects.exists())
+
+    def test_pages_read_the_cached_stats(self):
+        self.auction(Listing.B, ["20"], first_bid_after=timedelta(hours=1))
+        out = StringIO()
+        call_command("refresh_category_stats", stdout=out)
+        self.assertIn("Refreshed the stats of 1 category(ies)", out.getvalue())
+
+        response = self.client.get(reverse("auctions:api_category_stats"))
+        brooms, = response.json()["results"]
+        self.assertEqual(
+            {key: brooms[key] for key in ["category", "closed_auctions", "average_final_price", "time_to_first_bid"]},
+            {"category": "brooms", "closed_auctions": 1, "average_final_price": "20.00", "time_to_first_bid": 3600.0},
+        )
+        with self.assertNumQueries(0):
+            self.client.get(reverse("auctions:api_category_stats"))
+        response = self.client.get(reverse("auctions:categories"))
+        self.assertContains(response, "1 of 1 closed auction(s) sold")
+        self.assertContains(response, "first bid after 1 h on average")
+
+    def test_time_to_first_bid_is_rounded_to_minutes(self):
+        for delay, shown in [
+            (timedelta(seconds=20), "less than a minute"),
+            (timedelta(minutes=44, seconds=40), "45 min"),
+            (timedelta(days=1, hours=2, minutes=3, seconds=4.512345), "1 d 2 h 3 min"),
+            (timedelta(days=2, seconds=10), "2 d"),
+            (None, None),
+        ]:
+            with self.subTest(delay=delay):
+                self.assertEqual(CategoryStats(time_to_first_bid=delay).time_to_first_bid_display, shown)
+
+
+########################################################
+###########   USER DASHBOARD   #########################
+########################################################
+
+
+class UserDashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "password")
+
+    def assertDashboardsUpToDate(self):
+        for user in [self.seller, self.alice, self.bob]:
+            stored = UserDashboard.objects.get(user=user)
+            actual = compute(user.id)
+            self.assertEqual(
+                [getattr(stored, field) for field in dashboard.FIELDS],
+                [getattr(actual, field) for field in dashboard.FIELDS],
+                user.username,
+            )
+
+    def test_events_keep_the_totals_up_to_date(self):
+        for user in [self.seller, self.alice, self.bob]:
+            dashboard_for(user)
+        listings = [create_listing(self.seller, title=f"Broom {i}") for i in range(3)]
+        self.assertEqual(UserDashboard.objects.get(user=self.seller).active_listings, 3)
+
+        place_bid(listings[0].id, self.alice, "11")
+        place_bid(listings[0].id, self.alice, "12")
+        place_bid(listings[0].id, self.bob, "13")
+        place_bid(listings[1].id, self.alice, "20")
+        self.assertDashboardsUpToDate()
+        self.assertEqual(UserDashboard.objects.get(user=self.alice).bidding_count, 2)
+
+        close_auction(listings[0].id)
+        close_auction(listings[2].id)
+        self.assertDashboardsUpToDate()
+        bob = UserDashboard.objects.get(user=self.bob)
+        self.assertEqual((bob.won_count, bob.total_spent, bob.bidding_count), (1, Decimal("13"), 0))
+        seller = UserDashboard.objects.get(user=self.seller)
+        self.assertEqual((seller.active_listings, seller.sold_count, seller.total_earned), (1, 2, Decimal("13")))
+
+        reopen_auction(listings[0].id)
+        self.assertDashboardsUpToDate()
+        close_auction(listings[0].id)
+        self.assertDashboardsUpToDate()
+
+        import_listings(["title,current_price,description,listing_category", "Wand,5,Holly,WANDS"], self.alice)
+        self.assertDashboardsUpToDate()
+
+    def test_failed_closing_leaves_the_totals_alone(self):
+        for user in [self.seller, self.alice, self.bob]:
+            dashboard_for(user)
+        listing = create_listing(self.seller)
+        place_bid(listing.id, self.alice, "11")
+
+        with mock.patch("auctions.bidding.enqueue_many", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                close_auction(listing.id)
+        self.assertFalse(Listing.objects.get(pk=listing.id).closed)
+        self.assertDashboardsUpToDate()
+
+        close_auction(listing.id)
+        with mock.patch("auctions.bidding.listings_closed", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                reopen_auction(listing.id)
+        self.assertTrue(Listing.objects.get(pk=listing.id).closed)
+        self.assertDashboardsUpToDate()
+
+    def test_reopening_an_open_auction_changes_nothing(self):
+        listing = create_listing(self.seller)
+        with mock.patch("auctions.bidding.bump_card_version") as bump:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(reopen_auction(listing.id), 0)
+        self.assertEqual(len(without_savepoints(queries)), 1)
+        bump.assert_not_called()
+
+    def test_expiry_moves_a_batch_with_three_statements(self):
+        for user in [self.seller, self.alice, self.bob]:
+            dashboard_for(user)
+        clock = FakeClock()
+        listings = [create_listing(self.seller, title=f"Broom {i}", end_time=clock() + timedelta(hours=1))
+                    for i in range(4)]
+        with mock.patch("auctions.bidding.now", clock):
+            for listing in listings[:3]:
+                place_bid(listing.id, self.alice, "11")
+            place_bid(listings[0].id, self.bob, "12")
+            clock.advance(hours=2)
+            with CaptureQueriesContext(connection) as queries:
+                close_expired_auctions()
+
+        self.assertEqual(len([sql for sql in without_savepoints(queries) if "auctions_userdashboard" in sql]), 3)
+        self.assertDashboardsUpToDate()
+        alice = UserDashboard.objects.get(user=self.alice)
+        self.assertEqual((alice.won_count, alice.total_spent, alice.bidding_count), (2, Decimal("22"), 0))
+
+    def test_missing_dashboard_is_computed(self):
+        listing = create_listing(self.seller)
+        place_bid(listing.id, self.alice, "11")
+        close_auction(listing.id)
+        self.assertFalse(UserDashboard.objects.exists())
+
+        self.assertEqual(dashboard_for(self.alice).won_count, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(dashboard_for(self.alice).won_count, 1)
+
+    def test_deleting_a_listing_forgets_the_dashboards(self):
+        listing = create_listing(self.seller)
+        place_bid(listing.id, self.alice, "11")
+        for user in [self.seller, self.alice, self.bob]:
+            dashboard_for(user)
+
+        listing.delete()
+        self.assertEqual(list(UserDashboard.objects.values_list("user", flat=True)), [self.bob.id])
+        self.assertEqual(dashboard_for(self.alice).bidding_count, 0)
+
+    def test_panel_reads_the_totals(self):
+        listing = create_listing(self.seller)
+        Bid.objects.bulk_create(
+            Bid(listing=listing, bidder=self.alice, bid_price=Decimal(price)) for price in range(1, 2001)
+        )
+        Listing.objects.filter(pk=listing.pk).update(closed=True, winner=self.alice, highest_bid=Decimal("2000"))
+        self.client.force_login(self.alice)
+        self.client.get(reverse("auctions:user_listings"))
+
+        # session, user and dashboard
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("auctions:user_listings"))
+        self.assertContains(response, "<strong>Spent:</strong> 2000.00€", html=False)
+        self.assertContains(response, reverse("auctions:user_panel_section", args=["won"]))
+
+        response = self.client.get(reverse("auctions:user_panel_section", args=["won"]))
+        self.assertEqual(list(response.context["listings"]), [listing])
+        self.assertEqual(self.client.get(reverse("auctions:user_panel_section", args=["bids"])).status_code, 404)
+
+    def test_command(self):
+        listing = create_listing(self.seller)
+        dashboard_for(self.seller)
+        # bypasses the events
+        Listing.objects.filter(pk=listing.pk).update(closed=True)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_dashboards", "--check", stdout=StringIO())
+        out = StringIO()
+        call_command("rebuild_dashboards", stdout=out)
+        self.assertIn("Rebuilt 1 dashboard(s)", out.getvalue())
+        call_command("rebuild_dashboards", "--check", stdout=StringIO())
+        self.assertEqual(UserDashboard.objects.get(user=self.seller).sold_count, 1)
+
+
+########################################################
+###########   NOTIFICATIONS   ##########################
+########################################################
+
+
+class NotificationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        cls.carol = User.objects.create_user("carol", "carol@example.com", "password")
+        cls.listing = create_listing(cls.seller)
+        for user in [cls.alice, cls.carol]:
+            UsersWatchlist.objects.create(watchlist_user=user, listing_in_watchlist=cls.listing)
+
+    def bid(self, bidder, amount):
+        tasks.notify_outbid(place_bid(self.listing.id, bidder, amount).id)
+
+    def notifications(self):
+        return sorted(Notification.objects.values_list("user__username", "kind", "count"))
+
+    def test_bids_notify_the_previous_bidder_and_the_watchers(self):
+        self.bid(self.alice, "11")
+        self.assertEqual(self.notifications(), [("carol", Notification.BID, 1)])
+
+        self.bid(self.bob, "12")
+        self.assertEqual(self.notifications(), [
+            ("alice", Notification.OUTBID, 1),
+            ("carol", Notification.BID, 2),
+        ])
+
+        # bob raising his own bid outbids nobody, alice only hears of it as a watcher
+        self.bid(self.bob, "13")
+        self.assertEqual(self.notifications(), [
+            ("alice", Notification.BID, 1),
+            ("alice", Notification.OUTBID, 1),
+            ("carol", Notification.BID, 3),
+        ])
+
+    def test_closing_notifies_the_winner_the_seller_and_the_watchers(self):
+        place_bid(self.listing.id, self.alice, "11")
+        close_auction(self.listing.id)
+        tasks.notify_auction_closed(self.listing.id)
+
+        self.assertEqual(self.notifications(), [
+            ("alice", Notification.WON, 1),
+            ("carol", Notification.CLOSED, 1),
+            ("seller", Notification.CLOSED, 1),
+        ])
+        self.assertEqual(
+            Notification.objects.get(user=self.carol).message,
+            "Firebolt has closed, alice won it with 11.00€",
+        )
+
+    def test_bursts_are_coalesced_until_read(self):
+        for number in range(3):
+            self.bid(self.alice, str(11 + 2 * number))
+            self.bid(self.bob, str(12 + 2 * number))
+        self.assertEqual(self.notifications(), [
+            ("alice", Notification.OUTBID, 3),
+            ("bob", Notification.OUTBID, 2),
+            ("carol", Notification.BID, 6),
+        ])
+        self.assertEqual(
+            Notification.objects.get(user=self.alice).message,
+            "You have been outbid on Firebolt (3 times), the highest bid is 16.00€",
+        )
+
+        Notification.objects.filter(user=self.carol).update(read_at=timezone.now())
+        self.bid(self.alice, "17")
+        self.assertEqual(
+            [(count, read_at is None) for count, read_at in
+             Notification.objects.filter(user=self.carol).order_by("pk").values_list("count", "read_at")],
+            [(6, False), (1, True)],
+        )
+
+    def test_fan_out_statements_do_not_grow_with_the_watchers(self):
+        watchers = User.objects.bulk_create(User(username=f"watcher{number}") for number in range(300))
+        UsersWatchlist.objects.bulk_create(
+            UsersWatchlist(watchlist_user=user, listing_in_watchlist=self.listing)
+            for user in User.objects.filter(username__startswith="watcher")
+        )
+        self.assertEqual(len(watchers), 300)
+        self.bid(self.alice, "11")
+        bid = place_bid(self.listing.id, self.bob, "12")
+
+        # the bid, the previous bidder, two statements per kind, the delivery task
+        with self.assertNumQueries(7):
+            tasks.notify_outbid(bid.id)
+        self.assertEqual(Notification.objects.filter(kind=Notification.BID, count=2).count(), 301)
+        self.assertEqual(Notification.objects.filter(kind=Notification.OUTBID).count(), 1)
+
+    def test_tasks_skip_deleted_rows(self):
+        bid = place_bid(self.listing.id, self.alice, "11")
+        Bid.objects.all().delete()
+        tasks.notify_outbid(bid.id)
+        # still open
+        tasks.notify_auction_closed(self.listing.id)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_delivery_sends_one_email_per_user(self):
+        self.bid(self.alice, "11")
+        self.bid(self.bob, "12")
+        dave = User.objects.create_user("dave", "dave@example.com", "password")
+        self.bid(dave, "13")
+
+        self.assertEqual(deliver(batch_size=1), 3)
+        # alice watches the listing too
+        self.assertEqual(sorted((message.to[0], message.subject) for message in mail.outbox), [
+            ("alice@example.com", "2 updates on your auctions"),
+            ("bob@example.com", "You have been outbid on Firebolt, the highest bid is 13.00€"),
+            ("carol@example.com", "3 new bids on Firebolt, the highest bid is 13.00€"),
+        ])
+        self.assertEqual(mail.outbox[0].body, "\n".join([
+            "A new bid on Firebolt, the highest bid is 13.00€",
+            "You have been outbid on Firebolt, the highest bid is 13.00€",
+        ]))
+        self.assertFalse(Notification.objects.filter(emailed_at=None).exists())
+        self.assertEqual(deliver(), 0)
+
+        # a repeat of an unread notification is e-mailed again
+        self.bid(self.bob, "14")
+        self.bid(dave, "15")
+        User.objects.filter(pk=self.carol.pk).update(email="")
+        self.assertEqual(deliver(), 2)
+        # dave leads again
+        self.assertEqual(sorted((message.to[0], message.body) for message in mail.outbox[3:]), [
+            ("alice@example.com", "3 new bids on Firebolt, the highest bid is 15.00€"),
+            ("bob@example.com", "You have been outbid on Firebolt (2 times), the highest bid is 15.00€"),
+        ])
+
+    def test_delivery_skips_bidders_back_in_the_lead(self):
+        self.bid(self.alice, "11")
+        self.bid(self.bob, "12")
+        self.bid(self.alice, "13")
+        Notification.objects.filter(user=self.carol).delete()
+
+        self.assertEqual(deliver(), 1)
+        self.assertEqual(mail.outbox[0].to, ["bob@example.com"])
+        # still in the inbox
+        self.assertEqual(Notification.objects.filter(user=self.alice, emailed_at__isnull=False).count(), 1)
+
+    @override_settings(NOTIFICATIONS={"BATCH_WINDOW": 60})
+    def test_deliveries_are_batched_per_window(self):
+        self.bid(self.alice, "11")
+        self.bid(self.bob, "12")
+        task, = Task.objects.filter(name="auctions.tasks.deliver_notifications")
+        self.assertGreater(task.run_after, timezone.now())
+        self.assertLessEqual(task.run_after, timezone.now() + timedelta(seconds=60))
+
+    def test_inbox(self):
+        self.bid(self.alice, "11")
+        self.bid(self.bob, "12")
+        self.client.force_login(self.alice)
+
+        response = self.client.get(reverse("auctions:notifications"))
+        self.assertContains(response, "You have been outbid on Firebolt, the highest bid is 12.00€")
+        self.assertContains(response, "1 unread")
+
+        response = self.client.post(reverse("auctions:mark_notifications_read"))
+        self.assertRedirects(response, reverse("auctions:notifications"))
+        self.assertFalse(Notification.objects.filter(user=self.alice, read_at=None).exists())
+        self.assertTrue(Notification.objects.filter(user=self.carol, read_at=None).exists())
+        self.assertNotContains(self.client.get(reverse("auctions:notifications")), "unread")
+
+
+########################################################
+###########   BULK IMPORT AND EXPORT   #################
+########################################################
+
+
+LISTINGS_CSV = """title,current_price,description,listing_category,image_url
+Nimbus 2000,120.50,A fine broom,BROOMS,
+Elder wand,priceless,Unbeatable,WANDS,
+Cauldron,12,Pewter,POTIONS,
+Remembrall,5,Glows red,MAGICAL ITEMS,https://example.com/remembrall.png
+Invisibility cloak,300,Slightly used,WIZARDING CLOTHING,
+"""
+
+
+class BulkImportExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.buyer = User.objects.create_user("buyer", "buyer@example.com", "password")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_import_csv(self):
+        with CaptureQueriesContext(connection) as queries:
+            report = import_listings(LISTINGS_CSV.splitlines(), self.seller, "csv", batch_size=2)
+
+        self.assertEqual((report.created, report.failed), (3, 2))
+        self.assertEqual([row for row, error in report.errors], [3, 4])
+        self.assertIn("current_price", report.errors[0][1])
+        self.assertIn("listing_category", report.errors[1][1])
+        self.assertEqual(
+            list(Listing.objects.order_by("pk").values_list("title", "seller__username", "listing_category")),
+            [("Nimbus 2000", "seller", Listing.B), ("Remembrall", "seller", Listing.E),
+             ("Invisibility cloak", "seller", Listing.A)],
+        )
+        # two batches, one insert each
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+
+    @override_settings(AUCTION_SNIPING_WINDOW=0)
+    def test_import_jsonl(self):
+        lines = [
+            json.dumps({"title": "Firebolt", "current_price": 500, "description": "Fast", "listing_category": Listing.B,
+                        "end_time": "2999-01-01 12:00", "image_url": None}),
+            "{not json",
+            "",
+            json.dumps(["a", "list"]),
+            json.dumps({"title": "Old broom", "current_price": 5, "description": "Slow", "listing_category": Listing.B,
+                        "end_time": "2000-01-01 12:00"}),
+        ]
+        report = import_listings(lines, self.seller, "jsonl")
+
+        self.assertEqual(report.created, 1)
+        self.assertEqual([row for row, error in report.errors], [2, 4, 5])
+        self.assertEqual(report.errors[:2], [(2, "Not valid JSON"), (4, "Not a JSON object")])
+        self.assertEqual(Listing.objects.get().end_time, datetime(2999, 1, 1, 12, tzinfo=dt_timezone.utc))
+
+    def test_upload_view(self):
+        self.client.force_login(self.seller)
+        upload = SimpleUploadedFile("listings.csv", LISTINGS_CSV.encode(), content_type="text/csv")
+        response = self.client.post(reverse("auctions:import_listings"), {"file": upload})
+
+        self.assertContains(response, "3 listing(s) imported, 2 row(s) skipped")
+        self.assertContains(response, "Row 3: ")
+        self.assertEqual(Listing.objects.filter(seller=self.seller).count(), 3)
+
+        response = self.client.post(reverse("auctions:import_listings"), {})
+        self.assertContains(response, "Choose a file to import", status_code=400)
+
+    def test_export_round_trip(self):
+        import_listings(LISTINGS_CSV.splitlines(), self.seller, "csv")
+        create_listing(self.buyer, title="Not mine")
+        self.client.force_login(self.seller)
+
+        response = self.client.get(reverse("auctions:export_listings"), {"format": "csv"})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="listings.csv"')
+        exported = b"".join(response.streaming_content).decode()
+
+        report = import_listings(exported.splitlines(), self.buyer, "csv")
+        self.assertEqual((report.created, report.failed), (3, 0))
+        self.assertEqual(
+            list(Listing.objects.filter(seller=self.buyer).exclude(title="Not mine").values_list(
+                "title", "current_price", "description", "listing_category", "image_url")),
+            list(Listing.objects.filter(seller=self.seller).values_list(
+                "title", "current_price", "description", "listing_category", "image_url")),
+        )
+
+    def test_export_bids(self):
+        listing = create_listing(self.seller)
+        place_bid(listing.id, self.buyer, "11")
+        place_bid(create_listing(self.buyer).id, self.seller, "12")
+        self.client.force_login(self.seller)
+
+        response = self.client.get(reverse("auctions:export_bids"), {"format": "jsonl"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["listing"], listing.id)
+        self.assertEqual((rows[0]["bidder"], rows[0]["bid_price"]), ("buyer", "11.00"))
+
+    def test_import_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "listings.csv")
+            with open(path, "w") as file:
+                file.write(LISTINGS_CSV)
+            out, err = StringIO(), StringIO()
+            call_command("import_listings", path, "--seller", "seller", stdout=out, stderr=err)
+
+        self.assertIn("Imported 3 listing(s), skipped 2 row(s)", out.getvalue())
+        self.assertIn("Row 3: ", err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("import_listings", path, "--seller", "nobody", stdout=StringIO())
+
+    @tag("benchmark")
+    def test_export_memory(self):
+        Listing.objects.bulk_create(
+            Listing(seller=self.seller, title=f"Listing {i}", description="A" * 500, current_price=i)
+            for i in range(20000)
+        )
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse("auctions:export_listings"), {"format": "jsonl"})
+
+        size = 0
+        tracemalloc.start()
+        for line in response.streaming_content:
+            size += len(line)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertLess(peak, size / 4)
+
+
+########################################################
+###########   REQUEST METRICS   ########################
+########################################################
+
+
+@override_settings(REQUEST_METRICS={"SAMPLE_RATE": 1, "SERVER_TIMING": True})
+class RequestMetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        cls.listing = create_listing(cls.seller)
+
+    def setUp(self):
+        cache.clear()
+        METRICS.clear()
+
+    def test_sampled_request_is_reported(self):
+        with self.assertLogs("auctions.metrics", "INFO") as logs:
+            response = self.client.get(reverse("auctions:listing_page", args=[self.listing.id]))
+
+        timing = response["Server-Timing"]
+        for metric in ("total;dur=", "view;dur=", "sql;dur=", "tpl;dur="):
+            self.assertIn(metric, timing)
+        self.assertIn(" queries, 0 duplicates", timing)
+
+        self.assertEqual(len(logs.records), 1)
+        fields = logs.records[0].metrics
+        self.assertEqual(fields["view"], "auctions:listing_page")
+        self.assertEqual(fields["status"], 200)
+        self.assertGreater(fields["queries"], 0)
+        self.assertGreater(fields["template_ms"], 0)
+        self.assertLessEqual(fields["view_ms"], fields["total_ms"])
+        self.assertIn("view=auctions:listing_page status=200", logs.output[0])
+
+    def test_duplicate_queries_are_detected(self):
+        def view(request):
+            for _ in range(3):
+                Listing.objects.filter(pk=self.listing.id).exists()
+            return HttpResponse()
+
+        with self.assertLogs("auctions.metrics", "INFO") as logs:
+            response = RequestMetricsMiddleware(view)(RequestFactory().get("/"))
+
+        self.assertIn('desc="3 queries, 2 duplicates"', response["Server-Timing"])
+        self.assertEqual(logs.records[0].metrics["duplicates"], 2)
+        self.assertIn("duplicate query view=unresolved", logs.output[1])
+
+    def test_metrics_endpoint(self):
+        with self.assertLogs("auctions.metrics", "INFO"):
+            self.client.get(reverse("auctions:index"))
+            self.client.get(reverse("auctions:index"))
+
+            response = self.client.get(reverse("metrics"), REMOTE_ADDR="127.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        labels = 'view="auctions:index",method="GET",status="200"'
+        self.assertIn(f"auctions_request_duration_seconds_count{{{labels}}} 2", text)
+        self.assertIn(f'auctions_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f"auctions_sql_queries_total{{{labels}}} ", text)
+        self.assertIn("auctions_metrics_sample_rate 1", text)
+
+    def test_metrics_endpoint_is_internal(self):
+        with self.assertLogs("auctions.metrics", "INFO"):
+            response = self.client.get(reverse("metrics"), REMOTE_ADDR="203.0.113.7")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(REQUEST_METRICS={"SAMPLE_RATE": 0})
+    def test_no_sampling_removes_the_middleware(self):
+        response = self.client.get(reverse("auctions:index"))
+        self.assertNotIn("Server-Timing", response)
+        self.assertNotIn("auctions:index", METRICS.prometheus())
+
+    @tag("benchmark")
+    def test_overhead(self):
+        Listing.objects.bulk_create(
+            Listing(seller=self.seller, title=f"Listing {i}", description="A" * 200, current_price=i)
+            for i in range(100)
+        )
+        url = reverse("auctions:index")
+
+        def seconds():
+            # the anonymous page cache would make both a dictionary lookup
+            with override_settings(ANONYMOUS_CACHE_TIMEOUTS={"index": 0}):
+                self.client.get(url)
+                start = time.perf_counter()
+                for _ in range(100):
+                    self.client.get(url)
+                return time.perf_counter() - start
+
+        with self.assertLogs("auctions.metrics", "INFO"):
+            measured = seconds()
+        with override_settings(REQUEST_METRICS={"SAMPLE_RATE": 0}):
+            self.client = self.client_class()
+            plain = seconds()
+
+        self.assertLess(measured, plain * 1.5)
+
+
+########################################################
+###########   SEED DATA AND URL BENCHMARKS   ###########
+########################################################
+
+
+class SeedDataTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_creates_consistent_dataset(self):
+        created = seed(users=5, listings=40, bids_per_listing=3, comments_per_listing=2, watchlist_per_user=4, seed=1)
+
+        self.assertEqual(created["users"], 5)
+        self.assertEqual(created["listings"], 40)
+        self.assertEqual(Bid.objects.count(), created["bids"])
+        self.assertEqual(Comment.objects.count(), created["comments"])
+        self.assertEqual(UsersWatchlist.objects.count(), created["watchlist entries"])
+        self.assertEqual(list(find_inconsistent_listings()), [])
+        for listing in Listing.objects.all():
+            self.assertEqual(listing.comment_count, listing.comment_set.count())
+            self.assertEqual(listing.winner_id, listing.highest_bidder_id if listing.closed else None)
+        self.assertFalse(UsersWatchlist.objects.filter(listing_in_watchlist__seller=F("watchlist_user")).exists())
+        self.assertTrue(self.client.login(username=User.objects.first().username, password=PASSWORD))
+
+    def test_seed_adds_to_existing_data(self):
+        seed(users=2, listings=5, seed=1)
+        seed(users=2, listings=5, seed=1)
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Listing.objects.count(), 10)
+
+    def test_every_url_is_benchmarked(self):
+        self.assertEqual(benchmarking.uncovered_urls(), [])
+
+    def test_test_runner_skips_benchmarks_unless_asked(self):
+        self.assertEqual(TestRunner().exclude_tags, {"benchmark"})
+        self.assertEqual(TestRunner(exclude_tags=["slow"]).exclude_tags, {"benchmark", "slow"})
+        self.assertEqual(TestRunner(tags=["benchmark"]).exclude_tags, set())
+
+    def test_benchmark_command_saves_and_checks_baseline(self):
+        seed(users=3, listings=20, seed=1)
+        bids = Bid.objects.count()
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, "baseline.json")
+            call_command("benchmark_urls", "--requests", "2", "--baseline", baseline, "--save-baseline",
+                         stdout=StringIO())
+            with open(baseline) as saved:
+                results = json.load(saved)
+
+        # the bids, comments and watchlist changes of the run are rolled back
+        self.assertEqual(Bid.objects.count(), bids)
+        self.assertEqual(set(results), {endpoint.name for endpoint in benchmarking.ENDPOINTS})
+        self.assertEqual(set(results["listing_page"]), {"p50_ms", "p95_ms", "queries", "peak_kib"})
+
+        fewer_queries = {"index": dict(results["index"], queries=results["index"]["queries"] - 1)}
+        self.assertEqual(benchmarking.compare(results, fewer_queries), [
+            f"index: queries {results['index']['queries'] - 1} -> {results['index']['queries']}",
+        ])
+        self.assertEqual(benchmarking.compare(results, results), [])
+
+    def test_benchmark_needs_data(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_urls", "--requests", "1", stdout=StringIO())
+
+
+########################################################
+###########   QUERY COUNTS   ###########################
+########################################################
+
+
+class ViewQueryCountTests(TestCase):
+    """Queries per page must not grow with the number of listings, bids or comments.
+
+    Logged in requests spend 2 queries on the session and the user, listing
+    and feed pages 1 on their ETag.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("user", "user@example.com", "password")
+        cls.sellers = [
+            User.objects.create_user(f"seller{i}", f"seller{i}@example.com", "password")
+            for i in range(5)
+        ]
+        for i in range(30):
+            listing = create_listing(cls.sellers[i % 5], closed=i % 4 == 0, listing_category=Listing.C)
+            UsersWatchlist.objects.create(watchlist_user=cls.user, listing_in_watchlist=listing)
+            Comment.objects.create(comments_listing=listing, commenter=cls.sellers[i % 5], comment="Hi")
+            if not listing.closed:
+                place_bid(listing.id, cls.user, "11")
+        for i in range(10):
+            create_listing(cls.user, closed=i % 2 == 0, winner=cls.sellers[0])
+        cls.listing = Listing.objects.exclude(seller=cls.user).filter(closed=False).first()
+        for seller in cls.sellers:
+            Comment.objects.create(comments_listing=cls.listing, commenter=seller, comment="Hi")
+        for amount, seller in enumerate(cls.sellers, start=12):
+            if seller != cls.listing.seller:
+                place_bid(cls.listing.id, seller, amount)
+        for listing in Listing.objects.exclude(seller=cls.user)[:10]:
+            Notification.objects.create(user=cls.user, listing=listing, kind=Notification.OUTBID)
+        refresh_category_stats()
+
+    # URL names the tests below count the queries of, add new URLs here with their test
+    counted_urls = {
+        "index", "categories", "listings_in_category", "search", "login", "logout", "register",
+        "user_listings", "user_panel_section", "add_listing", "import_listings", "export_listings",
+        "export_bids", "listing_page", "bid", "comment", "listing_comments", "bid_history", "watch",
+        "unwatch", "close", "reopen", "watchlist", "notifications", "mark_notifications_read",
+        "api_listings", "api_listing", "api_bids", "api_comments", "api_watchlist", "api_watchlist_item",
+        "api_category_stats",
+    }
+
+    def setUp(self):
+        # anonymous pages are cached
+        cache.clear()
+        # categories stored in the database are loaded once per process
+        registry.invalidate()
+        registry.all()
+
+    def assertQueries(self, count, url_name, *args, login=True, data=None):
+        if login:
+            self.client.force_login(self.user)
+        else:
+            self.client.logout()
+        with self.assertNumQueries(count):
+            response = self.client.get(reverse(f"auctions:{url_name}", args=args), data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertIn(response.status_code, (200, 302))
+
+    def test_index(self):
+        self.assertQueries(3, "index", login=False)
+        self.assertQueries(5, "index")
+
+    def test_categories(self):
+        # open listing counts and category stats are cached after the first request
+        self.assertQueries(2, "categories", login=False)
+        self.assertQueries(2, "categories")
+
+    def test_category(self):
+        self.assertQueries(2, "listings_in_category", "wands", login=False)
+
+    def test_login_and_register(self):
+        self.assertQueries(0, "login", login=False)
+        self.assertQueries(0, "register", login=False)
+
+    def test_logout(self):
+        # flushing the session deletes it
+        self.assertQueries(4, "logout")
+
+    def test_user_panel(self):
+        # the dashboard is computed on the first visit, then read
+        dashboard_for(self.user)
+        self.assertQueries(3, "user_listings")
+        for section in PANEL_SECTIONS:
+            self.assertQueries(3, "user_panel_section", section)
+
+    def test_add_listing(self):
+        self.assertQueries(2, "add_listing")
+
+    def test_listing_comments(self):
+        # comments with their commenters
+        self.assertQueries(3, "listing_comments", self.listing.id)
+
+    def test_listing_page(self):
+        self.assertQueries(2, "listing_page", self.listing.id, login=False)
+        # ETag, listing, watchlist check and comments with their commenters
+        self.assertQueries(6, "listing_page", self.listing.id)
+
+    def test_watchlist(self):
+        self.assertQueries(3, "watchlist")
+
+    def test_search(self):
+        self.assertQueries(1, "search", login=False, data={"q": "Firebolt"})
+        self.assertQueries(3, "search", data={"q": "Firebolt", "category": Listing.C, "open_only": "on"})
+
+    def test_bid_history(self):
+        # ETag, listing and bids with their bidders
+        self.assertQueries(3, "bid_history", self.listing.id, login=False)
+        self.assertQueries(5, "bid_history", self.listing.id)
+
+    def test_notifications(self):
+        # notifications with their listings and the unread count
+        self.assertQueries(4, "notifications")
+
+        self.client.force_login(self.user)
+        # one UPDATE however many are unread
+        with self.assertNumQueries(3):
+            response = self.client.post(reverse("auctions:mark_notifications_read"))
+        self.assertRedirects(response, reverse("auctions:notifications"), fetch_redirect_response=False)
+
+    def test_import_and_export(self):
+        self.assertQueries(2, "import_listings")
+        # one query however many rows are streamed
+        self.assertQueries(3, "export_listings")
+        self.assertQueries(3, "export_bids")
+
+    def test_api(self):
+        # every GET starts with the lookup its ETag is computed from, except the cached stats
+        self.assertQueries(2, "api_listings", login=False)
+        self.assertQueries(1, "api_category_stats", login=False)
+        self.assertQueries(4, "api_listings")
+        self.assertQueries(5, "api_listing", self.listing.id)
+        # existence check and page, for bids and comments
+        self.assertQueries(5, "api_bids", self.listing.id)
+        self.assertQueries(5, "api_comments", self.listing.id)
+        self.assertQueries(4, "api_watchlist")
+
+    def assertApiWriteQueries(self, count, method, url_name, *args, data=None, status=201):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(
+                reverse(f"auctions:{url_name}", args=args), json.dumps(data or {}), content_type="application/json")
+        self.assertEqual(response.status_code, status, response.content)
+        self.assertEqual(len(without_savepoints(queries)), count, without_savepoints(queries))
+
+    def test_api_writes(self):
+        # the same writes as the HTML site's listing actions
+        self.assertApiWriteQueries(7, "post", "api_bids", self.listing.id, data={"amount": "100"})
+        self.assertApiWriteQueries(6, "post", "api_comments", self.listing.id, data={"comment": "Hi"})
+        self.assertApiWriteQueries(3, "delete", "api_watchlist_item", self.listing.id, status=204)
+        self.assertApiWriteQueries(4, "put", "api_watchlist_item", self.listing.id, status=204)
+
+    def assertActionQueries(self, count, url_name, data=None, listing=None):
+        self.client.force_login(self.user)
+        listing = listing or self.listing
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse(f"auctions:{url_name}", args=[listing.id]), data or {})
+        self.assertRedirects(response, reverse("auctions:listing_page", args=[listing.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(len(without_savepoints(queries)), count, without_savepoints(queries))
+
+    def test_listing_actions(self):
+        # none of them reads what the listing page shows, that is left to the redirect;
+        # bids, comments and closing enqueue their e-mails with one INSERT,
+        # bids update the bidder's dashboard, closing and reopening three sets of dashboards
+        self.assertActionQueries(7, "bid", {"bid_price": "100"})
+        # the comment also touches the listing's updated_at
+        self.assertActionQueries(6, "comment", {"comment": "Hi"})
+        self.assertActionQueries(3, "unwatch")
+        self.assertActionQueries(4, "watch")
+
+        own_listing = Listing.objects.filter(seller=self.user, closed=False).first()
+        self.assertActionQueries(8, "close", listing=own_listing)
+        self.assertActionQueries(6, "reopen", listing=own_listing)
+
+    def test_every_url_is_counted(self):
+        names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(sorted(names - self.counted_urls), [])
+
+
+########################################################
+###########   QUERY PLANS   ############################
+########################################################
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+class ViewQueryPlanTests(QueryPlanAssertions, TestCase):
+    """Every query made by the listing views is answered from an index on a big table"""
+
+    listings = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        sellers = [
+            User.objects.create_user(f"seller{i}", f"seller{i}@example.com", "password")
+            for i in range(10)
+        ]
+        cls.user = sellers[0]
+        categories = [key for key, label in Listing.LISTING_CATEGORY_CHOICES]
+        Listing.objects.bulk_create(
+            (
+                Listing(
+                    seller=sellers[i % len(sellers)],
+                    title=f"Listing {i}",
+                    description="Seeded listing",
+                    current_price=Decimal(i % 500 + 1),
+                    listing_category=categories[i % len(categories)],
+                    closed=i % 3 == 0,
+                    winner=sellers[(i + 1) % len(sellers)] if i % 3 == 0 else None,
+                )
+                for i in range(cls.listings)
+            ),
+        )
+        cls.listing = Listing.objects.exclude(seller=cls.user).filter(closed=False).first()
+        place_bid(cls.listing.id, cls.user, cls.listing.current_price + 1)
+
+        listing_ids = list(Listing.objects.values_list("id", flat=True)[:10_000])
+        UsersWatchlist.objects.bulk_create(
+            UsersWatchlist(watchlist_user=sellers[i % len(sellers)], listing_in_watchlist_id=listing_id)
+            for i, listing_id in enumerate(listing_ids)
+        )
+        Comment.objects.bulk_create(
+            Comment(comments_listing_id=listing_id, commenter=cls.user, comment="Nice")
+            for listing_id in listing_ids
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def view_queries(self, url):
+        """(sql, params, is_feed) of the queries run by the view and of the
+        querysets it hands over to the template"""
+        self.client.force_login(self.user)
+        with mock.patch("auctions.views.render", return_value=HttpResponse()) as render:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+
+        statements = [(query["sql"], (), "ORDER BY" in query["sql"]) for query in queries]
+        request, template, context = render.call_args[0]
+        for value in context.values():
+            if hasattr(value, "query"):
+                statements.append((*value.query.sql_with_params(), True))
+        return statements
+
+    def assertViewUsesIndexes(self, url, sorted_feeds=True):
+        for sql, params, is_feed in self.view_queries(url):
+            # the category registry loads the few database categories whole
+            self.assertNoFullTableScan(sql, params, allowed_scans=["auctions_category"])
+            if is_feed and sorted_feeds:
+                self.assertSortedByIndex(sql, params)
+
+    def test_index(self):
+        self.assertViewUsesIndexes(reverse("auctions:index"))
+
+    def test_category(self):
+        self.assertViewUsesIndexes(reverse("auctions:listings_in_category", args=["wands"]))
+
+    def test_user_panel(self):
+        dashboard_for(self.user)
+        self.assertViewUsesIndexes(reverse("auctions:user_listings"))
+        for section in ["selling", "sold", "won"]:
+            self.assertViewUsesIndexes(reverse("auctions:user_panel_section", args=[section]))
+        # the "bidding" feed sorts the handful of listings found through the bids index
+        self.assertViewUsesIndexes(reverse("auctions:user_panel_section", args=["bidding"]), sorted_feeds=False)
+
+    def test_listing_page(self):
+        self.assertViewUsesIndexes(reverse("auctions:listing_page", args=[self.listing.id]))
+
+    def test_watchlist(self):
+        # sorts only the users own watchlist rows, found through the unique index
+        self.assertViewUsesIndexes(reverse("auctions:watchlist"), sorted_feeds=False)
+
+    def test_older_comments(self):
+        cursor = encode_cursor(datetime.now(dt_timezone.utc), 10 ** 9)
+        url = reverse("auctions:listing_comments", args=[self.listing.id])
+        self.assertViewUsesIndexes(f"{url}?comments_cursor={cursor}")
@@ -1,17 +1,44 @@
-from django.urls import path
+from django.urls import path, register_converter
 
-from . import views
+from . import api, bulk, notifications, views
+from .categories import CategoryConverter
+
+register_converter(CategoryConverter, "category")
 
 app_name="auctions"
 urlpatterns = [
     path("", views.index, name="index"),
     path("categories/", views.categories, name="categories"),
-    path("categories/<slug:category_slug>/", views.category, name="listings_in_category"),
+    path("categories/<category:category>/", views.category, name="listings_in_category"),
+    path("search/", views.search, name="search"),
     path("login/", views.login_view, name="login"),
     path("logout/", views.logout_view, name="logout"),
     path("register/", views.register, name="register"),
     path("user_panel/", views.user_listings, name="user_listings"),
+    path("user_panel/<slug:section>/", views.user_panel_section, name="user_panel_section"),
     path("add_listing/", views.add_listing, name="add_listing"),
+    path("listings/import/", bulk.import_view, name="import_listings"),
+    path("listings/export/", bulk.export_listings, name="export_listings"),
+    path("bids/export/", bulk.export_bids, name="export_bids"),
     path("listings/<int:listing_id>/", views.listing_page, name="listing_page"),
+    path("listings/<int:listing_id>/bid/", views.bid, name="bid"),
+    path("listings/<int:listing_id>/comment/", views.comment, name="comment"),
+    path("listings/<int:listing_id>/comments/", views.listing_comments, name="listing_comments"),
+    path("listings/<int:listing_id>/bids/", views.bid_history, name="bid_history"),
+    path("listings/<int:listing_id>/watch/", views.watch, name="watch"),
+    path("listings/<int:listing_id>/unwatch/", views.unwatch, name="unwatch"),
+    path("listings/<int:listing_id>/close/", views.close, name="close"),
+    path("listings/<int:listing_id>/reopen/", views.reopen, name="reopen"),
     path("watchlist/", views.watchlist, name="watchlist"),
+    path("notifications/", notifications.inbox, name="notifications"),
+    path("notifications/read/", notifications.mark_read, name="mark_notifications_read"),
+
+    # JSON API
+    path("api/v1/listings/", api.listings, name="api_listings"),
+    path("api/v1/listings/<int:listing_id>/", api.listing, name="api_listing"),
+    path("api/v1/listings/<int:listing_id>/bids/", api.bids, name="api_bids"),
+    path("api/v1/listings/<int:listing_id>/comments/", api.comments, name="api_comments"),
+    path("api/v1/watchlist/", api.watchlist, name="api_watchlist"),
+    path("api/v1/watchlist/<int:listing_id>/", api.watchlist_item, name="api_watchlist_item"),
+    path("api/v1/categories/stats/", api.category_stats, name="api_category_stats"),
 ]
@@ -1,16 +1,28 @@
+from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render, redirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
+from django.views.decorators.http import condition, require_POST, require_safe
 
 from django.forms import ModelForm
 from django import forms
 
 from .models import User, Listing, Bid, Comment, UsersWatchlist
+from .analytics import category_stats
+from .bidding import BidRejected, close_auction, now, place_bid, reopen_auction
+from .caching import attach_card_versions, cache_anonymous_page, feed_etag, listing_etag
+from .categories import category_choices, open_listing_counts, registry
+from .dashboard import dashboard_for
+from .pagination import paginate_feed, paginate_ranked
+from .routers import replica_reads
+from .search import search_listings
 
-from slugify import slugify
+
+COMMENTS_PER_PAGE = 20
+BIDS_PER_PAGE = 50
 
 
 ########################################################
@@ -18,6 +30,14 @@ from slugify import slugify
 ########################################################
 
 class ListingForm(ModelForm):
+  listing_category = forms.ChoiceField(choices=category_choices, initial=Listing.B)
+  # optional, without an end time the auction runs until the seller closes it
+  end_time = forms.DateTimeField(
+    required=False,
+    input_formats=["%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M"],
+    widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}, format="%Y-%m-%dT%H:%M"),
+  )
+
   class Meta:
     model = Listing
     fields = [
@@ -26,8 +46,27 @@ class ListingForm(ModelForm):
         'description', 
         'listing_category', 
         'image_url',
+        'end_time',
     ]
 
+  def clean_end_time(self):
+    end_time = self.cleaned_data["end_time"]
+    if end_time is not None and end_time <= now():
+      raise forms.ValidationError("The auction has to end in the future")
+    return end_time
+
+
+def search_category_choices():
+    return [("", "All categories")] + category_choices()
+
+
+class SearchForm(forms.Form):
+  q = forms.CharField(label="Search", max_length=200, required=False)
+  category = forms.ChoiceField(choices=search_category_choices, required=False)
+  min_price = forms.DecimalField(min_value=0, decimal_places=2, required=False)
+  max_price = forms.DecimalField(min_value=0, decimal_places=2, required=False)
+  open_only = forms.BooleanField(label="Open auctions only", required=False)
+
 
 class BidForm(ModelForm):
   class Meta:
@@ -49,10 +88,26 @@ class CommentForm(ModelForm):
 ########################################################
 
 
+def listing_cards():
+    """Listings with everything a listing card renders loaded in the same query"""
+    return Listing.objects.select_related("seller")
+
+
+def card_feed(request, queryset, cursor_param="cursor"):
+    """One page of listing cards, with the versions their cached fragments are stored under"""
+    page = paginate_feed(request, queryset, cursor_param)
+    attach_card_versions(page.items)
+    return page
+
+
+@replica_reads()
+@cache_anonymous_page("index")
+@condition(etag_func=feed_etag(lambda request: Listing.objects.all()))
 def index(request):
     
-    open_listings = Listing.objects.filter(closed=False).order_by("-publication_date").all()
-    closed_listings = Listing.objects.filter(closed=True).order_by("-publication_date").all()
+    # both feeds are paged independently, newest first
+    open_listings = card_feed(request, listing_cards().filter(closed=False))
+    closed_listings = card_feed(request, listing_cards().filter(closed=True), "closed_cursor")
     
     return render(request, "auctions/index.html", {
         "listings": open_listings,
@@ -116,72 +171,103 @@ def register(request):
 ########################################################
 
 
+@replica_reads()
+@cache_anonymous_page("categories")
 def categories(request):
-    categories = Listing.LISTING_CATEGORY_CHOICES
-    
-    ## Creates a list with category name and associated slug 
-    # to handle correct url path
-    cats = []
-    for cat in categories:
-        #print(f'cat in categories: {cat}')
-        cats.append((cat[1], slugify(cat[1])))
-    #print(cats)
+    ## Every category with the number of its open listings and the stats of its closed ones
+    open_counts = open_listing_counts()
+    stats = category_stats()
+    cats = [(category, open_counts.get(category.key, 0), stats.get(category.key)) for category in registry.all()]
     return render(request, "auctions/categories.html", {"categories":cats})
 
-def category(request, category_slug):
-    categories_list = Listing.LISTING_CATEGORY_CHOICES
-    
-    ## Creates a list with listing_category key, name and slug
-    categories_in_tuple = []
-    for cat in categories_list:
-        #print(f'cat in categories: {cat}')
-        categories_in_tuple.append((cat[0], cat[1], slugify(cat[1])))
-    #print(categories_in_tuple)
-    
-    ## Matches the slug with the key
-    for cat_tuple in categories_in_tuple:
-        if category_slug == cat_tuple[2]:
-            found_cat = cat_tuple[0]
-            sub_title = cat_tuple[1]
-            break
-    
-    ## Selects all listings with found key
-    listings_in_category = Listing.objects.filter(listing_category=found_cat).all()
+@replica_reads()
+@cache_anonymous_page("category")
+@condition(etag_func=feed_etag(
+    lambda request, category: Listing.objects.filter(listing_category=category.key)))
+def category(request, category):
+    ## category is already looked up from the slug by the URL converter
+    listings_in_category = card_feed(request, listing_cards().filter(listing_category=category.key))
 
     return render(request, "auctions/category.html", {
         "listings": listings_in_category,
-        "category": sub_title,
+        "category": category.label,
+    })
+
+
+
+### Searches listing titles and descriptions, best matches first
+@cache_anonymous_page("search")
+def search(request):
+    form = SearchForm(request.GET or None)
+    results = None
+
+    if form.is_valid() and form.cleaned_data["q"]:
+        filters = form.cleaned_data
+        listings = listing_cards()
+        if filters["category"]:
+            listings = listings.filter(listing_category=filters["category"])
+        if filters["min_price"] is not None:
+            listings = listings.filter(current_price__gte=filters["min_price"])
+        if filters["max_price"] is not None:
+            listings = listings.filter(current_price__lte=filters["max_price"])
+        if filters["open_only"]:
+            listings = listings.filter(closed=False)
+
+        results = paginate_ranked(request, search_listings(filters["q"], listings))
+        attach_card_versions(results.items)
+
+    return render(request, "auctions/search.html", {
+        "form": form,
+        "results": results,
     })
 
 
 
 ### Displays all users listing + there is a button to add a listing
 
+# sections of the user panel: (title, listings of the user, text when there are none)
+PANEL_SECTIONS = {
+    "selling": ("Selling", lambda user: listing_cards().filter(closed=False, seller=user),
+                "You have not created any auctions yet."),
+    "sold": ("Sold", lambda user: listing_cards().filter(closed=True, seller=user),
+             "You have not sold any listings yet."),
+    # bids are looked up by (bidder, listing) index, no join and no DISTINCT needed
+    "bidding": ("Bidding", lambda user: listing_cards().filter(
+                    closed=False, pk__in=Bid.objects.filter(bidder=user).values("listing")),
+                "You have not made any bids yet"),
+    "won": ("Won", lambda user: listing_cards().filter(closed=True, winner=user),
+            "No auctions won yet."),
+}
+
+
 @login_required(login_url="auctions:login")
 def user_listings(request):
-    """User Listings view: shows all listings that user:
+    """User Listings view: shows the user's totals and the listings that user:
         * is currently selling
         * sold
         * is currently bidding
         * won
+    The listings are loaded by the page from user_panel_section, a page at a time.
     """
+    return render(request, "auctions/user_panel.html", {
+        "dashboard": dashboard_for(request.user),
+        "sections": [(name, title) for name, (title, _, _) in PANEL_SECTIONS.items()],
+    })
 
-    # get all listings that user has created
-    user_listings = Listing.objects.filter(closed=False, seller=request.user.id).order_by("-publication_date").all()
 
-    # get all listings sold by user
-    sold_listings = Listing.objects.filter(closed=True, seller=request.user.id).order_by("-publication_date").all()
-    # get all listings where user is currently bidding
-    # listing.bids.bidder == request.user
-    bidding_on_listing = Listing.objects.filter(closed=False, bids__bidder=request.user.id).distinct()
-    # get all listings won by user
-    won = Listing.objects.filter(closed=True, winner=request.user.id).order_by("-publication_date").all()
-    
-    return render(request, "auctions/user_panel.html", {
-        "selling": user_listings,
-        "sold": sold_listings,
-        "bidding": bidding_on_listing,
-        "won": won,
+### One page of a user panel section, the panel appends it in place of its "more" link
+@require_safe
+@login_required(login_url="auctions:login")
+def user_panel_section(request, section):
+    if section not in PANEL_SECTIONS:
+        raise Http404("No such section")
+    _, listings, empty_message = PANEL_SECTIONS[section]
+    page = card_feed(request, listings(request.user))
+    if page.has_next:
+        page.next_url = reverse("auctions:user_panel_section", args=[section]) + page.next_url
+    return render(request, "auctions/partials/panel_section.html", {
+        "listings": page,
+        "empty_message": "" if "cursor" in request.GET else empty_message,
     })
 
 
@@ -195,7 +281,7 @@ def add_listing(request):
     
     if request.method == "POST":
         form = ListingForm(request.POST)
-        seller = User.objects.get(pk=request.user.id)
+        seller = request.user
         if form.is_valid():
             # Get all data from the form and assign into variables
 
@@ -221,220 +307,191 @@ def add_listing(request):
 ### Defines what user can see on a listing detail page
 #   Like add listing to a watchlist, bid and comment if user is logged in
 #   If user is not logged in only basic listing info is displayed
+#   The forms on the page post to the action views below, which redirect back here
 
+# logged in users see their own bids and watchlist on it
+@replica_reads(anonymous_only=True)
+@cache_anonymous_page("listing_page")
+@require_safe
+@condition(etag_func=listing_etag)
 def listing_page(request, listing_id):
-    #print(f'listing_id coming from function arguments {listing_id}')
-    listing_to_render = Listing.objects.get(pk=listing_id)
+    # bid status is stored on the listing, so one query covers the whole header
+    listings = Listing.objects.select_related("seller", "highest_bidder")
+    listing = get_object_or_404(listings, pk=listing_id)
 
-    #print(f'this is the request.user.id {request.user.id}')
-    
-    bid_form = BidForm()
-    comment_form = CommentForm()
-    
+    if not request.user.is_authenticated:
+        return render(request, "auctions/listing_page.html", {
+            "listing": listing,
+            "bids_count": listing.bid_count,
+            "bids_message": None,
+        })
 
-    ######  Helpers ########################################
-
-    def check_on_watchlist():
-        user = User.objects.get(id=request.user.id)
-        ### handle on_watchlist variable
-        watchlist_item = UsersWatchlist.objects.filter(
-            watchlist_user = user,
-            listing_in_watchlist = listing_id
-            ).first()
-            
-        if watchlist_item is not None:
-            on_watchlist = True
-        else:
-            on_watchlist = False
-        
-        return on_watchlist
-
-    ######################################################
-    ### Handles extra features if user is logged in
-    ### returns listing page with bid form and on_watchlist if user is authenticated
-    if request.user.is_authenticated:
-        
-        user = request.user
-        #print(f'User of request.post is {user}')
-
-        listing = listing_to_render
-        #print(f'Listing that is going to be added to watchlist: {listing.id}')
-
-        
-        message = None
-        
-
-        ### add or delete listing from a watchlist
-            # if the watchlist forms button click returned on_watchlist value=True
-            # delete the item from the watchlist and set on_watchlist == False
-        if "watchlist-form" in request.POST:
-            
-                # if listing removed from watchlist, 
-                # delete the listing from watchlist 
-            if "remove_from_watchlist" in request.POST:
-                # delete the listing from the watchlist
-                watchlist_listing = UsersWatchlist.objects.get(
-                    watchlist_user = user,
-                    listing_in_watchlist = listing
-                )
-                watchlist_listing.delete()
-                
-                # if the button returns on_watchlist value as False
-                # create a new UserWatchlist instance
-            if "add_to_watchlist" in request.POST:
-                
-                item_to_watchlist = UsersWatchlist(
-                    watchlist_user=user,
-                    listing_in_watchlist=listing
-                )
-                item_to_watchlist.save()
-
-
-        ### closing and opening an auction (for the owner of a listing only)
-            # checking for user == seller done on template side
-            # close button not visible if user != seller
-        if "close-form" in request.POST:
-            
-                # if listing is closed, 
-                # change listing.closed to True 
-            if "close_auction" in request.POST:
-                # close the auction
-                listing.closed = True
-                if listing.bids.all().order_by('-bid_price').first() is not None:
-                    highest_bid = highest_bid = listing.bids.all().order_by('-bid_price').first()
-                    highest_bidder = highest_bid.bidder
-                    listing.winner = highest_bidder
-                    
-                else:
-                    highest_bidder = None
-                listing.save()
-
-                # if listing is opened
-                # change listing.close to False
-            if "open_auction" in request.POST:
-                listing.closed = False
-                if listing.winner is not None:
-                    listing.winner = None
-                listing.save()
-        
-
-        ### Handle commenting
-            # save the comment form data into a Comment model
-            # redirect back to listing page
-        if "comment-form" in request.POST:
-            form = CommentForm(request.POST)
-            if form.is_valid():
-                comment = str(form.cleaned_data["comment"])
-                
-                new_comment = Comment()
-                new_comment.comments_listing = listing
-                new_comment.commenter = user
-                new_comment.comment = comment
-                new_comment.save()
-
-        ### Perform the bidding (is user != seller)
-            # save the form data into BidForm instance and 
-            # redirect to listing_detail with listing_id
-        if "bid-form" in request.POST:
-            form = BidForm(request.POST)
-            
-            if form.is_valid():
-                bid_price = float(form.cleaned_data["bid_price"])
-                #listing_id = request.POST.get("listing_id")
-                listing = listing_to_render
-                user = user
-
-                # don't allow for negative prices
-                if bid_price <= 0 or bid_price <= listing.current_price:
-                    #print(f'bid_price: {bid_price} <= listing.current_price: {listing.current_price}')
-                    message = "Bid cannot be negative and bid has to be more than current price"
-
-                # filter listing.bids and order by bid_price
-                highest_bid = listing.bids.all().order_by('-bid_price').first()
-                #print(f'highest bid: {highest_bid}')
-                # save bid_price
-                if highest_bid is None or bid_price > highest_bid.bid_price:
-                    # save the bid to listing.bids
-                    new_bid = Bid(bidder=user, bid_price=bid_price)
-                    new_bid.save()
-                    # add the new bid to bids of a listing
-                    listing.bids.add(new_bid)
-                    # update the current price of a listing
-                    listing.current_price = bid_price
-                    listing.save()
-                    message = "You've successfully made the highest bid"
-
-        ### handle highest bidder messages
-        highest_bid = listing.bids.all().order_by('-bid_price').first()
-        #print(f'highest bid: {highest_bid}')
-        if highest_bid is not None:
-            highest_bidder = highest_bid.bidder
-            #print(f'highest bidder >> {highest_bidder}')
-        else:
-            highest_bidder = None
-            #print(f'highest bidder >> {highest_bidder}')
-        
-        if highest_bidder is not None:
-            if highest_bidder.id == request.user.id:
-                bids_message = "Your bid is the highest bid"
-            else:
-                bids_message = "Highest bid made by " + highest_bidder.username
-        else:
-            bids_message = None
+    ### handle highest bidder messages
+    highest_bidder = listing.highest_bidder
+    if listing.closed and listing.winner_id == request.user.id:
+        bids_message = "You have won the auction!"
+    elif highest_bidder is None:
+        bids_message = None
+    elif highest_bidder.id == request.user.id:
+        bids_message = "Your bid is the highest bid"
+    else:
+        bids_message = "Highest bid made by " + highest_bidder.username
 
+    comments = comment_page(request, listing.id)
 
-        ### handle winner announcement
-        if listing.closed == True and request.user == listing.winner:
-            bids_message = "You have won the auction!"
+    on_watchlist = UsersWatchlist.objects.filter(
+        watchlist_user=request.user,
+        listing_in_watchlist=listing,
+    ).exists()
 
+    return render(request, "auctions/listing_page.html", {
+        "listing": listing,
+        "bid_form": BidForm(),
+        "on_watchlist": on_watchlist,
+        "bids_count": listing.bid_count,
+        "bids_message": bids_message,
+        "comment_form": CommentForm(),
+        "comments": comments,
+    })
 
-        ### handle comments on a listing page
-        if Comment.objects.filter(comments_listing=listing) is not None:
-            comments = Comment.objects.filter(comments_listing=listing)
-        else:
-            comments = None
 
-        on_watchlist = check_on_watchlist() ### need user auth
-        bids_count = listing_to_render.bids.count()
-        #print(f' >>  Bids count: {bids_count}')
+def comment_page(request, listing_id):
+    """One page of a listing's comments, newest first, with their commenters joined in"""
+    comments = Comment.objects.filter(comments_listing_id=listing_id).select_related("commenter")
+    page = paginate_feed(request, comments, "comments_cursor", per_page=COMMENTS_PER_PAGE, date_field="comment_date")
+    # older pages are loaded into the listing page from listing_comments
+    if page.has_next:
+        page.next_url = reverse("auctions:listing_comments", args=[listing_id]) + page.next_url
+    return page
 
-        context = {
-            "listing": listing,
-            "bid_form": bid_form,
-            "on_watchlist": on_watchlist,
-            "bids_count": bids_count,
-            "bids_message": bids_message,
-            "message": message,
-            "comment_form": comment_form,
-            "comments": comments,
-            }
-        
-        return render(request, "auctions/listing_page.html", context)
-        
-    # count the bids made to a listing
-    bids_count = listing_to_render.bids.count()
-    bids_message = None
 
-    return render(request, "auctions/listing_page.html", {
-        "listing": listing_to_render,
-        "bids_count": bids_count,
-        "bids_message": bids_message,
+### Older comments of a listing, the listing page appends them below the first page
+@require_safe
+@login_required(login_url="auctions:login")
+def listing_comments(request, listing_id):
+    return render(request, "auctions/partials/comment_list.html", {
+        "comments": comment_page(request, listing_id),
     })
 
 
+### Bid history of a listing, newest first, a page at a time
+@replica_reads()
+@require_safe
+@condition(etag_func=listing_etag)
+def bid_history(request, listing_id):
+    listing = get_object_or_404(Listing.objects.only("title", "closed", "bid_count"), pk=listing_id)
+    bids = paginate_feed(
+        request,
+        Bid.objects.filter(listing_id=listing_id).select_related("bidder"),
+        per_page=BIDS_PER_PAGE,
+        date_field="bid_date",
+    )
+    return render(request, "auctions/bid_history.html", {
+        "listing": listing,
+        "bids": bids,
+    })
+
+
+########################################################
+###########   LISTING ACTIONS   ########################
+########################################################
+# Each action does its write, leaves a message and redirects back to the
+# listing page (post/redirect/get), so reloading the page never posts again.
+
+
+def back_to_listing(listing_id):
+    return redirect("auctions:listing_page", listing_id=listing_id)
+
+
+@require_POST
+@login_required(login_url="auctions:login")
+def bid(request, listing_id):
+    ### the bid service checks and updates the price in one transaction
+    form = BidForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, "Bid has to be a number")
+        return back_to_listing(listing_id)
+    try:
+        place_bid(listing_id, request.user, form.cleaned_data["bid_price"])
+    except BidRejected as rejection:
+        messages.error(request, str(rejection))
+    else:
+        messages.success(request, "You've successfully made the highest bid")
+    return back_to_listing(listing_id)
+
+
+@require_POST
+@login_required(login_url="auctions:login")
+def comment(request, listing_id):
+    listing = get_object_or_404(Listing.objects.only("closed"), pk=listing_id)
+    form = CommentForm(request.POST)
+    if listing.closed:
+        messages.error(request, "This auction has been closed")
+    elif form.is_valid():
+        Comment.objects.create(
+            comments_listing=listing,
+            commenter=request.user,
+            comment=form.cleaned_data["comment"],
+        )
+    else:
+        messages.error(request, "Comment cannot be empty")
+    return back_to_listing(listing_id)
+
+
+@require_POST
+@login_required(login_url="auctions:login")
+def watch(request, listing_id):
+    listing = get_object_or_404(Listing.objects.only("seller_id"), pk=listing_id)
+    if listing.seller_id == request.user.id:
+        messages.error(request, "You cannot watch your own auction")
+    else:
+        # the (user, listing) pair is unique, watching twice is a no-op
+        UsersWatchlist.objects.bulk_create(
+            [UsersWatchlist(watchlist_user=request.user, listing_in_watchlist=listing)],
+            ignore_conflicts=True,
+        )
+    return back_to_listing(listing_id)
+
+
+@require_POST
+@login_required(login_url="auctions:login")
+def unwatch(request, listing_id):
+    UsersWatchlist.objects.filter(
+        watchlist_user=request.user,
+        listing_in_watchlist_id=listing_id,
+    ).delete()
+    return back_to_listing(listing_id)
+
+
+@require_POST
+@login_required(login_url="auctions:login")
+def close(request, listing_id):
+    ### only the seller can close, the highest bidder becomes the winner
+    if close_auction(listing_id, seller=request.user):
+        messages.success(request, "The auction has been closed")
+    else:
+        messages.error(request, "Only the seller can close an open auction")
+    return back_to_listing(listing_id)
+
+
+@require_POST
+@login_required(login_url="auctions:login")
+def reopen(request, listing_id):
+    if reopen_auction(listing_id, seller=request.user):
+        messages.success(request, "The auction has been opened again")
+    else:
+        messages.error(request, "Only the seller can open a closed auction")
+    return back_to_listing(listing_id)
+
+
 @login_required(login_url="auctions:login")
+@replica_reads()
 def watchlist(request):
     ### Then we handle the opening the watchlist page
 
-    # getting the User models user id of the requests user
-    watchlist_listings_ids = User.objects.get(id=request.user.id).watchlist.values_list("listing_in_watchlist", flat=True)
-    #print(f'watchlist_listings_ids: {watchlist_listings_ids}')
-    watchlist_items = []
-    for id in watchlist_listings_ids:
-        #print(f'IDs in watchlist_listings_ids (for loop): {id}')
-        listing_to_watchlist = Listing.objects.get(id=id)
-        watchlist_items.append(listing_to_watchlist)
-        #print(f'watchlist_items after filtering Listing objects with the id: {watchlist_items}')
+    # listings are joined with the users watchlist rows, one query per page
+    watchlist_items = card_feed(
+        request, listing_cards().filter(watchlist__watchlist_user=request.user))
     return render(request, "auctions/watchlist.html", {
         "watchlist_items": watchlist_items,
     })
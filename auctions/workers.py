@@ -0,0 +1,17 @@
+"""
+    Entry points of the run_tasks process pool.
+
+    Pool processes are spawned and import this module before Django is set up,
+    so it must not import models at the top.
+"""
+import django
+
+
+def start():
+    """ProcessPoolExecutor initializer"""
+    django.setup()
+
+
+def run(name, payload):
+    from .taskqueue import run
+    return run(name, payload)
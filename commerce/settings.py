@@ -41,7 +41,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so that its total covers the other middleware
+    'auctions.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'auctions.routers.PrimaryPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,7 +57,8 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render times to RequestMetricsMiddleware
+        'BACKEND': 'auctions.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,15 +78,191 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# DATABASE_BACKEND picks one of the configurations below, the DATABASE_* variables fill it in.
+# CONN_MAX_AGE keeps a connection open for that many seconds, across requests.
+# CONN_HEALTH_CHECKS (auctions.database) replaces a kept connection that stopped working.
+# SQLITE_MODE "tuned" (WAL and friends, see auctions.database) lets pages be read
+# while a bid is written, "default" keeps SQLite's own settings.
+# Behind PgBouncer in transaction pooling mode, set DATABASE_PGBOUNCER=1.
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'sqlite')
+
+DATABASE_BACKENDS = {
+    'sqlite': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'NAME': os.environ.get('DATABASE_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 0)),
+        'SQLITE_MODE': os.environ.get('SQLITE_MODE', 'tuned'),
+    },
+    'postgres': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DATABASE_NAME', 'commerce'),
+        'USER': os.environ.get('DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', ''),
+        'PORT': os.environ.get('DATABASE_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        # server-side cursors don't survive transaction pooling
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_PGBOUNCER') == '1',
+        'OPTIONS': {
+            'connect_timeout': 5,
+        },
+    },
 }
 
+DATABASES = {
+    'default': DATABASE_BACKENDS[DATABASE_BACKEND],
+}
+
+# Read replicas (auctions.routers)
+# DATABASE_REPLICAS lists replica locations, comma separated: SQLite files or
+# Postgres hosts, with the primary's other settings. Browse pages read from a
+# random replica, clients that wrote something read from the primary for
+# REPLICA_PIN_SECONDS afterwards so they see their own changes.
+# SQLite replicas are copies, refreshed with `manage.py sync_sqlite_replicas`.
+REPLICA_DATABASES = []
+
+for number, location in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = dict(
+        DATABASES['default'],
+        **{'HOST' if DATABASE_BACKEND == 'postgres' else 'NAME': location},
+        TEST={'MIRROR': 'default'},
+    )
+    REPLICA_DATABASES.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['auctions.routers.ReplicaRouter']
+
+REPLICA_PIN_SECONDS = 5
+
 AUTH_USER_MODEL = 'auctions.User'
 
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# CACHE_BACKEND picks one of the configurations below, CACHE_LOCATION overrides its location.
+# "locmem" is per process, "file" is shared by the workers of one host and
+# "redis" (needs the redis package) is shared by all hosts.
+# Caches hold a fragment and a version key per listing card,
+# the default limit of 300 entries would evict cards of a single page.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+    'redis': {
+        'BACKEND': 'auctions.cache_backends.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://localhost:6379/0'),
+        'OPTIONS': {
+            # "fakeredis.FakeRedis" runs without a Redis server
+            'CLIENT_CLASS': os.environ.get('CACHE_REDIS_CLIENT', 'redis.Redis'),
+        },
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
+}
+
+# Seconds that pages rendered for anonymous visitors are cached, per view.
+# Logged in users always get a freshly rendered page.
+ANONYMOUS_CACHE_TIMEOUTS = {
+    'index': 30,
+    'categories': 300,
+    'category': 60,
+    'listing_page': 15,
+    'search': 30,
+}
+
+# Real-time listing updates (ws://<host>/ws/listings/<id>/, served by commerce.asgi)
+# REALTIME_BROKER picks how bid events reach the WebSocket connections:
+# "inprocess" only reaches the connections of the publishing worker,
+# "redis" (needs the redis package) relays them to all workers through pub/sub.
+REALTIME_BROKER_BACKENDS = {
+    'inprocess': {
+        'BACKEND': 'auctions.realtime.InProcessBroker',
+    },
+    'redis': {
+        'BACKEND': 'auctions.realtime.RedisBroker',
+        'URL': os.environ.get('REALTIME_REDIS_URL', 'redis://localhost:6379/1'),
+        # "fakeredis.FakeRedis" runs without a Redis server
+        'CLIENT_CLASS': os.environ.get('REALTIME_REDIS_CLIENT', 'redis.Redis'),
+    },
+}
+
+REALTIME_BROKER = REALTIME_BROKER_BACKENDS[os.environ.get('REALTIME_BROKER', 'inprocess')]
+
+# Auction ends (auctions.bidding)
+# A bid in the last AUCTION_SNIPING_WINDOW seconds of an auction moves its end
+# to that many seconds after the bid, 0 turns the extension off.
+AUCTION_SNIPING_WINDOW = 300
+
+# Background tasks (auctions.taskqueue), run by `manage.py run_tasks`
+# EAGER runs tasks right away in the process that enqueues them, for tests and
+# development without a worker. Failed tasks are retried after RETRY_DELAY
+# seconds, doubled after every attempt, MAX_ATTEMPTS times in all. Tasks of a
+# worker that stopped responding are taken over after STALE_AFTER seconds.
+TASK_QUEUE = {
+    'EAGER': os.environ.get('TASK_QUEUE_EAGER') == '1',
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+    'STALE_AFTER': 300,
+}
+
+# Notifications (auctions.notifications) are e-mailed in one digest per user
+# every BATCH_WINDOW seconds, 0 e-mails them as soon as they are created.
+# Eager tasks run the delivery right away, which leaves nothing to batch.
+NOTIFICATIONS = {
+    'BATCH_WINDOW': 0 if TASK_QUEUE['EAGER'] else int(os.environ.get('NOTIFICATION_BATCH_WINDOW', 60)),
+}
+
+# E-mails sent by the background tasks, printed to the console unless configured
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'auctions@localhost')
+
+# Request instrumentation (auctions.instrumentation)
+# SAMPLE_RATE is the share of requests (0 to 1) whose queries and timings are
+# measured, reported in Server-Timing headers, logged to "auctions.metrics"
+# and totalled for /metrics/. 0 takes the middleware out of the stack.
+REQUEST_METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 0)),
+    'SERVER_TIMING': True,
+}
+
+# Addresses allowed to scrape /metrics/
+INTERNAL_IPS = os.environ.get('INTERNAL_IPS', '127.0.0.1').split(',')
+
+# `manage.py test` skips the benchmarks, `manage.py test --tag benchmark` runs them
+TEST_RUNNER = 'auctions.test_runner.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'auctions.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 